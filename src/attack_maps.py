@@ -0,0 +1,318 @@
+import numpy as np
+from moves import move_plans, pawn_move_plans
+from legal_moves import pawn_types, line_types, piece_by_value, royal_values
+
+side_index = { 'l': 0, 'd': 1 } # Index of a color in the attack map arrays
+
+
+class AttackMaps:
+    """
+    Squares attacked by each player on every board of a 5D chessboard, kept up to date as boards
+    are added, changed and rolled back.
+
+    Pieces on the last boards of timelines attack. An attack map counts, for every square of every
+    board, the pieces attacking it. There is one map per attacking player and per turn of the board
+    the attackers stand on, so that both the opponent's playable boards and all timeline heads can
+    be asked about. Line pieces attack up to and including the first piece in their way, pawns and
+    brawns attack only where they capture, other pieces attack every square they could move to.
+
+    Changes are collected from the multiverse (see Chessboard_5D.add_board_listener) and applied on
+    the next query: pieces of boards that became or stopped being heads are added or removed, and
+    only pieces that looked at a changed location are walked again.
+    """
+    def __init__(self, chess5, capacity=64):
+        """
+        Create a new instance of class
+
+        Args:
+            chess5 (Chessboard_5D): the multiverse to follow. Attack maps register as its board listener.
+            capacity (int): number of boards to allocate the maps for, grows when needed. Defaults to 64.
+        """
+        self.chess5 = chess5
+        n = chess5.chessboard_size
+        self.n = n
+        # Attack counts, indexed by 2 * attacker side + turn of the attacker's board, board id, x, y
+        self.maps = np.zeros((4, max(capacity, 1), n, n), dtype=np.int16)
+        self.sources = {} # (board id, x, y) of an attacking piece -> (map index, flat indices of attacked squares, watched locations)
+        self.board_sources = {} # board id -> set of (board id, x, y) of its attacking pieces
+        self.watchers = {} # (time, mult) -> set of (board id, x, y) of pieces whose attacks depend on the board there
+        self.royals = {} # (time, mult) -> { color: list of (x, y) of royal pieces }
+        self.head_ids = set() # ids of the boards whose pieces are in sources
+        self.num_known_boards = 0 # number of boards when the maps were last updated
+        self.dirty = set() # (time, mult) of boards added, changed or removed since the last update
+        self.deltas = tuple([] for i in range(8)) # per map index: flat indices, then +1/-1, of pending count changes
+        for time, mult in chess5.tm_index:
+            self.dirty.add((time, mult))
+        chess5.add_board_listener(self)
+
+    def close(self):
+        """Stops following the multiverse"""
+        self.chess5.remove_board_listener(self)
+
+    # Board listener
+
+    def on_board_change(self, time, mult):
+        """A board was added at (time, mult), or its pieces changed"""
+        self.dirty.add((int(time), int(mult)))
+
+    def on_boards_removed(self, num_boards, locations):
+        """
+        Boards from id num_boards on were removed by rollback. Pieces on them are dropped now,
+        since their ids will be given to new boards.
+        """
+        for time, mult in locations:
+            self.dirty.add((int(time), int(mult)))
+        for id in range(num_boards, self.num_known_boards):
+            if id in self.head_ids:
+                self.remove_board_sources(id)
+                self.head_ids.discard(id)
+        self.num_known_boards = min(self.num_known_boards, num_boards)
+
+    # Updates
+
+    def update(self):
+        """
+        Applies the changes of the multiverse since the last update to the attack maps
+        """
+        chess5 = self.chess5
+        tm_index = chess5.tm_index
+        head_ids = { tm_index[(time, mult)] for mult, time in chess5.timeline_heads.items() }
+        if (not self.dirty) and (head_ids == self.head_ids):
+            return
+        num_boards = len(chess5.chessboards)
+        if num_boards > self.maps.shape[1]:
+            self.grow(num_boards)
+
+        stale = set() # Pieces that looked at a changed location
+        changed_ids = set()
+        for location in self.dirty:
+            stale.update(self.watchers.get(location, ()))
+            id = tm_index.get(location)
+            if id is not None:
+                changed_ids.add(id)
+            self.update_royals(location, id)
+
+        fresh = set() # Pieces walked again in this update
+        for id in self.head_ids - head_ids:
+            self.remove_board_sources(id)
+        for id in head_ids:
+            if (id in changed_ids) or (id not in self.head_ids):
+                self.remove_board_sources(id)
+                fresh.update(self.add_board_sources(id))
+        for key in stale - fresh:
+            if key in self.sources:
+                self.remove_source(key)
+                self.add_source(key)
+
+        self.apply_deltas()
+        self.head_ids = head_ids
+        self.num_known_boards = num_boards
+        self.dirty.clear()
+
+    def grow(self, num_boards):
+        """Reallocates the maps for at least num_boards boards"""
+        capacity = max(num_boards, 2 * self.maps.shape[1])
+        maps = np.zeros((4, capacity, self.n, self.n), dtype=np.int16)
+        maps[:, :self.maps.shape[1]] = self.maps
+        self.maps = maps
+
+    def apply_deltas(self):
+        """Adds the pending count changes to the maps"""
+        for k, (indices, signs) in enumerate(zip(self.deltas[0::2], self.deltas[1::2])):
+            if indices:
+                np.add.at(self.maps[k].reshape(-1), np.array(indices, dtype=np.intp), np.array(signs, dtype=np.int16))
+                indices.clear()
+                signs.clear()
+
+    def update_royals(self, location, id):
+        """Finds royal pieces on the board at a location, or forgets the location if it has no board"""
+        if id is None:
+            self.royals.pop(location, None)
+            return
+        matrix = self.chess5.chessboards[id].chessboard_matrix
+        squares = { 'l': [], 'd': [] }
+        for x, y in zip(*np.nonzero(np.isin(matrix, royal_values))):
+            squares[piece_by_value[int(matrix[x, y])][1]].append((int(x), int(y)))
+        self.royals[location] = squares
+
+    def add_board_sources(self, id):
+        """
+        Adds the attacks of all pieces of a board
+
+        Returns:
+            list: keys of the added pieces
+        """
+        matrix = self.chess5.chessboards[id].chessboard_matrix
+        keys = []
+        for x, y in zip(*np.nonzero(matrix)):
+            if piece_by_value[int(matrix[x, y])][0] in ('', 'M'): # Move markers are not pieces
+                continue
+            key = (id, int(x), int(y))
+            self.add_source(key)
+            keys.append(key)
+        self.board_sources[id] = set(keys)
+        return keys
+
+    def remove_board_sources(self, id):
+        """Removes the attacks of all pieces of a board"""
+        for key in self.board_sources.pop(id, ()):
+            self.remove_source(key)
+
+    def add_source(self, key):
+        """Finds the squares attacked by a piece and adds them to the maps"""
+        chess5 = self.chess5
+        id, x, y = key
+        time, mult = int(chess5.timemult_coords[id][0]), int(chess5.timemult_coords[id][1])
+        piece = piece_by_value[int(chess5.chessboards[id].chessboard_matrix.item(x, y))]
+        k = 2 * side_index[piece[1]] + side_index[chess5.get_board_color(time)]
+        indices, watched = self.find_attacks(piece[0], piece[1], (x, y, time, mult))
+        self.sources[key] = (k, indices, watched)
+        for location in watched:
+            self.watchers.setdefault(location, set()).add(key)
+        self.deltas[2 * k].extend(indices)
+        self.deltas[2 * k + 1].extend([1] * len(indices))
+
+    def remove_source(self, key):
+        """Removes the squares attacked by a piece from the maps"""
+        k, indices, watched = self.sources.pop(key)
+        for location in watched:
+            watchers = self.watchers[location]
+            watchers.discard(key)
+            if not watchers:
+                del self.watchers[location]
+        self.deltas[2 * k].extend(indices)
+        self.deltas[2 * k + 1].extend([-1] * len(indices))
+
+    def find_attacks(self, piece_type, color, origin):
+        """
+        Walks the attacks of a piece, in the same way as Moves.iter_board_moves
+
+        Args:
+            piece_type (str): first letter of the piece acronym
+            color (str): color of the piece ('l' or 'd')
+            origin (tuple): integer 4d vector of the piece
+
+        Returns:
+            tuple: (list of flat map indices of attacked squares, set of (time, mult) of boards looked at)
+        """
+        chess5 = self.chess5
+        tm_index, chessboards, n = chess5.tm_index, chess5.chessboards, self.n
+        x, y, time, mult = origin
+        indices = []
+        watched = set()
+        if piece_type in line_types:
+            for (dt, dm), xys in move_plans[piece_type]:
+                rays = xys # Rays that are not blocked yet
+                step = 1
+                while rays:
+                    location = (time + step * dt, mult + step * dm)
+                    watched.add(location)
+                    id = tm_index.get(location)
+                    if id is None:
+                        break
+                    matrix = chessboards[id].chessboard_matrix
+                    offset = id * n * n
+                    open_rays = []
+                    for dx, dy in rays:
+                        x2, y2 = x + step * dx, y + step * dy
+                        if (0 <= x2 < n) and (0 <= y2 < n):
+                            indices.append(offset + x2 * n + y2)
+                            if matrix.item(x2, y2) == 0:
+                                open_rays.append((dx, dy))
+                    rays = open_rays
+                    step += 1
+        else: # Pieces that attack by a single step or jump
+            if piece_type in pawn_types:
+                plan = pawn_move_plans[(piece_type, color)][1]
+            else:
+                plan = move_plans[piece_type]
+            for (dt, dm), xys in plan:
+                location = (time + dt, mult + dm)
+                watched.add(location)
+                id = tm_index.get(location)
+                if id is None:
+                    continue
+                offset = id * n * n
+                for dx, dy in xys:
+                    x2, y2 = x + dx, y + dy
+                    if (0 <= x2 < n) and (0 <= y2 < n):
+                        indices.append(offset + x2 * n + y2)
+        return indices, watched
+
+    # Queries
+
+    def get_map_indices(self, side, turn=None):
+        """Returns indices of the maps of an attacking player, for boards of one turn or of both"""
+        if turn is None:
+            return [2 * side_index[side], 2 * side_index[side] + 1]
+        return [2 * side_index[side] + side_index[turn]]
+
+    def attack_count(self, vec, side, turn=None):
+        """
+        Counts pieces of a player that attack a square
+
+        Args:
+            vec (tuple): integer 4d vector of the square
+            side (str): attacking player ('l' or 'd')
+            turn (str): only count attackers standing on boards where this player moves.
+                Defaults to None, which counts attackers on all timeline heads.
+
+        Returns:
+            int: number of attackers
+        """
+        self.update()
+        id = self.chess5.tm_index.get((vec[2], vec[3]))
+        if id is None:
+            return 0
+        return sum(int(self.maps[k, id, vec[0], vec[1]]) for k in self.get_map_indices(side, turn))
+
+    def is_attacked(self, vec, side, turn=None):
+        """
+        Checks whether a square is attacked by a player, see attack_count
+
+        Returns:
+            bool: True if attacked
+        """
+        return self.attack_count(vec, side, turn) > 0
+
+    def get_attack_map(self, id, side, turn=None):
+        """
+        Finds the squares of a board attacked by a player, e.g. to highlight them
+
+        Args:
+            id (int): chessboard id
+            side (str): attacking player ('l' or 'd')
+            turn (str): only count attackers standing on boards where this player moves.
+                Defaults to None, which counts attackers on all timeline heads.
+
+        Returns:
+            array: n x n numbers of attackers of every square
+        """
+        self.update()
+        return sum(self.maps[k, id].astype(np.int32) for k in self.get_map_indices(side, turn))
+
+    def is_in_check(self, color):
+        """
+        Checks whether any royal piece of a player is attacked, with the same rule as
+        LegalMoveGenerator.is_in_check: attackers stand on the opponent's playable boards,
+        or on all timeline heads if the player is to move.
+
+        Args:
+            color (str): 'l' or 'd', the player whose royal pieces are checked
+
+        Returns:
+            bool: True if in check
+        """
+        self.update()
+        chess5 = self.chess5
+        opponent = 'd' if color == 'l' else 'l'
+        turn = None if color == chess5.get_player_to_move() else opponent
+        map_indices = self.get_map_indices(opponent, turn)
+        maps = self.maps
+        for location, squares in self.royals.items():
+            id = chess5.tm_index[location]
+            for x, y in squares[color]:
+                for k in map_indices:
+                    if maps[k, id, x, y] > 0:
+                        return True
+        return False
@@ -1,34 +1,166 @@
 import numpy as np
-import os
+import os, copy
+from types import MappingProxyType
+from zobrist import get_zobrist_keys
 
 
 class Chessboard_2D:
     """
     A class that contains all info about a single 2D chessboard
     """
-    def __init__(self, chessboard_tm_pos=[0,0], n=8, origin=-1):
+    def __init__(self, chessboard_tm_pos=[0,0], n=8, origin=-1, storage=None, storage_id=None):
         """
         Sets up 2D chessboard variables
 
         Args:
             chessboard_tm_pos (array): position of chessboard in time-multiverse space. Defaults to [0,0]
             n (int): size of chessbaord. Defaults to 8.
+            storage (BoardTensorStorage): shared storage to keep the board in. 
+                Defaults to None, which gives the board its own matrix.
+            storage_id (int): slot of the storage that holds this board. 
+                Defaults to None, which allocates a new empty slot.
         """
         if n > 26:
             raise ValueError("More chessboard rows than letters of Latin alphabet!")
+        if (storage is not None) and (storage.chessboard_size != n):
+            raise ValueError(f"Cannot keep a {n}x{n} board in a storage of {storage.chessboard_size}x{storage.chessboard_size} boards")
         self.chessboard_size = n
         self.origin = origin
-        self.utils = ChessUtils_2D()
+        self.utils = chess_utils_2d
+        self.storage = storage
+        self.storage_id = storage_id
+        self.zobrist = get_zobrist_keys(n)
+        self.key_listener = None # called as key_listener(chessboard, old_key) when the key changes
+        self.history = None # DeltaBoardHistory that may keep the board as a delta to its origin
 
         self.chessboard_tm_pos = chessboard_tm_pos
         self.setup_chessboard_coords()
 
+    def __deepcopy__(self, memo):
+        """
+        Deep copies the board. The key listener is only kept when its owner 
+        is being copied as well (i.e. when copying a whole 5D chessboard), 
+        a board copied on its own is detached.
+        """
+        new_chessboard = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new_chessboard
+        for name, value in self.__dict__.items():
+            if name != "key_listener":
+                setattr(new_chessboard, name, copy.deepcopy(value, memo))
+        listener = self.key_listener
+        if (listener is not None) and (id(getattr(listener, "__self__", None)) in memo):
+            new_chessboard.key_listener = copy.deepcopy(listener, memo)
+        else:
+            new_chessboard.key_listener = None
+        return new_chessboard
+
     def setup_chessboard_coords(self):
         """
         Sets up matrix, containing info about all squares of chessboard
         """
         n = self.chessboard_size
-        self.chessboard_matrix = np.zeros([n, n])
+        if self.storage is None:
+            self._chessboard_matrix = np.zeros([n, n])
+        elif self.storage_id is None:
+            self.storage_id = self.storage.allocate_board()
+        self.zobrist_key = self.compute_zobrist_key()
+
+    @property
+    def chessboard_matrix(self):
+        """
+        Matrix, containing info about all squares of chessboard.
+        For storage-backed boards this is a view into the storage tensor.
+        """
+        if self.storage is None:
+            matrix = self._chessboard_matrix
+            if matrix is None: # Kept as a delta
+                return self.history.get_matrix(self)
+            return matrix
+        return self.storage.tensor[self.storage_id]
+
+    @chessboard_matrix.setter
+    def chessboard_matrix(self, matrix):
+        if self.history is not None:
+            self.history.before_write(self)
+        if self.storage is None:
+            self._chessboard_matrix = matrix
+        else:
+            self.storage.tensor[self.storage_id] = matrix
+        self.update_zobrist_key(self.compute_zobrist_key())
+
+    def is_compressed(self):
+        """
+        Checks whether the board is kept as a delta to its origin (see DeltaBoardHistory)
+        """
+        return (self.storage is None) and (self._chessboard_matrix is None)
+
+    def compute_zobrist_key(self):
+        """
+        Computes the Zobrist key of the board from scratch. 
+        Boards with equal keys have the same pieces on the same squares.
+        """
+        return self.zobrist.board_key(self.chessboard_matrix)
+
+    def update_zobrist_key(self, new_key):
+        """
+        Sets the Zobrist key of the board, and notifies the key listener (i.e. the 5D chessboard)
+        """
+        old_key = self.zobrist_key
+        self.zobrist_key = new_key
+        if self.key_listener is not None:
+            self.key_listener(self, old_key)
+
+    def fork(self, chessboard_tm_pos, origin=-1):
+        """
+        Creates a copy-on-write copy of the chessboard. Both boards share the same 
+        matrix until one of them writes to it. Boards in a BoardTensorStorage 
+        get a new slot instead, since copying a single slice is already cheap.
+
+        Args:
+            chessboard_tm_pos (array): position of the new chessboard in time-multiverse space
+            origin (int): id of the board of origin
+
+        Returns:
+            Chessboard_2D: the new chessboard
+        """
+        new_chessboard = copy.copy(self)
+        new_chessboard.chessboard_tm_pos = chessboard_tm_pos
+        new_chessboard.origin = origin
+        new_chessboard.key_listener = None
+        if self.storage is None:
+            if self._chessboard_matrix is None: # Kept as a delta, share the materialized matrix
+                new_chessboard._chessboard_matrix = self.chessboard_matrix
+            else:
+                self._chessboard_matrix.flags.writeable = False
+        else:
+            new_chessboard.storage_id = self.storage.copy_board(self.storage_id)
+        return new_chessboard
+
+    def set_square_value(self, idx_1, idx_2, value):
+        """
+        Writes a value into a square of the matrix, copying the matrix first 
+        if it is still shared with another board
+
+        Args:
+            idx_1 (int): 1st index of a square
+            idx_2 (int): 2nd index of a square
+            value (int): value of the piece, understandable by class
+        """
+        if self.history is not None:
+            self.history.before_write(self)
+        matrix = self.chessboard_matrix
+        if not matrix.flags.writeable:
+            matrix = matrix.copy()
+            self._chessboard_matrix = matrix
+        old_value = int(matrix[idx_1, idx_2])
+        matrix[idx_1, idx_2] = value
+
+        # Incremental Zobrist update: take the old piece out, put the new one in
+        square_keys = self.zobrist.square_keys
+        square = idx_1 * self.chessboard_size + idx_2
+        new_key = self.zobrist_key ^ square_keys[old_value][square] ^ square_keys[int(value)][square]
+        if new_key != self.zobrist_key:
+            self.update_zobrist_key(new_key)
 
     def add_piece(self, piece, pos, eat_pieces=False):
         """
@@ -48,7 +180,7 @@ class Chessboard_2D:
             print(f"There is already {piece_at_pos_name} there.")
             return 1
         else:
-            self.chessboard_matrix[square_loc[0], square_loc[1]] = piece_val
+            self.set_square_value(square_loc[0], square_loc[1], piece_val)
 
     def move_piece(self, pos1, pos2, eat_pieces=False, log=False):
         """
@@ -88,6 +220,16 @@ class Chessboard_2D:
         if log: print(f"matrix notation for square {pos_arr}: {piece_value}")
         return self.utils.value_to_piece(piece_value)
 
+    def get_piece_by_index(self, index):
+        """
+        Gets the name of the piece in the square, given as integer square index
+        (idx_1 * n + idx_2). Returns "" for indecies outside of the chessboard.
+        """
+        n = self.chessboard_size
+        if not (0 <= index < n * n):
+            return ""
+        return self.utils.value_to_piece(self.chessboard_matrix[index // n, index % n])
+
     def mirror_all_pieces(self):
         """
         Mirrors all pices vertically and switches their color.
@@ -112,7 +254,7 @@ class Chessboard_2D:
         Removes a piece at a given position, given in chess notation
         """
         idx_1, idx_2 = self.utils.chessform_to_matrix(pos)
-        self.chessboard_matrix[idx_1, idx_2] = 0
+        self.set_square_value(idx_1, idx_2, 0)
 
     def create_row_of_pieces(self, row_id, piece):
         """
@@ -207,60 +349,143 @@ class Chessboard_2D:
             print("")
 
 
+# Piece registry, shared by all boards. Immutable, so it can be shared safely.
+pieces_dict = MappingProxyType({
+    0: "",
+    # ----------------------
+    1: "kl", # Light King
+    2: "ql", # Light Queen
+    3: "bl", # Light Bishop
+    4: "nl", # Light Knight
+    5: "rl", # Light Rook
+    6: "pl", # Light Pawn
+    7: "dl", # Light Dragon
+    8: "ul", # Light Unicorn
+    9: "Bl", # Light Brawn
+    10:"Pl", # Light Princess
+    11:"cl", # Light Common King
+    12:"Rl", # Light Royal Queen
+    # ----------------------
+    21:"kd", # Dark King
+    22:"qd", # Dark Queen
+    23:"bd", # Dark Bishop
+    24:"nd", # Dark Knight
+    25:"rd", # Dark Rook
+    26:"pd", # Dark Pawn
+    27:"dd", # Dark Dragon
+    28:"ud", # Dark Unicorn
+    29:"Bd", # Dark Brawn
+    30:"Pd", # Dark Princess
+    31:"cd", # Dark Common King
+    32:"Rd", # Dark Royal Queen
+    # ----------------------
+    60:"Ml", # Movement allowed light
+    61:"Md", # Movement allowed dark
+})
+piece_values_dict = MappingProxyType({piece: value for value, piece in pieces_dict.items()})
+piece_colors_dict = MappingProxyType({value: piece[1] for value, piece in pieces_dict.items() if piece})
+# Same colors as an array indexed by piece value (0: none, 1: light, 2: dark), for vectorized lookups
+piece_color_codes = np.zeros(max(pieces_dict) + 1, dtype=np.int8)
+for value, color in piece_colors_dict.items():
+    piece_color_codes[value] = 1 if color == 'l' else 2
+piece_color_codes.flags.writeable = False
+pieces_scales_dict = MappingProxyType({
+    # ----------------------
+    "k": 1.6, # Light King
+    "q": 1.5, # Light Queen
+    "b": 1.4, # Light Bishop
+    "n": 1.4, # Light Knight
+    "r": 1.1, # Light Rook
+    "p": 0.9, # Light Pawn
+    "d": 1.0, # Light Dragon
+    "u": 1.0, # Light Unicorn
+})
+
+
 class ChessUtils_2D():
     """DocString"""
     def __init__(self):
         """Create a new instance"""
 
         self.img_type = "svg"
-        self.pieces_scales_dict = {
-                                   # ----------------------
-                                   "k": 1.6, # Light King
-                                   "q": 1.5, # Light Queen
-                                   "b": 1.4, # Light Bishop
-                                   "n": 1.4, # Light Knight
-                                   "r": 1.1, # Light Rook
-                                   "p": 0.9, # Light Pawn
-                                   "d": 1.0, # Light Dragon
-                                   "u": 1.0, # Light Unicorn
-                                  }
-        self.pieces_dict = {0: "",
-                            # ----------------------
-                            1: "kl", # Light King
-                            2: "ql", # Light Queen
-                            3: "bl", # Light Bishop
-                            4: "nl", # Light Knight
-                            5: "rl", # Light Rook
-                            6: "pl", # Light Pawn
-                            7: "dl", # Light Dragon
-                            8: "ul", # Light Unicorn
-                            9: "Bl", # Light Brawn
-                            10:"Pl", # Light Princess
-                            11:"cl", # Light Common King
-                            12:"Rl", # Light Royal Queen
-                            # ----------------------
-                            21:"kd", # Dark King
-                            22:"qd", # Dark Queen
-                            23:"bd", # Dark Bishop
-                            24:"nd", # Dark Knight
-                            25:"rd", # Dark Rook
-                            26:"pd", # Dark Pawn
-                            27:"dd", # Dark Dragon
-                            28:"ud", # Dark Unicorn
-                            29:"Bd", # Dark Brawn
-                            30:"Pd", # Dark Princess
-                            31:"cd", # Dark Common King
-                            32:"Rd", # Dark Royal Queen
-                            # ----------------------
-                            60:"Ml", # Movement allowed light
-                            61:"Md", # Movement allowed dark
-                           }
+        self.pieces_scales_dict = pieces_scales_dict
+        self.pieces_dict = pieces_dict
+        self.piece_values_dict = piece_values_dict
+
+    def __deepcopy__(self, memo):
+        """The piece registry is immutable, so copies of boards keep sharing utils"""
+        return self
+
+    def __reduce__(self):
+        """Pickles only the settings, the registry is rebuilt from the module on load"""
+        return (ChessUtils_2D, (), {"img_type": self.img_type})
 
     def matrix_to_chessform(self, pos_arr, chessboard_size=8):
+        """
+        Converts matrix chessboard positional array to chess format of square.
+        Returns a0 if outside of the chessboard.
+        """
+        square_names = get_square_tables(chessboard_size).names_by_coords
+        try:
+            return square_names[tuple(pos_arr)]
+        except (KeyError, TypeError):
+            return self.matrix_to_chessform_uncached(pos_arr, chessboard_size)
+
+    def chessform_to_matrix(self, pos, chessboard_size=8):
         """
         Converts chess format of squre to matrix chessboard positional array.
+        Returns [-1, -1] if outside of the chessboard.
+        """
+        square_coords = get_square_tables(chessboard_size).coords_by_name
+        try:
+            return list(square_coords[pos])
+        except (KeyError, TypeError):
+            return self.chessform_to_matrix_uncached(pos, chessboard_size)
+
+    def chessform_to_index(self, pos, chessboard_size=8):
+        """
+        Converts chess format of square to integer square index (idx_1 * n + idx_2).
+        Returns -1 if outside of the chessboard.
+        """
+        return get_square_tables(chessboard_size).index_by_name.get(pos, -1)
+
+    def index_to_chessform(self, index, chessboard_size=8):
+        """
+        Converts integer square index to chess format of square.
         Returns a0 if outside of the chessboard.
         """
+        square_names = get_square_tables(chessboard_size).names_by_index
+        if 0 <= index < len(square_names):
+            return square_names[index]
+        return 'a0'
+
+    def matrix_to_index(self, pos_arr, chessboard_size=8):
+        """
+        Converts matrix chessboard positional array to integer square index.
+        Returns -1 if outside of the chessboard.
+        """
+        n = chessboard_size
+        square_x, square_y = pos_arr
+        if (0 <= square_x < n) and (0 <= square_y < n):
+            return square_x * n + square_y
+        return -1
+
+    def index_to_matrix(self, index, chessboard_size=8):
+        """
+        Converts integer square index to matrix chessboard positional array.
+        Returns [-1, -1] if outside of the chessboard.
+        """
+        n = chessboard_size
+        if 0 <= index < n * n:
+            return [index // n, index % n]
+        return [-1, -1]
+
+    @staticmethod
+    def matrix_to_chessform_uncached(pos_arr, chessboard_size=8):
+        """
+        Converts matrix chessboard positional array to chess format of square
+        without the lookup tables. Returns a0 if outside of the chessboard.
+        """
         n = chessboard_size
         if len(pos_arr) > 2:
             return 'a0'
@@ -279,10 +504,11 @@ class ChessUtils_2D():
 
         return ''.join([pos_let, str(pos_num)])
 
-    def chessform_to_matrix(self, pos, chessboard_size=8):
+    @staticmethod
+    def chessform_to_matrix_uncached(pos, chessboard_size=8):
         """
-        Converts chess format of squre to matrix chessboard positional array.
-        Returns [-1, -1] if outside of the chessboard.
+        Converts chess format of squre to matrix chessboard positional array
+        without the lookup tables. Returns [-1, -1] if outside of the chessboard.
         """
         n = chessboard_size
         if len(pos) > 2:
@@ -374,7 +600,51 @@ class ChessUtils_2D():
         """
         Converts piece acronym to value, understandable by class
         """
-        for value,comparison_string in self.pieces_dict.items():
-            if comparison_string == string:
-                return value
-        raise ValueError(f"{string} is not a valid piece.")
+        try:
+            return self.piece_values_dict[string]
+        except KeyError:
+            raise ValueError(f"{string} is not a valid piece.")
+
+
+# ChessUtils_2D holds no per-board state, so a single instance is shared by all boards
+chess_utils_2d = ChessUtils_2D()
+
+
+class SquareTables():
+    """Precomputed square name lookup tables for a single chessboard size"""
+    def __init__(self, chessboard_size=8):
+        """
+        Builds the tables with the uncached conversion functions, 
+        so lookups give exactly the same results
+
+        Args:
+            chessboard_size (int): size of chessboard
+        """
+        n = chessboard_size
+        self.chessboard_size = n
+        self.names_by_coords = {}
+        self.coords_by_name = {}
+        self.names_by_index = []
+        self.index_by_name = {}
+        for idx_1 in range(n):
+            for idx_2 in range(n):
+                square = ChessUtils_2D.matrix_to_chessform_uncached([idx_1, idx_2], n)
+                self.names_by_coords[(idx_1, idx_2)] = square
+                self.names_by_index.append(square)
+                # Only keep names that convert back, i.e. not 'a10' (3 characters)
+                if ChessUtils_2D.chessform_to_matrix_uncached(square, n) == [idx_1, idx_2]:
+                    self.coords_by_name[square] = (idx_1, idx_2)
+                    self.index_by_name[square] = idx_1 * n + idx_2
+
+
+square_tables = {} # chessboard size -> SquareTables
+
+def get_square_tables(chessboard_size=8):
+    """
+    Returns square name lookup tables for a given chessboard size, building them once
+    """
+    tables = square_tables.get(chessboard_size)
+    if tables is None:
+        tables = SquareTables(chessboard_size)
+        square_tables[chessboard_size] = tables
+    return tables
@@ -1,25 +1,142 @@
 import numpy as np
-from chess_db_2d import Chessboard_2D, ChessUtils_2D
+import struct
+from chess_db_2d import Chessboard_2D, chess_utils_2d, piece_colors_dict, piece_color_codes
 from moves import Moves
-import string, manim, copy
+from chess_storage import BoardTensorStorage, BoardMemmapStorage, DeltaBoardHistory, read_memmap_header
+from zobrist import position_key, get_zobrist_keys
+import copy
+
+# Result of a move onto a square, indexed by the color code of its content (none, light, dark)
+move_possible_light = np.array([2, 0, 1], dtype=np.int8)
+move_possible_dark = np.array([2, 1, 0], dtype=np.int8)
+
+# Binary multiverse files (see Chessboard_5D.save): a header, then int32 (time, multiverse, origin)
+# of every board, then int8 matrices of all boards. The header holds the magic bytes, the format 
+# version, chessboard size, first_turn_black, number of boards, max_mult_white, max_mult_black, 
+# present and the Zobrist key of the multiverse.
+board_file_magic = b"5DCB"
+board_file_version = 1
+board_file_header = struct.Struct("<4sHBBqqqqQ")
+
+
+class LazyChessboardList(list):
+    """
+    List of chessboards loaded in bulk from board arrays. Chessboard_2D objects are only
+    built when a board is first accessed, until then its entry is None. Boards added
+    after loading are appended as usual.
+    """
+    def __init__(self, boards, origins, build_chessboard):
+        """
+        Create a new instance of class
+
+        Args:
+            boards (np.array): int8 matrices of the loaded boards, shape (num_boards, n, n)
+            origins (np.array): origin id of every loaded board
+            build_chessboard (func): builds the Chessboard_2D of a loaded board from its id
+        """
+        super().__init__([None] * len(boards))
+        self.boards = boards
+        self.origins = origins
+        self.build_chessboard = build_chessboard
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ self[i] for i in range(*index.indices(len(self))) ]
+        chessboard = list.__getitem__(self, index)
+        if chessboard is None:
+            if index < 0:
+                index += len(self)
+            chessboard = self.build_chessboard(index)
+            list.__setitem__(self, index, chessboard)
+        return chessboard
+
+    def __iter__(self):
+        for id in range(len(self)):
+            yield self[id]
+
+    def num_built(self):
+        """Returns the number of boards that have a Chessboard_2D object"""
+        return sum(1 for chessboard in list.__iter__(self) if chessboard is not None)
+
+    def get_origins(self):
+        """Returns the origin id of every board, without building boards"""
+        return [ int(self.origins[id]) if chessboard is None else chessboard.origin
+                 for id, chessboard in enumerate(list.__iter__(self)) ]
+
+    def get_board_tensor(self):
+        """Returns int8 matrices of all boards, shape (num_boards, n, n), without building boards"""
+        n = self.boards.shape[1]
+        tensor = np.empty([len(self), n, n], dtype=np.int8)
+        num_loaded = min(len(self), len(self.boards))
+        tensor[:num_loaded] = self.boards[:num_loaded]
+        for id, chessboard in enumerate(list.__iter__(self)):
+            if chessboard is not None:
+                tensor[id] = chessboard.chessboard_matrix
+        return tensor
 
 
 class Chessboard_5D:
     """
     A class that contains all info about 5D chessboards and pieces
     """
-    def __init__(self, chessboard_size=8, first_turn_black=0, log=False):
+    def __init__(self, chessboard_size=8, first_turn_black=0, storage="list", storage_path=None, log=False):
         """
         Create a new instance of class
+
+        Args:
+            chessboard_size (int): size of every 2D chessboard. Defaults to 8.
+            first_turn_black (int): 0 for 1st turn to white, 1 for 1st turn to black
+            storage (str): how the boards are stored. Values:
+                list (Default): every Chessboard_2D holds its own matrix
+                tensor: all boards are kept in one int8 array of shape (num_boards, n, n),
+                    and every Chessboard_2D is a view into one slice of it
+                memmap: like tensor, but the array is memory-mapped from a new file at storage_path
+                    (see BoardMemmapStorage). Use open_chessboard_5d to reopen the file.
+                delta: like list, but boards that are no longer the last board of their timeline
+                    are kept as deltas to their board of origin (see DeltaBoardHistory)
+                A BoardTensorStorage or DeltaBoardHistory instance is used as is.
+            storage_path (str): path of the board file of memmap storage
+            log (bool): whether to output log into the terminal
         """
         self.chessboards = []
         self.timemult_coords = []
+        self.tm_index = {} # (time, multiverse) -> chessboard id
+        self.timeline_boards = {} # multiverse -> {time: chessboard id}
+        self.timeline_heads = {} # multiverse -> maximum existing time
+        self.tm_grid = np.full([0, 0], -1, dtype=np.int64) # dense (time, multiverse) -> chessboard id
+        self.tm_grid_origin = (0, 0) # (time, multiverse) of tm_grid[0, 0]
+        self.tm_bounds = None # [min time, max time, min multiverse, max multiverse] of existing boards
         self.chessboard_size = chessboard_size
         self.present = 0
         self.max_mult_black = 0
         self.max_mult_white = 0
         self.moves = Moves()
         self.log = log
+        self.zobrist_key = 0 # XOR of position_key of all boards, see on_board_key_change
+        self.board_listeners = [] # objects told about changes of boards, see add_board_listener
+
+        self.history = None # DeltaBoardHistory of delta storage
+        if storage == "list":
+            self.storage = None
+        elif storage == "delta":
+            self.storage = None
+            self.history = DeltaBoardHistory()
+        elif isinstance(storage, DeltaBoardHistory):
+            self.storage = None
+            self.history = storage
+        elif storage == "tensor":
+            self.storage = BoardTensorStorage(chessboard_size)
+        elif storage == "memmap":
+            if storage_path is None:
+                raise ValueError("Memmap storage needs a storage_path")
+            self.storage = BoardMemmapStorage(storage_path, chessboard_size)
+        elif isinstance(storage, BoardTensorStorage):
+            if storage.chessboard_size != chessboard_size:
+                raise ValueError(f"Cannot keep {chessboard_size}x{chessboard_size} boards in a storage of "+
+                                 f"{storage.chessboard_size}x{storage.chessboard_size} boards")
+            self.storage = storage
+        else:
+            raise ValueError(f"Unknown storage type: {storage}. Allowed values: list, tensor, memmap, delta")
 
         # 0 for 1st turn to white, 1 for 1st turn to black. Important for multiverse creation directions
         self.first_turn_black = first_turn_black
@@ -30,18 +147,53 @@ class Chessboard_5D:
         """
         Sets up the default 8x8 chessboard.
         """
-        base_chessboard = Chessboard_2D()
+        base_chessboard = Chessboard_2D(n=self.chessboard_size, storage=self.storage)
         base_chessboard.default_chess_configuration_setup()
-        self.chessboards.append(base_chessboard)
-        self.timemult_coords.append([0,0])
+        self.register_chessboard(base_chessboard, [0,0])
 
     def add_empty_chessboard(self, chessboard_loc):
         """
         Adds an empty chessboard in specified time-multiverse locaiton
         """
-        base_chessboard = Chessboard_2D(chessboard_tm_pos=chessboard_loc)
-        self.chessboards.append(base_chessboard)
-        self.timemult_coords.append(chessboard_loc)
+        base_chessboard = Chessboard_2D(chessboard_tm_pos=chessboard_loc, n=self.chessboard_size, 
+                                        storage=self.storage)
+        self.register_chessboard(base_chessboard, chessboard_loc)
+
+    def movement_grid_setup(self, piece, n=1, pawns_row=False, log=False):
+        """
+        Fills a (2n+1)x(2n+1) time-multiverse grid with empty chessboards and puts a single piece 
+        on d5 of the last board of timeline 0. Used to check how pieces move.
+
+        Args:
+            piece (str): piece acronym
+            n (int): how many chessboards to add in positive direction - total is 2n+1. Defaults to 1.
+            pawns_row (bool): whether to add a row of enemy pawns in front of the piece
+            log (bool): whether to output log into the terminal
+
+        Returns:
+            list: 3-list position of the piece
+        """
+        pos = ['d5', 2*n, 0] # position of the piece
+        pawns_row_chessboard = [ pos[1], pos[2] ]
+        pawns_row_square = pos[0]
+        pawns_row_increment = 1
+        for i in range(-n, n+1):
+            for j in range(2*n+1):
+                self.add_empty_chessboard([j,i])
+                if log: print([j,i])
+        self.add_piece(piece, pos)
+        _, piece_color = list(piece)
+        if pawns_row:
+            pawn = chess_utils_2d.light_to_dark_piece("p" + piece_color)
+            if piece_color == 'd':
+                pawns_row_increment = -pawns_row_increment
+            row_loc = chess_utils_2d.chessform_to_matrix(pawns_row_square)
+            row_id = row_loc[0] + pawns_row_increment + 1
+            target_id = self.get_chessboard_by_tm(pawns_row_chessboard)
+            if log: print(pawns_row_chessboard)
+            target_chessboard = self.chessboards[target_id]
+            target_chessboard.create_row_of_pieces(row_id, pawn)
+        return pos
 
     def add_chessboard(self, chessboard_loc, origin_board):
         """
@@ -52,13 +204,129 @@ class Chessboard_5D:
             origin_board (array): board of origin, from which the this one is created
                                   either by multiverse branching or time passing
         """
-        chessboard = Chessboard_2D(chessboard_tm_pos=chessboard_loc, n=self.chessboard_size, origin=origin_board)
-        if chessboard_loc not in self.timemult_coords:
-            self.chessboards.append(chessboard)
-            self.timemult_coords.append(chessboard_loc)
+        if self.get_chessboard_by_tm(chessboard_loc) == -1:
+            chessboard = Chessboard_2D(chessboard_tm_pos=chessboard_loc, n=self.chessboard_size, 
+                                       origin=origin_board, storage=self.storage)
+            self.register_chessboard(chessboard, chessboard_loc)
         else:
             raise ValueError(f"Could not add a chessboard at tm coordinate of {chessboard_loc}: the space is occupied")
-    
+
+    def register_chessboard(self, chessboard, chessboard_loc):
+        """
+        Appends a chessboard to the list of boards and records it in the time-multiverse index
+
+        Args:
+            chessboard (Chessboard_2D): chessboard to add
+            chessboard_loc (array): location of chessboard in time-multiverse coordinates
+
+        Returns:
+            int: id of the added chessboard
+        """
+        id = len(self.chessboards)
+        self.chessboards.append(chessboard)
+        self.timemult_coords.append(chessboard_loc)
+        time, mult = chessboard_loc[0], chessboard_loc[1]
+        # Keep the first board registered at a location, same as the linear search did
+        self.tm_index.setdefault((time, mult), id)
+
+        # Per-timeline index and running multiverse counters
+        self.timeline_boards.setdefault(mult, {}).setdefault(time, id)
+        old_head = self.timeline_heads.get(mult)
+        if (old_head is None) or (time > old_head):
+            self.timeline_heads[mult] = time
+        if mult > self.max_mult_white:
+            self.max_mult_white = mult
+        if mult < self.max_mult_black:
+            self.max_mult_black = mult
+        self.update_tm_grid(time, mult, id)
+        if self.storage is not None:
+            self.storage.set_board_location(chessboard.storage_id, time, mult, chessboard.origin)
+
+        if self.history is not None:
+            chessboard.history = self.history
+            if (old_head is not None) and (time > old_head): # The old head becomes a delta to its origin
+                self.compress_chessboard(self.timeline_boards[mult][old_head])
+
+        # The board now reports its key changes to the multiverse key
+        self.zobrist_key ^= position_key(chessboard.zobrist_key, time, mult)
+        chessboard.key_listener = self.on_board_key_change
+        for listener in self.board_listeners:
+            listener.on_board_change(time, mult)
+        return id
+
+    def compress_chessboard(self, id):
+        """
+        Keeps a board of delta storage as a delta to its board of origin, if it has one
+        """
+        chessboard = self.chessboards[id]
+        if 0 <= chessboard.origin < id:
+            self.history.compress(chessboard, self.chessboards[chessboard.origin])
+
+    def on_board_key_change(self, chessboard, old_key):
+        """
+        Updates the multiverse Zobrist key after a piece changes on one of its boards
+
+        Args:
+            chessboard (Chessboard_2D): the changed chessboard
+            old_key (int): Zobrist key of the chessboard before the change
+        """
+        time, mult = chessboard.chessboard_tm_pos[0], chessboard.chessboard_tm_pos[1]
+        self.zobrist_key ^= position_key(old_key, time, mult) ^ position_key(chessboard.zobrist_key, time, mult)
+        for listener in self.board_listeners:
+            listener.on_board_change(time, mult)
+
+    def add_board_listener(self, listener):
+        """
+        Registers an object that keeps data derived from the boards up to date. It is told:
+            listener.on_board_change(time, mult): a board was added at (time, mult), or its pieces changed
+            listener.on_boards_removed(num_boards, locations): boards from id num_boards on 
+                were removed by rollback, locations are their (time, multiverse) pairs
+        """
+        self.board_listeners.append(listener)
+
+    def remove_board_listener(self, listener):
+        """Stops telling a listener about changes of boards"""
+        self.board_listeners.remove(listener)
+
+    def compute_zobrist_key(self):
+        """
+        Computes the Zobrist key of the multiverse from scratch. 
+        Multiverses with equal keys have the same boards at the same time-multiverse locations.
+        """
+        key = 0
+        for chessboard, (time, mult) in zip(self.chessboards, self.timemult_coords):
+            key ^= position_key(chessboard.compute_zobrist_key(), time, mult)
+        return key
+
+    def update_tm_grid(self, time, mult, id):
+        """
+        Records a chessboard in the dense time-multiverse grid, used for vectorized lookups.
+        The grid grows with some slack, so that it is not reallocated on every new board.
+        """
+        t0, m0 = self.tm_grid_origin
+        rows, cols = self.tm_grid.shape
+        if rows == 0:
+            t0, m0 = time, mult
+        if not (t0 <= time < t0 + rows and m0 <= mult < m0 + cols):
+            t_lo, t_hi = min(t0, time), max(t0 + rows, time + 1)
+            m_lo, m_hi = min(m0, mult), max(m0 + cols, mult + 1)
+            # Extend further in the direction of growth
+            if time < t0: t_lo -= rows
+            if time >= t0 + rows: t_hi += rows
+            if mult < m0: m_lo -= cols
+            if mult >= m0 + cols: m_hi += cols
+            new_grid = np.full([t_hi - t_lo, m_hi - m_lo], -1, dtype=np.int64)
+            new_grid[t0 - t_lo:t0 - t_lo + rows, m0 - m_lo:m0 - m_lo + cols] = self.tm_grid
+            self.tm_grid = new_grid
+            self.tm_grid_origin = t0, m0 = t_lo, m_lo
+        if self.tm_grid[time - t0, mult - m0] == -1:
+            self.tm_grid[time - t0, mult - m0] = id
+        if self.tm_bounds is None:
+            self.tm_bounds = [time, time, mult, mult]
+        else:
+            b = self.tm_bounds
+            self.tm_bounds = [min(b[0], time), max(b[1], time), min(b[2], mult), max(b[3], mult)]
+
     # Chessboard tm-manipulation
 
     def get_chessboard_by_tm(self, chessboard_loc, log=False):
@@ -67,11 +335,9 @@ class Chessboard_5D:
         Returns -1 if not present.
         """
         if log: print(f"chessboard to retreive tm position from: {chessboard_loc}")
-        for i, element in enumerate(self.timemult_coords):
-            if log: print(element)
-            if (element == chessboard_loc):
-                return i
-        return -1
+        if len(chessboard_loc) != 2:
+            return -1
+        return self.tm_index.get((chessboard_loc[0], chessboard_loc[1]), -1)
 
     def evolve_chessboard(self, chessboard_loc):
         """
@@ -80,18 +346,12 @@ class Chessboard_5D:
         Args:
             chessboard_loc (array): location of chessboard in time-multiverse coordinates
         """
-        id = -1
-        timeline_times = []
         old_chessboard_loc = chessboard_loc
-        for i, element in enumerate(self.timemult_coords):
-            if element[1] == chessboard_loc[1]:
-                timeline_times.append(element[0])
-                if element[0] == chessboard_loc[0]:
-                    id = i
+        id = self.get_chessboard_by_tm(chessboard_loc)
         if id == -1:
             raise ValueError(f"No chessboard was found at location {chessboard_loc}")
 
-        if max(timeline_times) == chessboard_loc[0]: # Time evolution only
+        if self.timeline_heads[chessboard_loc[1]] == chessboard_loc[0]: # Time evolution only
             chessboard_loc = [ chessboard_loc[0] + 1, chessboard_loc[1] ]
         else: # Multiverse creation
             is_white = (chessboard_loc[0] + chessboard_loc[1] + self.first_turn_black) % 2
@@ -101,11 +361,8 @@ class Chessboard_5D:
                 new_mult = self.max_mult_black - 1
             chessboard_loc = [ chessboard_loc[0] + 1, new_mult ]
 
-        final_chessboard = copy.deepcopy(self.chessboards[id])
-        final_chessboard.chessboard_tm_pos = chessboard_loc
-        final_chessboard.origin = id
-        self.chessboards.append(final_chessboard)
-        self.timemult_coords.append(chessboard_loc)
+        final_chessboard = self.chessboards[id].fork(chessboard_loc, origin=id)
+        self.register_chessboard(final_chessboard, chessboard_loc)
         if self.log: print(f"evolving chessboard from {old_chessboard_loc} to {chessboard_loc}")
     
     # Adding/removing pieces
@@ -143,6 +400,24 @@ class Chessboard_5D:
         target_chessboard = self.chessboards[id]
         target_chessboard.add_piece(piece, square, eat_pieces=eat_pieces)
 
+    def fork(self):
+        """
+        Creates a copy-on-write copy of the whole multiverse. Board matrices are 
+        shared with this instance, and only copied for boards that get written to.
+
+        Returns:
+            Chessboard_5D: the new multiverse
+        """
+        # Pre-fill the deepcopy memo so that shared objects are not copied
+        memo = {id(self.moves): self.moves}
+        for chessboard in self.chessboards:
+            memo[id(chessboard.utils)] = chessboard.utils
+            if (chessboard.storage is None) and not chessboard.is_compressed():
+                matrix = chessboard.chessboard_matrix
+                matrix.flags.writeable = False
+                memo[id(matrix)] = matrix
+        return copy.deepcopy(self, memo)
+
     # Printing chessboards
 
     def print_chessboard(self, chessboard_loc, style="regular"):
@@ -248,6 +523,167 @@ class Chessboard_5D:
         target_chessboard.add_piece(piece, square2, eat_pieces=True)
         self.chessboards[-1] = target_chessboard
 
+    def movie_piece_4d(self, original_vec, final_vec):
+        """
+        Same as movie_piece, but with integer 4d vectors (x, y, t, m) instead of 3-lists
+
+        Args:
+            original_vec (tuple): original position, i.e. (0, 0, 2, 3)
+            final_vec (tuple): final position (before multiverse branching/time moving forward)
+        """
+        x1, y1, time1, mult1 = original_vec
+        x2, y2, time2, mult2 = final_vec
+        if (time1 < time2) and (mult1 == mult2): # Moving to the future is impossible
+            raise ValueError("Cannot move to the future on the same timeline")
+
+        self.evolve_chessboard([time1, mult1])
+        chessboard = self.chessboards[-1]
+        piece_value = chessboard.chessboard_matrix[x1, y1]
+        chessboard.set_square_value(x1, y1, 0)
+        if (time1 != time2) or (mult1 != mult2): # Evolve target board too
+            self.evolve_chessboard([time2, mult2])
+            chessboard = self.chessboards[-1]
+        chessboard.set_square_value(x2, y2, piece_value)
+
+    def checkpoint(self):
+        """
+        Saves the state of the multiverse, so that boards added after this call can be undone.
+        Moves only add new boards, so this is enough to undo moves.
+
+        Returns:
+            tuple: state to pass to rollback
+        """
+        storage_boards = None if self.storage is None else self.storage.num_boards
+        return (len(self.chessboards), dict(self.timeline_heads), self.max_mult_white, 
+                self.max_mult_black, self.tm_bounds, self.zobrist_key, storage_boards)
+
+    def rollback(self, state):
+        """
+        Removes all boards added after a checkpoint. Changes to boards that existed 
+        at the checkpoint are not undone.
+
+        Args:
+            state (tuple): state returned by checkpoint
+        """
+        num_boards, timeline_heads, max_mult_white, max_mult_black, tm_bounds, zobrist_key, storage_boards = state
+        removed_locations = self.remove_boards(num_boards)
+        self.timeline_heads = timeline_heads
+        self.max_mult_white, self.max_mult_black = max_mult_white, max_mult_black
+        self.tm_bounds = tm_bounds
+        self.zobrist_key = zobrist_key
+        if storage_boards is not None:
+            self.storage.num_boards = storage_boards
+        if removed_locations:
+            for listener in self.board_listeners:
+                listener.on_boards_removed(num_boards, removed_locations)
+
+    def remove_boards(self, num_boards):
+        """
+        Removes boards from id num_boards on from the list of boards and the time-multiverse indices.
+        Timeline heads, counters and the Zobrist key are left to the caller (see rollback).
+
+        Returns:
+            list: (time, multiverse) of the removed boards
+        """
+        removed_locations = [ (tm_pos[0], tm_pos[1]) for tm_pos in self.timemult_coords[num_boards:] ]
+        t0, m0 = self.tm_grid_origin
+        for id in range(len(self.chessboards) - 1, num_boards - 1, -1):
+            time, mult = self.timemult_coords[id][0], self.timemult_coords[id][1]
+            if self.tm_index.get((time, mult)) == id:
+                del self.tm_index[(time, mult)]
+                self.tm_grid[time - t0, mult - m0] = -1
+            timeline = self.timeline_boards[mult]
+            if timeline.get(time) == id:
+                del timeline[time]
+                if not timeline:
+                    del self.timeline_boards[mult]
+            chessboard = self.chessboards[id]
+            chessboard.key_listener = None
+            if self.history is not None:
+                self.history.forget(chessboard)
+        del self.chessboards[num_boards:]
+        del self.timemult_coords[num_boards:]
+        return removed_locations
+
+    # Turn structure
+
+    def get_active_timelines(self):
+        """
+        Finds timelines that are active, i.e. that count for the present. A side of the multiverse axis
+        can have at most one more timeline active than the other: positive multiverse ids count as 
+        light timelines and negative ones as dark. The side of a new timeline is picked from the time 
+        and multiverse of the board it branches from (see evolve_chessboard), so it doesn't always 
+        match the player who created it (see get_timeline_creator).
+
+        Returns:
+            list: sorted multiverse ids of active timelines
+        """
+        light_timelines, dark_timelines = self.max_mult_white, -self.max_mult_black
+        return [ mult for mult in sorted(self.timeline_heads) 
+                 if (0 < mult <= dark_timelines + 1) or (0 < -mult <= light_timelines + 1) or (mult == 0) ]
+
+    def get_timeline_creator(self, mult):
+        """
+        Finds the player who created a timeline. The first board of a branched timeline differs from
+        the board it branched from only where the moved piece left or arrived, so the color of that
+        piece tells the player. It is found from the boards, so it holds after rollback and loading.
+
+        Args:
+            mult (int): multiverse id of the timeline
+
+        Returns:
+            str: 'l' or 'd', or None if the timeline didn't branch from another one (i.e. it was set up)
+        """
+        boards = self.timeline_boards[mult]
+        id = boards[min(boards)]
+        origin = self.chessboards[id].origin
+        if (origin < 0) or (self.timemult_coords[origin][1] == mult):
+            return None
+        matrix, origin_matrix = self.chessboards[id].chessboard_matrix, self.chessboards[origin].chessboard_matrix
+        changed = np.nonzero(matrix != origin_matrix)
+        values = [ value for value in matrix[changed].tolist() if value != 0 ] # Pieces that arrived
+        values += origin_matrix[changed].tolist() # Pieces that left
+        if not values:
+            return None
+        return 'l' if piece_color_codes[int(values[0])] == 1 else 'd'
+
+    def get_present(self):
+        """
+        Returns the present, i.e. the earliest time among the last boards of active timelines
+        """
+        return min(self.timeline_heads[mult] for mult in self.get_active_timelines())
+
+    def get_board_color(self, time):
+        """
+        Returns which player moves on boards with a given time coordinate ('l' or 'd')
+        """
+        return 'l' if (time + self.first_turn_black) % 2 == 0 else 'd'
+
+    def get_player_to_move(self):
+        """
+        Returns the player to move ('l' or 'd'), i.e. the player who moves at the present
+        """
+        return self.get_board_color(self.get_present())
+
+    def get_playable_boards(self, color=None):
+        """
+        Finds boards a player can move on: last boards of timelines where it's that player's turn
+
+        Args:
+            color (str): 'l' or 'd'. Defaults to None, which takes the player to move.
+
+        Returns:
+            list: chessboard ids, ordered by multiverse id
+        """
+        if color is None:
+            color = self.get_player_to_move()
+        playable = []
+        for mult in sorted(self.timeline_heads):
+            time = self.timeline_heads[mult]
+            if self.get_board_color(time) == color:
+                playable.append(self.tm_index[(time, mult)])
+        return playable
+
     # Possible moves 
 
     def check_if_move_possible(self, pos, kind):
@@ -278,6 +714,103 @@ class Chessboard_5D:
         else: # Can eat enemy pieces
             return 1
 
+    def check_if_move_possible_4d(self, vec, kind):
+        """
+        Checks if movement to specified position is possible, 
+        without converting the position to chess notation
+
+        Args:
+            vec (tuple): integer 4d vector (x, y, t, m) of target space
+            kind (str): wether the piece we're moving is light or dark
+
+        Returns:
+            int: 
+                0 if impossible
+                1 if possible with eating a piece
+                2 if possible without eating a piece
+        """
+        x, y, time, mult = vec
+        n = self.chessboard_size
+        if not ((0 <= x < n) and (0 <= y < n)): # Cannot move outside of the board
+            return 0
+        id = self.tm_index.get((time, mult), -1)
+        if id == -1: # Cannot move onto a board that doesn't exist
+            return 0
+        target_value = self.chessboards[id].chessboard_matrix[x, y]
+        if target_value == 0: # Can move through empty spaces
+            return 2
+        if piece_colors_dict[target_value] == kind: # Cannot eat own pieces
+            return 0
+        else: # Can eat enemy pieces
+            return 1
+
+    def query_squares(self, vecs, kind):
+        """
+        Vectorized version of check_if_move_possible_4d, 
+        answering occupancy and color for many squares at once
+
+        Args:
+            vecs (np.array): integer array of shape (k, 4) with 4d vectors (x, y, t, m) of target spaces
+            kind (str): wether the piece we're moving is light or dark
+
+        Returns:
+            np.array: array of k values:
+                0 if impossible
+                1 if possible with eating a piece
+                2 if possible without eating a piece
+        """
+        vecs = np.asarray(vecs, dtype=np.int64).reshape(-1, 4)
+        x, y, time, mult = vecs.T
+        n = self.chessboard_size
+        t0, m0 = self.tm_grid_origin
+        rows, cols = self.tm_grid.shape
+        t_idx, m_idx = time - t0, mult - m0
+        # Cannot move outside of the board, or onto a board that doesn't exist
+        valid = (x >= 0) & (x < n) & (y >= 0) & (y < n) & \
+                (t_idx >= 0) & (t_idx < rows) & (m_idx >= 0) & (m_idx < cols)
+        # Invalid squares are redirected to (0, 0, 0) and masked out at the end
+        ids = np.where(valid, self.tm_grid[np.where(valid, t_idx, 0), np.where(valid, m_idx, 0)], -1)
+        valid &= ids >= 0
+        x, y, ids = np.where(valid, x, 0), np.where(valid, y, 0), np.where(valid, ids, 0)
+
+        if self.storage is not None:
+            values = self.storage.tensor[ids, x, y]
+        else: # Only stack the boards that are actually touched
+            board_ids, board_idx = np.unique(ids, return_inverse=True)
+            boards = np.stack([ self.chessboards[id].chessboard_matrix for id in board_ids ])
+            values = boards[board_idx, x, y].astype(np.intp)
+        colors = piece_color_codes[values]
+
+        # Empty: 2, own piece: 0, enemy piece: 1
+        move_possible_by_color = move_possible_light if kind == 'l' else move_possible_dark
+        return move_possible_by_color[colors] * valid
+
+    def get_multiverse_extent(self):
+        """
+        Returns the bounding box of the multiverse, as needed for move generation
+
+        Returns:
+            tuple: (chessboard size, min time, max time, min multiverse, max multiverse)
+        """
+        if self.tm_bounds is None: # No boards yet, so no ray can go anywhere in time
+            return (self.chessboard_size, 0, -1, 0, -1)
+        return (self.chessboard_size, *self.tm_bounds)
+
+    def vec_4d_to_3list(self, vec):
+        """
+        Converts an integer 4d vector to 3-list notation (i.e. (1,2,4,5)->['b3',4,5])
+        """
+        x, y, time, mult = vec
+        return [chess_utils_2d.matrix_to_chessform((x, y), self.chessboard_size), time, mult]
+
+    def vec_3list_to_4d(self, pos):
+        """
+        Converts a 3-list position to an integer 4d vector (i.e. ['b3',4,5]->(1,2,4,5))
+        """
+        square, time, mult = pos
+        x, y = chess_utils_2d.chessform_to_matrix(square, self.chessboard_size)
+        return (x, y, time, mult)
+
     def get_list_of_possible_moves(self, pos, force_single_moves=False):
         """
         Finds possible moves for a piece on the predefined square
@@ -291,11 +824,61 @@ class Chessboard_5D:
         Returns:
             list of all possible moves
         """
-        possible_moves = self.moves.get_all_movable_spaces(self.check_if_move_possible, 
-                                                           self.get_piece(pos), pos, 
-                                                           log=self.log, 
-                                                           force_single_moves=force_single_moves)
-        return possible_moves
+        piece = self.get_piece(pos)
+        possible_moves = self.get_movable_spaces_4d(piece, self.vec_3list_to_4d(pos), force_single_moves)
+        return [ self.vec_4d_to_3list(vec) for vec in possible_moves ]
+
+    def get_movable_spaces_4d(self, piece, pos_4d, force_single_moves=False):
+        """
+        Finds possible moves for a piece, staying on integer 4d vectors
+
+        Args:
+            piece (str): piece name acronym
+            pos_4d (tuple): integer 4d vector (x, y, t, m) of the piece
+            force_single_moves (bool): whether to force single-space moves for pieces 
+                that move >1 square in a line (i.e. rook)
+
+        Returns:
+            list: 4-tuples of all possible target spaces
+        """
+        if self.storage is not None: # All boards share one tensor, so squares can be read in batches
+            return self.moves.get_all_movable_spaces_batched(self.query_squares, piece, pos_4d, 
+                                                             self.get_multiverse_extent(), 
+                                                             log=self.log, 
+                                                             force_single_moves=force_single_moves)
+        return self.moves.get_all_movable_spaces_4d(self.check_if_move_possible_4d, 
+                                                    piece, pos_4d, log=self.log, 
+                                                    force_single_moves=force_single_moves, 
+                                                    extent=self.get_multiverse_extent())
+
+    def iter_movable_spaces_4d(self, piece, pos_4d, force_single_moves=False, force_noeat=0, target_boards=None):
+        """
+        Yields possible moves for a piece one by one, so that the caller can stop at the first one it needs
+
+        Args:
+            piece (str): piece name acronym
+            pos_4d (tuple): integer 4d vector (x, y, t, m) of the piece
+            force_single_moves (bool): whether to force single-space moves for pieces 
+                that move >1 square in a line (i.e. rook)
+            force_noeat (int): 0 (Default) for all moves, 1 for moves that eat pieces only, 2 for the other ones
+            target_boards (set): (time, multiverse) of boards to yield moves to. Defaults to None (all boards).
+
+        Yields:
+            tuple: 4d vectors of possible target spaces. Same spaces as get_movable_spaces_4d, 
+                grouped by target board (see Moves.iter_board_moves)
+        """
+        yield from self.moves.iter_board_moves(self.get_board_matrix, piece, tuple(int(i) for i in pos_4d), 
+                                               self.chessboard_size, force_single_moves=force_single_moves, 
+                                               force_noeat=force_noeat, target_boards=target_boards)
+
+    def get_board_matrix(self, time, mult):
+        """
+        Returns the matrix of the chessboard at (time, mult), or None if there is no chessboard there
+        """
+        id = self.tm_index.get((time, mult))
+        if id is None:
+            return None
+        return self.chessboards[id].chessboard_matrix
 
     def get_board_of_possible_moves(self, pos, force_single_moves=False):
         """
@@ -313,12 +896,157 @@ class Chessboard_5D:
         _, piece_color = list(piece)
         piece_to_add = "M" + piece_color
         possible_moves = self.get_list_of_possible_moves(pos, force_single_moves)
-        self_copy = copy.deepcopy(self)
+        self_copy = self.fork()
         for move in possible_moves:
-            if log: print(f"Looking at move {move}...")
+            if self.log: print(f"Looking at move {move}...")
             self_copy.add_piece(piece_to_add, move, eat_pieces=True)
         return self_copy
 
+    # Serialization
+
+    def serialize(self):
+        """
+        Packs all boards into a compact tuple of plain values, to send the multiverse 
+        to other processes. Rebuild it with chessboard_5d_from_serialized.
+
+        Returns:
+            tuple: (chessboard size, first turn black, storage type, 
+                    int32 bytes of (time, multiverse, origin) per board, int8 bytes of all boards)
+        """
+        storage = "tensor" if self.storage is not None else "list" if self.history is None else "delta"
+        return (self.chessboard_size, self.first_turn_black, storage, 
+                self.get_board_coords().tobytes(), self.get_board_tensor().tobytes())
+
+    def load_serialized(self, data):
+        """
+        Adds the boards of a serialized multiverse, in the same order. Should be called on an empty multiverse.
+
+        Args:
+            data (tuple): result of serialize
+        """
+        chessboard_size, _, _, coords, boards = data
+        n = chessboard_size
+        self.load_board_arrays(np.frombuffer(coords, dtype=np.int32).reshape(-1, 3), 
+                               np.frombuffer(boards, dtype=np.int8).reshape(-1, n, n))
+
+    def get_board_coords(self):
+        """
+        Returns:
+            np.array: int32 array of shape (num_boards, 3) with (time, multiverse, origin) of every board
+        """
+        if isinstance(self.chessboards, LazyChessboardList):
+            origins = self.chessboards.get_origins()
+        else:
+            origins = [ chessboard.origin for chessboard in self.chessboards ]
+        return np.array([ [tm_pos[0], tm_pos[1], origin] for tm_pos, origin in zip(self.timemult_coords, origins) ], 
+                        dtype=np.int32).reshape(-1, 3)
+
+    def load_board_arrays(self, coords, boards, zobrist_key=None):
+        """
+        Adds boards in bulk, in the same order. Should be called on an empty multiverse.
+        Indices are built with NumPy, and Chessboard_2D objects are only created for boards 
+        that are accessed (see LazyChessboardList).
+
+        Args:
+            coords (np.array): (time, multiverse, origin) of every board, shape (num_boards, 3)
+            boards (np.array): int8 matrices of the boards, shape (num_boards, n, n)
+            zobrist_key (int): Zobrist key of the multiverse, if known. 
+                Defaults to None, which computes it from the boards.
+        """
+        if self.chessboards:
+            raise ValueError("Boards can only be loaded in bulk into an empty multiverse")
+        n = self.chessboard_size
+        if boards.shape[1:] != (n, n):
+            raise ValueError(f"Loaded boards are {boards.shape[1]}x{boards.shape[2]}, not {n}x{n}")
+        if len(coords) != len(boards):
+            raise ValueError(f"Got coordinates of {len(coords)} boards for {len(boards)} boards")
+        num_boards = len(boards)
+        if num_boards == 0:
+            return
+        times, mults = coords[:, 0].astype(np.int64), coords[:, 1].astype(np.int64)
+        if self.storage is not None: # Tensor slots have the ids of the boards
+            if self.storage.num_boards == 0:
+                self.storage.grow(num_boards)
+                self.storage.tensor[:num_boards] = boards
+                self.storage.num_boards = num_boards
+                for id, (time, mult, origin) in enumerate(coords.tolist()):
+                    self.storage.set_board_location(id, time, mult, origin)
+            elif self.storage.num_boards != num_boards: # Otherwise the storage already holds the boards
+                raise ValueError(f"Storage holds {self.storage.num_boards} boards, not {num_boards}")
+            boards = self.storage.get_boards()
+        self.chessboards = LazyChessboardList(boards, coords[:, 2].copy(), self.build_loaded_chessboard)
+        self.timemult_coords = coords[:, :2].tolist()
+
+        # The first board at every location is the one that is indexed, as in register_chessboard
+        t0, m0 = int(times.min()), int(mults.min())
+        self.tm_bounds = [t0, int(times.max()), m0, int(mults.max())]
+        cols = self.tm_bounds[3] - m0 + 1
+        _, first_ids = np.unique((times - t0) * cols + (mults - m0), return_index=True)
+        first_ids.sort() # Index locations in the order they were registered
+        self.tm_grid = np.full([self.tm_bounds[1] - t0 + 1, cols], -1, dtype=np.int64)
+        self.tm_grid[times[first_ids] - t0, mults[first_ids] - m0] = first_ids
+        self.tm_grid_origin = (t0, m0)
+        self.tm_index = dict(zip(zip(times[first_ids].tolist(), mults[first_ids].tolist()), first_ids.tolist()))
+        for (time, mult), id in self.tm_index.items():
+            self.timeline_boards.setdefault(mult, {})[time] = id
+            if time > self.timeline_heads.get(mult, time - 1):
+                self.timeline_heads[mult] = time
+        self.max_mult_white = max(0, self.tm_bounds[3])
+        self.max_mult_black = min(0, m0)
+
+        if zobrist_key is None:
+            board_keys = get_zobrist_keys(n).board_keys(boards).tolist()
+            zobrist_key = 0
+            for key, time, mult in zip(board_keys, times.tolist(), mults.tolist()):
+                zobrist_key ^= position_key(key, time, mult)
+        self.zobrist_key = zobrist_key
+        for listener in self.board_listeners:
+            for time, mult in self.tm_index:
+                listener.on_board_change(time, mult)
+
+    def build_loaded_chessboard(self, id):
+        """
+        Creates the Chessboard_2D of a board loaded by load_board_arrays, when it's first accessed
+        """
+        chessboards = self.chessboards
+        chessboard_loc = self.timemult_coords[id]
+        origin = int(chessboards.origins[id])
+        if self.storage is not None:
+            chessboard = Chessboard_2D(chessboard_tm_pos=chessboard_loc, n=self.chessboard_size, origin=origin, 
+                                       storage=self.storage, storage_id=id)
+        else:
+            chessboard = Chessboard_2D(chessboard_tm_pos=chessboard_loc, n=self.chessboard_size, origin=origin)
+            chessboard.chessboard_matrix = chessboards.boards[id].astype(chessboard.chessboard_matrix.dtype)
+            chessboard.history = self.history
+        chessboard.key_listener = self.on_board_key_change
+        return chessboard
+
+    def flush(self):
+        """
+        Writes the boards and counters of a multiverse with memmap storage to its board file, 
+        so that other processes can open it with open_chessboard_5d
+        """
+        if not isinstance(self.storage, BoardMemmapStorage):
+            raise ValueError("Only multiverses with memmap storage can be flushed")
+        self.storage.flush(first_turn_black=self.first_turn_black, max_mult_white=self.max_mult_white, 
+                           max_mult_black=self.max_mult_black, present=self.present, zobrist_key=self.zobrist_key)
+
+    def save(self, path):
+        """
+        Writes the multiverse into a compact binary file (see board_file_header), 
+        to be read back with load_chessboard_5d
+
+        Args:
+            path (str): path of the file
+        """
+        header = board_file_header.pack(board_file_magic, board_file_version, self.chessboard_size, 
+                                        self.first_turn_black, len(self.chessboards), self.max_mult_white, 
+                                        self.max_mult_black, self.present, self.zobrist_key)
+        with open(path, "wb") as f:
+            f.write(header)
+            f.write(self.get_board_coords().tobytes())
+            f.write(self.get_board_tensor().tobytes())
+
     # Utility functions
 
     def movement_list_5d_err(self, list_5d, list_name="list_5d"):
@@ -338,15 +1066,112 @@ class Chessboard_5D:
         if type(list_5d[2]) != int:
             raise ValueError(f"3rd entry of {list_name} should be an integer. You have: {type(list_5d[2])}")
 
+    def get_board_tensor(self):
+        """
+        Get all chessboards as a single array, i.e. for vectorized multiverse-wide queries
+
+        Returns:
+            np.array: int8 array of shape (num_boards, n, n), ordered by chessboard id.
+                A view into the storage for tensor storage, a new array for list storage.
+        """
+        if self.storage is not None:
+            return self.storage.get_boards()
+        if isinstance(self.chessboards, LazyChessboardList):
+            return self.chessboards.get_board_tensor()
+        n = self.chessboard_size
+        if len(self.chessboards) == 0:
+            return np.zeros([0, n, n], dtype=np.int8)
+        return np.stack([chessboard.chessboard_matrix for chessboard in self.chessboards]).astype(np.int8)
+
     def get_max_time_from_multi(self, mult):
         """
         Get a maximum existing time coordinate for a certain timeline (multiverse id) value.
         """
-        timeline_times = []
-        for element in self.timemult_coords:
-            if element[1] == mult:
-                timeline_times.append(element[0])
-        return max(timeline_times)
+        if mult not in self.timeline_heads:
+            raise ValueError(f"No timeline with multiverse id {mult}")
+        return self.timeline_heads[mult]
+
+
+def chessboard_5d_from_serialized(data):
+    """
+    Rebuilds a multiverse from the result of Chessboard_5D.serialize
+
+    Returns:
+        Chessboard_5D: the multiverse
+    """
+    chessboard_size, first_turn_black, storage = data[:3]
+    chess5 = Chessboard_5D(chessboard_size=chessboard_size, first_turn_black=first_turn_black, storage=storage)
+    chess5.load_serialized(data)
+    return chess5
+
+
+def read_board_file_header(path):
+    """
+    Reads and checks the header of a binary multiverse file written by Chessboard_5D.save
+
+    Returns:
+        tuple: (chessboard size, first turn black, number of boards, max_mult_white, 
+                max_mult_black, present, zobrist key)
+    """
+    with open(path, "rb") as f:
+        data = f.read(board_file_header.size)
+    if len(data) < board_file_header.size:
+        raise ValueError(f"{path} is too short to be a multiverse file")
+    magic, version, *header = board_file_header.unpack(data)
+    if magic != board_file_magic:
+        raise ValueError(f"{path} is not a multiverse file")
+    if version != board_file_version:
+        raise ValueError(f"Unsupported multiverse file version {version}, expected {board_file_version}")
+    return tuple(header)
+
+
+def load_chessboard_5d(path, storage="list"):
+    """
+    Loads a multiverse saved with Chessboard_5D.save. Boards are read in bulk,
+    and Chessboard_2D objects are only built for boards that are accessed.
+
+    Args:
+        path (str): path of the file
+        storage (str): storage type of the new Chessboard_5D (list, tensor or delta)
+
+    Returns:
+        Chessboard_5D: the multiverse
+    """
+    n, first_turn_black, num_boards, max_mult_white, max_mult_black, present, zobrist_key = read_board_file_header(path)
+    offset = board_file_header.size
+    coords = np.fromfile(path, dtype=np.int32, count=3 * num_boards, offset=offset).reshape(-1, 3)
+    offset += coords.nbytes
+    boards = np.fromfile(path, dtype=np.int8, count=num_boards * n * n, offset=offset).reshape(-1, n, n)
+    if len(boards) != num_boards:
+        raise ValueError(f"{path} is truncated: {len(boards)} of {num_boards} boards")
+    chess5 = Chessboard_5D(chessboard_size=n, first_turn_black=first_turn_black, storage=storage)
+    chess5.load_board_arrays(coords, boards, zobrist_key=zobrist_key)
+    chess5.max_mult_white, chess5.max_mult_black, chess5.present = max_mult_white, max_mult_black, present
+    return chess5
+
+
+def open_chessboard_5d(path, mode="r"):
+    """
+    Opens a multiverse kept in a board file of memmap storage (see Chessboard_5D.flush). 
+    Boards are zero-copy views into the file, and Chessboard_2D objects are only built 
+    for boards that are accessed.
+
+    Args:
+        path (str): path of the board file
+        mode (str): r (Default) to open read-only, the boards can then be read but no moves made, 
+            or r+ to also add boards
+
+    Returns:
+        Chessboard_5D: the multiverse
+    """
+    header = read_memmap_header(path)
+    storage = BoardMemmapStorage(path, mode=mode)
+    chess5 = Chessboard_5D(chessboard_size=header.chessboard_size, first_turn_black=header.first_turn_black, 
+                           storage=storage)
+    chess5.load_board_arrays(storage.get_board_coords(), storage.get_boards(), zobrist_key=header.zobrist_key)
+    chess5.max_mult_white, chess5.max_mult_black = header.max_mult_white, header.max_mult_black
+    chess5.present = header.present
+    return chess5
 
 
 
@@ -354,7 +1179,7 @@ class ChessTests():
     """Various tests for 2D/5D chessboard"""
     def __init__(self):
         self.chess2 = Chessboard_2D()
-        self.chess2utils = ChessUtils_2D()
+        self.chess2utils = chess_utils_2d
         self.chess5 = Chessboard_5D()
         self.moves = Moves()
 
@@ -379,26 +1204,7 @@ class ChessTests():
         Has an option to add a pawn row to check if eating pieces works.
         """
         n = 1 # How many chessboards to add in positive direction - total is 2n+1
-        pos = ['d5', 2*n, 0] # position of the piece
-        pawns_row_chessboard = [ pos[1], pos[2] ]
-        pawns_row_square = pos[0]
-        pawns_row_increment = 1
-        for i in range(-n, n+1):
-            for j in range(2*n+1):
-                self.chess5.add_empty_chessboard([j,i])
-                print([j,i])
-        self.chess5.add_piece(piece, pos)
-        _, piece_color = list(piece)
-        if pawns_row:
-            pawn = self.chess2utils.light_to_dark_piece("p" + piece_color)
-            if piece_color == 'd':
-                pawns_row_increment = -pawns_row_increment
-            row_loc = self.chess2utils.chessform_to_matrix(pawns_row_square)
-            row_id = row_loc[0] + pawns_row_increment + 1
-            target_id = self.chess5.get_chessboard_by_tm(pawns_row_chessboard)
-            print(pawns_row_chessboard)
-            target_chessboard = self.chess5.chessboards[target_id]
-            target_chessboard.create_row_of_pieces(row_id, pawn)
+        pos = self.chess5.movement_grid_setup(piece, n=n, pawns_row=pawns_row, log=log)
         self.moves_board = self.chess5.get_board_of_possible_moves(pos)
         for t in range(0, 2*n + 1):
             self.moves_board.print_chessboard([t, -1])
@@ -412,10 +1218,572 @@ class ChessTests():
         self.chess2.default_chess_configuration_setup()
         self.chess2.print_chessboard()
 
+    def zobrist_random_moves(self, num_games=4, num_moves=40, storage="list"):
+        """
+        Plays random moves on the latest boards of every timeline and checks that the
+        incrementally updated Zobrist key stays equal to the key computed from scratch.
+        A fork of the multiverse has to keep the key and to change it independently.
+
+        Args:
+            num_games (int): number of games, every game uses its own seed
+            num_moves (int): number of half-moves per game
+            storage (str): storage type of Chessboard_5D (list, tensor or delta)
+        """
+        import random
+        num_checked = 0
+        for seed in range(num_games):
+            rng = random.Random(seed)
+            chess5 = Chessboard_5D(storage=storage)
+            chess5.default_chess_configuration_setup()
+            for i in range(num_moves):
+                moves_list = []
+                for mult, time in chess5.timeline_heads.items():
+                    chessboard = chess5.chessboards[chess5.get_chessboard_by_tm([time, mult])]
+                    color = 'l' if (time + chess5.first_turn_black) % 2 == 0 else 'd' # player to move on the board
+                    for square_mx in np.argwhere(chessboard.chessboard_matrix != 0):
+                        pos = [chessboard.utils.matrix_to_chessform(square_mx, chess5.chessboard_size), time, mult]
+                        if chess5.get_piece(pos)[1] != color:
+                            continue
+                        moves_list += [ (pos, move) for move in chess5.get_list_of_possible_moves(pos) ]
+                if not moves_list:
+                    break
+                chess5.movie_piece(*rng.choice(moves_list))
+                assert chess5.zobrist_key == chess5.compute_zobrist_key(), f"Wrong Zobrist key after move {i}"
+                num_checked += 1
+
+            chess5_fork = chess5.fork()
+            assert chess5_fork.zobrist_key == chess5.zobrist_key, "Fork has a different Zobrist key"
+            zobrist_key = chess5.zobrist_key
+            mult, time = next(iter(chess5_fork.timeline_heads.items()))
+            chess5_fork.evolve_chessboard([time, mult])
+            assert chess5_fork.zobrist_key == chess5_fork.compute_zobrist_key(), "Wrong Zobrist key of the fork"
+            assert chess5_fork.zobrist_key != zobrist_key, "Zobrist key of the fork did not change"
+            assert chess5.zobrist_key == zobrist_key == chess5.compute_zobrist_key(), "Fork changed the key"
+        print(f"Zobrist key matched after {num_checked} random moves ({storage} storage)")
+
+    def legal_moves_brute_force(self, num_games=6, num_moves=30, storage="list"):
+        """
+        Plays random games and compares LegalMoveGenerator with brute-force forward checking:
+        a pseudo-legal move is legal if no pseudo-legal move of the opponent afterwards
+        captures a royal piece. Also times legal move generation on the positions reached.
+
+        Args:
+            num_games (int): number of games, game i is played with random seed i
+            num_moves (int): number of half-moves per game
+            storage (str): storage type of Chessboard_5D (list, tensor or delta)
+
+        Returns:
+            int: number of pseudo-legal moves compared
+        """
+        import io, time, random, contextlib
+        from chess_db_2d import pieces_dict
+        from legal_moves import LegalMoveGenerator, royal_types
+
+        def brute_force_in_check(chess5, generator, color):
+            opponent = 'd' if color == 'l' else 'l'
+            for origin, target, piece in generator.get_pseudo_legal_moves(opponent):
+                id = chess5.tm_index[(target[2], target[3])]
+                captured = pieces_dict[int(chess5.chessboards[id].chessboard_matrix[target[0], target[1]])]
+                if captured and (captured[1] == color) and (captured[0] in royal_types):
+                    return True
+            return False
+
+        num_compared, num_legal, legal_time = 0, 0, 0.
+        for game in range(num_games):
+            rng = random.Random(game)
+            chess5 = Chessboard_5D(storage=storage)
+            with contextlib.redirect_stdout(io.StringIO()): # The setup prints the boards
+                chess5.default_chess_configuration_setup()
+            generator = LegalMoveGenerator(chess5)
+            for i in range(num_moves):
+                color = chess5.get_player_to_move()
+                start = time.perf_counter()
+                legal_moves = generator.get_legal_moves()
+                legal_time += time.perf_counter() - start
+                num_legal += len(legal_moves)
+                legal = set((move.origin, move.target) for move in legal_moves)
+                for origin, target, piece in generator.get_pseudo_legal_moves(color):
+                    state = chess5.checkpoint()
+                    zobrist_key = chess5.zobrist_key
+                    chess5.movie_piece_4d(origin, target)
+                    in_check = brute_force_in_check(chess5, generator, color)
+                    chess5.rollback(state)
+                    assert chess5.zobrist_key == zobrist_key, "Rollback did not restore the Zobrist key"
+                    assert in_check != ((origin, target) in legal), \
+                        f"Game {game}, move {i}: {piece} {origin}->{target} is " + \
+                        ("legal" if in_check else "illegal") + " by brute force"
+                    num_compared += 1
+                if not legal_moves:
+                    break
+                move = legal_moves[rng.randrange(len(legal_moves))]
+                chess5.movie_piece_4d(move.origin, move.target)
+
+        print(f"Compared {num_compared} pseudo-legal moves with brute force ({storage} storage), no mismatches")
+        print(f"Legal move generation: {num_legal / legal_time:.0f} legal moves/s")
+        return num_compared
+    def perft(self, depth=2, storage="list"):
+        """
+        Counts legal moves to a given depth on the fixed perft positions and times it
+
+        Args:
+            depth (int): number of moves to look ahead
+            storage (str): storage type of Chessboard_5D (list, tensor or delta)
+        """
+        from perft import run_perft_suite
+        return run_perft_suite(depth, storage=storage)
+
+    def mate_puzzles(self, storage="list"):
+        """
+        Solves the mate puzzles and checks that each one is mated at its stated length
+
+        Args:
+            storage (str): storage type of Chessboard_5D (list, tensor or delta)
+        """
+        from mate_solver import mate_puzzles, solve_mate_puzzles
+        results = solve_mate_puzzles(storage=storage)
+        for name, result in results.items():
+            assert result.mate_in == mate_puzzles[name][1], f"{name}: mate in {result.mate_in}"
+            assert len(result.line) > 0, f"{name}: no mating line"
+        return results
+
+    def attack_maps_consistency(self, num_games=4, num_moves=30, num_trial_moves=4, storage="list"):
+        """
+        Follows seeded self-play games with AttackMaps, and checks after every move, rollback
+        and MoveJournal.unmake that the incrementally updated maps equal maps built from scratch, 
+        and that their is_in_check agrees with LegalMoveGenerator.is_in_check
+
+        Args:
+            num_games (int): number of games, see selfplay.play_game
+            num_moves (int): number of half-moves per game
+            num_trial_moves (int): number of legal moves made and rolled back at every position
+            storage (str): storage type of Chessboard_5D (list, tensor or delta)
+
+        Returns:
+            int: number of positions checked
+        """
+        import random
+        from attack_maps import AttackMaps
+        from perft import setup_perft_position
+        from selfplay import play_game, decode_moves
+        from legal_moves import LegalMoveGenerator
+        from move_journal import MoveJournal
+
+        def check_attack_maps(chess5, attack_maps, generator, vec):
+            rebuilt = AttackMaps(chess5)
+            for color in ('l', 'd'):
+                assert attack_maps.is_in_check(color) == generator.is_in_check(color), f"is_in_check({color}) differs"
+                assert attack_maps.is_attacked(vec, color) == rebuilt.is_attacked(vec, color), \
+                    f"is_attacked({vec}, {color}) differs from a rebuild"
+                for id in chess5.tm_index.values():
+                    for turn in (None, 'l', 'd'):
+                        assert np.array_equal(attack_maps.get_attack_map(id, color, turn),
+                                              rebuilt.get_attack_map(id, color, turn)), \
+                            f"Attack map of board {id} ({color}, turn {turn}) differs from a rebuild"
+            rebuilt.close()
+
+        num_checked = 0
+        for seed in range(num_games):
+            rng = random.Random(seed)
+            record = play_game(seed, max_plies=num_moves, storage=storage)
+            chess5 = setup_perft_position(record.start, storage=storage)
+            generator = LegalMoveGenerator(chess5)
+            attack_maps = AttackMaps(chess5)
+            journal = MoveJournal(chess5)
+            for origin, target in decode_moves(record.moves):
+                legal_moves = generator.get_legal_moves()
+                for move in rng.sample(legal_moves, min(num_trial_moves, len(legal_moves))):
+                    state = chess5.checkpoint()
+                    generator.make_move(move.origin, move.target)
+                    check_attack_maps(chess5, attack_maps, generator, move.target)
+                    chess5.rollback(state)
+                    check_attack_maps(chess5, attack_maps, generator, move.target)
+                    journal.movie_piece_4d(move.origin, move.target)
+                    check_attack_maps(chess5, attack_maps, generator, move.target)
+                    journal.unmake()
+                    check_attack_maps(chess5, attack_maps, generator, move.target)
+                    num_checked += 4
+                generator.make_move(origin, target)
+                check_attack_maps(chess5, attack_maps, generator, target)
+                num_checked += 1
+            attack_maps.close()
+        print(f"Attack maps matched a rebuild and LegalMoveGenerator in {num_checked} positions ({storage} storage)")
+        return num_checked
+
+    def evaluator_consistency(self, num_games=4, num_moves=30, num_trial_moves=4, storage="list"):
+        """
+        Follows seeded self-play games with one Evaluator and checks that:
+            material and mobility of every timeline head equal a plain count over its squares,
+            the timeline term counts timelines by the player whose move created them,
+            scores after every move and rollback equal the scores of a new Evaluator
+
+        Args:
+            num_games (int): number of games, see selfplay.play_game
+            num_moves (int): number of half-moves per game
+            num_trial_moves (int): number of legal moves made and rolled back at every position
+            storage (str): storage type of Chessboard_5D (list, tensor or delta)
+
+        Returns:
+            int: number of positions checked
+        """
+        import random
+        from chess_db_2d import pieces_dict
+        from moves import dr_tables
+        from evaluation import Evaluator, material_values
+        from perft import setup_perft_position
+        from selfplay import play_game, decode_moves
+        from legal_moves import LegalMoveGenerator
+
+        def plain_board_terms(matrix):
+            # Material and on-board moves of light minus dark, one square at a time
+            n = matrix.shape[0]
+            material, mobility = 0, 0
+            for x in range(n):
+                for y in range(n):
+                    piece = pieces_dict[int(matrix[x, y])]
+                    if (not piece) or (piece[0] == 'M'):
+                        continue
+                    piece_type, color = piece[0], piece[1]
+                    sign = 1 if color == 'l' else -1
+                    material += sign * material_values[piece_type]
+                    if piece_type in ('p', 'B'): # Moves to empty squares, captures to enemy pieces
+                        moves = [ (dr, 1, False, True) for dr in dr_tables[piece_type] ] + \
+                                [ (dr, 1, True, False) for dr in dr_tables[piece_type + "_eat"] ]
+                        moves = [ ((sign * dr[0], sign * dr[1], dr[2], dr[3]), *move) for dr, *move in moves ]
+                    else:
+                        max_steps = 1 if piece_type in ('k', 'c', 'n') else n
+                        moves = [ (dr, max_steps, True, True) for dr in dr_tables[piece_type] ]
+                    for (dx, dy, dt, dm), max_steps, captures, quiet_moves in moves:
+                        if (dt, dm) != (0, 0):
+                            continue
+                        for step in range(1, max_steps + 1):
+                            x2, y2 = x + step * dx, y + step * dy
+                            if not ((0 <= x2 < n) and (0 <= y2 < n)):
+                                break
+                            target = pieces_dict[int(matrix[x2, y2])]
+                            if not target:
+                                mobility += sign * quiet_moves
+                                continue
+                            mobility += sign * (captures and target[1] != color)
+                            break
+            return material, mobility
+
+        num_checked = 0
+        for seed in range(num_games):
+            rng = random.Random(seed)
+            record = play_game(seed, max_plies=num_moves, storage=storage)
+            chess5 = setup_perft_position(record.start, storage=storage)
+            generator = LegalMoveGenerator(chess5)
+            evaluator = Evaluator(chess5)
+            creators = {} # multiverse -> player whose move created the timeline
+            for origin, target in decode_moves(record.moves):
+                legal_moves = generator.get_legal_moves()
+                for move in rng.sample(legal_moves, min(num_trial_moves, len(legal_moves))):
+                    state = chess5.checkpoint()
+                    generator.make_move(move.origin, move.target)
+                    assert evaluator.evaluate_terms() == Evaluator(chess5).evaluate_terms(), f"Scores differ after {move}"
+                    chess5.rollback(state)
+                    assert evaluator.evaluate_terms() == Evaluator(chess5).evaluate_terms(), f"Scores differ after rollback"
+                    num_checked += 2
+
+                color, mults = chess5.get_player_to_move(), set(chess5.timeline_heads)
+                generator.make_move(origin, target)
+                for mult in set(chess5.timeline_heads) - mults:
+                    creators[mult] = color
+                terms = evaluator.evaluate_terms()
+                assert terms == Evaluator(chess5).evaluate_terms(), "Scores differ along the game"
+                material, mobility = 0, 0
+                for mult, time in chess5.timeline_heads.items():
+                    id = chess5.tm_index[(time, mult)]
+                    board_terms = plain_board_terms(chess5.chessboards[id].chessboard_matrix)
+                    assert evaluator.board_cache[id][1:] == board_terms, f"Board {id}: {board_terms} by plain count"
+                    material, mobility = material + board_terms[0], mobility + board_terms[1]
+                    assert chess5.get_timeline_creator(mult) == creators.get(mult), f"Wrong creator of timeline {mult}"
+                timelines = sum(1 if color == 'l' else -1 for color in creators.values())
+                assert terms == (material, evaluator.mobility_weight * mobility, evaluator.timeline_weight * timelines)
+                num_checked += 1
+        print(f"Evaluator matched plain counts and a new Evaluator in {num_checked} positions ({storage} storage)")
+        return num_checked
+
+    def timeline_creators(self, storage="list"):
+        """
+        Branches a timeline from an odd timeline, where a move of dark creates a timeline with a
+        positive multiverse id, and checks that the timeline is counted for dark
+
+        Args:
+            storage (str): storage type of Chessboard_5D (list, tensor or delta)
+        """
+        from evaluation import Evaluator
+        chess5 = Chessboard_5D(storage=storage)
+        chess5.add_empty_chessboard([0, 0])
+        for piece, square in (("kl", "a1"), ("rl", "d4"), ("nl", "e5"), ("rd", "g7"), ("kd", "h8")):
+            chess5.add_piece(piece, [square, 0, 0])
+        chess5.movie_piece_4d((3, 3, 0, 0), (3, 4, 0, 0)) # Light, on timeline 0
+        chess5.movie_piece_4d((6, 6, 1, 0), (6, 5, 1, 0)) # Dark, on timeline 0
+        chess5.movie_piece_4d((3, 4, 2, 0), (3, 5, 1, 0)) # Light rook travels back and creates timeline 1
+        chess5.movie_piece_4d((4, 4, 2, 1), (5, 6, 2, 1)) # Light, on timeline 1
+        state = chess5.checkpoint()
+        chess5.movie_piece_4d((6, 5, 3, 0), (6, 2, 2, 1)) # Dark rook travels to timeline 1
+        assert sorted(chess5.timeline_heads) == [0, 1, 2], f"Unexpected timelines {sorted(chess5.timeline_heads)}"
+        creators = { mult: chess5.get_timeline_creator(mult) for mult in chess5.timeline_heads }
+        assert creators == { 0: None, 1: 'l', 2: 'd' }, f"Wrong timeline creators {creators}"
+
+        evaluator = Evaluator(chess5)
+        assert evaluator.evaluate_terms().timelines == 0, "Timeline 2 was not counted for dark"
+        chess5.rollback(state)
+        assert evaluator.evaluate_terms().timelines == evaluator.timeline_weight, "Timeline 1 is light's only timeline"
+        assert evaluator.evaluate_terms() == Evaluator(chess5).evaluate_terms(), "Scores differ after rollback"
+        print(f"Timeline creators: {creators} ({storage} storage)")
+
+    @staticmethod
+    def get_position_state(chess5):
+        """
+        Returns everything that makes up a position, to compare positions with ==
+        """
+        return (chess5.zobrist_key, chess5.compute_zobrist_key(), chess5.get_player_to_move(),
+                chess5.get_board_coords().tolist(), chess5.get_board_tensor().tobytes(), dict(chess5.tm_index),
+                sorted(chess5.timeline_heads.items()), chess5.tm_bounds, chess5.max_mult_white, chess5.max_mult_black)
+
+    def save_load_round_trip(self, num_games=4, num_moves=60):
+        """
+        Saves positions of random games with Chessboard_5D.save and loads them back
+        in list and tensor storage. Loaded positions must be equal and have the same legal moves.
+
+        Args:
+            num_games (int): number of games, see selfplay.play_game
+            num_moves (int): number of half-moves per game
+        """
+        import os, tempfile
+        from selfplay import play_game, replay_game
+        from legal_moves import LegalMoveGenerator
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "position.5dcb")
+            for seed in range(num_games):
+                chess5 = replay_game(play_game(seed, max_plies=num_moves))
+                chess5.save(path)
+                legal_moves = LegalMoveGenerator(chess5).get_legal_moves()
+                for storage in ("list", "tensor"):
+                    loaded = load_chessboard_5d(path, storage=storage)
+                    assert self.get_position_state(loaded) == self.get_position_state(chess5), \
+                        f"Game {seed}: loaded position ({storage} storage) differs"
+                    assert LegalMoveGenerator(loaded).get_legal_moves() == legal_moves, \
+                        f"Game {seed}: loaded position ({storage} storage) has other legal moves"
+                    assert all(loaded.get_timeline_creator(mult) == chess5.get_timeline_creator(mult)
+                               for mult in loaded.timeline_heads), \
+                        f"Game {seed}: loaded position ({storage} storage) has other timeline creators"
+        print(f"Saved and loaded {num_games} positions")
+
+    def memmap_round_trip(self, num_games=4, num_moves=60):
+        """
+        Plays random games on memmap storage, reopens the board files with open_chessboard_5d
+        and compares them with the same games played with list storage
+
+        Args:
+            num_games (int): number of games, see selfplay.play_game
+            num_moves (int): number of half-moves per game
+        """
+        import os, tempfile
+        from perft import setup_perft_position
+        from selfplay import play_game, decode_moves
+        from legal_moves import LegalMoveGenerator
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "position.5dcm")
+            for seed in range(num_games):
+                record = play_game(seed, max_plies=num_moves)
+                chess5 = setup_perft_position(record.start)
+                mapped = Chessboard_5D(storage="memmap", storage_path=path)
+                mapped.load_board_arrays(chess5.get_board_coords(), chess5.get_board_tensor())
+                for origin, target in decode_moves(record.moves):
+                    chess5.movie_piece_4d(origin, target)
+                    mapped.movie_piece_4d(origin, target)
+                mapped.flush()
+                legal_moves = LegalMoveGenerator(chess5).get_legal_moves()
+                for mode in ("r", "r+"):
+                    opened = open_chessboard_5d(path, mode=mode)
+                    assert self.get_position_state(opened) == self.get_position_state(chess5), \
+                        f"Game {seed}: reopened position (mode {mode}) differs"
+                    assert LegalMoveGenerator(opened).get_legal_moves() == legal_moves, \
+                        f"Game {seed}: reopened position (mode {mode}) has other legal moves"
+        print(f"Reopened {num_games} memory-mapped positions")
+
+    def shared_snapshots(self, num_moves=40, storage="list"):
+        """
+        Publishes a random game into shared memory move by move, while snapshots are read.
+        A loaded snapshot must stay the position it was published as, a snapshot replaced 
+        during a read must be caught as stale, and moves on a loaded snapshot must stay private.
+
+        Args:
+            num_moves (int): number of half-moves of the game, see selfplay.play_game
+            storage (str): storage type of the published Chessboard_5D (list, tensor or delta)
+        """
+        import gc, threading
+        from perft import setup_perft_position
+        from selfplay import play_game, decode_moves
+        from shared_multiverse import SharedMultiverse, SharedMultiverseReader
+        record = play_game(0, max_plies=num_moves, storage=storage)
+        chess5 = setup_perft_position(record.start, storage=storage)
+        moves = decode_moves(record.moves)
+        shared = SharedMultiverse(chess5)
+        reader = SharedMultiverseReader(shared.name)
+        states = { shared.version: self.get_position_state(chess5) } # Published positions by version
+
+        # A publish while a snapshot is read: boards built afterwards still come from the old snapshot
+        loaded = reader.load()
+        version = reader.version
+        chess5.movie_piece_4d(*moves[0])
+        states[shared.publish()] = self.get_position_state(chess5)
+        assert reader.is_stale(), "A newer snapshot was not noticed"
+        assert self.get_position_state(loaded) == states[version], "The loaded snapshot was overwritten"
+        try:
+            reader.load(version=version)
+            raise AssertionError(f"Replaced snapshot {version} was loaded")
+        except ValueError:
+            pass
+        loaded = reader.load(version=shared.version)
+        loaded.movie_piece_4d(*moves[1])
+        assert self.get_position_state(reader.load()) == states[shared.version], "A move changed the shared snapshot"
+
+        # The rest of the game is published by another thread while snapshots are loaded
+        def publish_game():
+            for origin, target in moves[1:]:
+                chess5.movie_piece_4d(origin, target)
+                states[shared.version + 2] = self.get_position_state(chess5)
+                shared.publish()
+        thread = threading.Thread(target=publish_game)
+        thread.start()
+        num_loads, num_stale = 0, 0
+        while thread.is_alive():
+            loaded = reader.load()
+            version = reader.version
+            assert self.get_position_state(loaded) == states[version], f"Snapshot {version} was torn"
+            num_loads += 1
+            if reader.is_stale():
+                num_stale += 1
+                try:
+                    reader.load(version=version)
+                    raise AssertionError(f"Replaced snapshot {version} was loaded")
+                except ValueError:
+                    pass
+        thread.join()
+        assert self.get_position_state(reader.load()) == self.get_position_state(chess5), "The last snapshot differs"
+        del loaded
+        gc.collect() # Boards of loaded multiverses must be freed before detaching
+        reader.close()
+        shared.close()
+        print(f"Loaded {num_loads} snapshots while {len(moves)} were published, {num_stale} caught as stale "+
+              f"({storage} storage)")
+
+    def journal_undo_redo(self, num_games=4, num_moves=40, storage="list"):
+        """
+        Plays random games through a MoveJournal, with some piece edits in between, then undoes
+        and redoes all changes. Every undo and redo must give back the position it had before,
+        with the same Zobrist key.
+
+        Args:
+            num_games (int): number of games, see selfplay.play_game
+            num_moves (int): number of half-moves per game
+            storage (str): storage type of Chessboard_5D (list, tensor or delta)
+        """
+        import random
+        from perft import setup_perft_position
+        from selfplay import play_game, decode_moves
+        from move_journal import MoveJournal
+        for seed in range(num_games):
+            rng = random.Random(seed)
+            record = play_game(seed, max_plies=num_moves, storage=storage)
+            chess5 = setup_perft_position(record.start, storage=storage)
+            journal = MoveJournal(chess5)
+            states = [ self.get_position_state(chess5) ]
+            for origin, target in decode_moves(record.moves):
+                if rng.random() < 0.2: # Put a piece or a move marker on a random square, or empty it
+                    time, mult = rng.choice(list(chess5.tm_index))
+                    journal.set_piece(rng.choice(["", "Ml", "pd"]), (rng.randrange(8), rng.randrange(8), time, mult))
+                    states.append(self.get_position_state(chess5))
+                journal.movie_piece_4d(origin, target)
+                states.append(self.get_position_state(chess5))
+            for i in range(len(states) - 1, 0, -1):
+                journal.unmake()
+                assert self.get_position_state(chess5) == states[i - 1], f"Game {seed}: undo of change {i} differs"
+            for i in range(1, len(states)):
+                journal.redo()
+                assert self.get_position_state(chess5) == states[i], f"Game {seed}: redo of change {i} differs"
+        print(f"Undid and redid {num_games} games ({storage} storage)")
+
+    def delta_storage_matrices(self, num_games=4, num_moves=80):
+        """
+        Plays random games with list and delta storage, and compares the matrices
+        of all boards after every move, including past boards kept as deltas
+
+        Args:
+            num_games (int): number of games, see selfplay.play_game
+            num_moves (int): number of half-moves per game
+        """
+        from perft import setup_perft_position
+        from selfplay import play_game, decode_moves
+        for seed in range(num_games):
+            record = play_game(seed, max_plies=num_moves)
+            chess5 = setup_perft_position(record.start)
+            delta = setup_perft_position(record.start, storage="delta")
+            for i, (origin, target) in enumerate(decode_moves(record.moves)):
+                chess5.movie_piece_4d(origin, target)
+                delta.movie_piece_4d(origin, target)
+                assert len(delta.chessboards) == len(chess5.chessboards)
+                for id, chessboard in enumerate(chess5.chessboards):
+                    assert np.array_equal(delta.chessboards[id].chessboard_matrix, chessboard.chessboard_matrix), \
+                        f"Game {seed}, move {i}: board {id} differs"
+            assert self.get_position_state(delta) == self.get_position_state(chess5), f"Game {seed}: positions differ"
+            assert any(chessboard.is_compressed() for chessboard in delta.chessboards), \
+                f"Game {seed}: no board was kept as a delta"
+        print(f"Delta storage matches list storage on {num_games} games")
+
+    def benchmark_move_replay(self, num_moves=400, storage="list"):
+        """
+        Replays knight moves back and forth on a single timeline and compares
+        copy-on-write board evolution with deep-copying every evolved board.
+
+        Args:
+            num_moves (int): number of half-moves to replay
+            storage (str): storage type of Chessboard_5D (list, tensor or delta)
+        """
+        import time, tracemalloc
+        knight_moves = [ ['g1', 'f3'], ['g8', 'f6'], ['f3', 'g1'], ['f6', 'g8'] ]
+
+        def replay():
+            chess5 = Chessboard_5D(storage=storage)
+            chess5.default_chess_configuration_setup()
+            for i in range(num_moves):
+                square1, square2 = knight_moves[i % len(knight_moves)]
+                chess5.movie_piece([square1, i, 0], [square2, i, 0])
+            return chess5
+
+        # Timing and memory are measured in separate runs, since tracemalloc slows down allocations
+        start = time.perf_counter()
+        replay()
+        replay_time = time.perf_counter() - start
+        tracemalloc.start()
+        chess5 = replay()
+        replay_memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Cost of a single board evolution with and without copy-on-write
+        chessboard = chess5.chessboards[-1]
+        start = time.perf_counter()
+        for i in range(num_moves):
+            copy.deepcopy(chessboard)
+        deepcopy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(num_moves):
+            chessboard.fork(chessboard.chessboard_tm_pos)
+        fork_time = time.perf_counter() - start
+
+        print(f"Replayed {num_moves} moves ({storage} storage) in {replay_time:.4f} s, "+
+              f"{1e6 * replay_time / num_moves:.1f} us per move")
+        print(f"Memory per board: {replay_memory / len(chess5.chessboards):.0f} bytes")
+        print(f"Board evolution: deepcopy {1e6 * deepcopy_time / num_moves:.1f} us, "+
+              f"copy-on-write {1e6 * fork_time / num_moves:.1f} us")
+
 
 
 if __name__ == "__main__":
     tests = ChessTests()
     log = False
     tests.test_movement('pd', pawns_row=True, log=log)
-
@@ -0,0 +1,397 @@
+import numpy as np
+import os
+import struct
+from collections import namedtuple, OrderedDict
+
+# Board files of BoardMemmapStorage: a header padded to memmap_header_size bytes, then one 
+# fixed-size record of (time, multiverse, origin, board matrix) per storage slot. The header holds 
+# the magic bytes, the format version, chessboard size and the counters of the multiverse.
+memmap_file_magic = b"5DCM"
+memmap_file_version = 1
+memmap_file_header = struct.Struct("<4sHBBqqqqQ")
+memmap_header_size = 64
+# Counters of a multiverse kept in the header of a board file
+BoardFileHeader = namedtuple("BoardFileHeader", ["chessboard_size", "first_turn_black", "num_boards", 
+                                                 "max_mult_white", "max_mult_black", "present", "zobrist_key"])
+
+
+class BoardTensorStorage:
+    """
+    A storage backend that keeps all 2D chessboards of a multiverse
+    in a single growable int8 array of shape (num_boards, n, n)
+    """
+    def __init__(self, chessboard_size=8, capacity=16):
+        """
+        Sets up the board tensor
+
+        Args:
+            chessboard_size (int): size of each chessboard. Defaults to 8.
+            capacity (int): number of boards to preallocate. Defaults to 16.
+        """
+        self.chessboard_size = chessboard_size
+        self.num_boards = 0
+        self.tensor = np.zeros([max(capacity, 1), chessboard_size, chessboard_size], dtype=np.int8)
+
+    def allocate_board(self):
+        """
+        Reserves an empty board slot, growing the tensor if needed
+
+        Returns:
+            int: id of the new slot
+        """
+        if self.num_boards == len(self.tensor):
+            self.grow(2 * len(self.tensor))
+        board_id = self.num_boards
+        self.tensor[board_id] = 0
+        self.num_boards += 1
+        return board_id
+
+    def copy_board(self, source_id):
+        """
+        Reserves a new board slot, filled with the contents of another slot
+
+        Args:
+            source_id (int): id of the slot to copy from
+
+        Returns:
+            int: id of the new slot
+        """
+        board_id = self.allocate_board()
+        self.tensor[board_id] = self.tensor[source_id]
+        return board_id
+
+    def grow(self, capacity):
+        """
+        Reallocates the tensor so it can hold at least capacity boards.
+        Boards keep their ids, views obtained before growing become stale.
+        """
+        if capacity <= len(self.tensor):
+            return
+        n = self.chessboard_size
+        new_tensor = np.zeros([capacity, n, n], dtype=np.int8)
+        new_tensor[:self.num_boards] = self.tensor[:self.num_boards]
+        self.tensor = new_tensor
+
+    def set_board_location(self, board_id, time, mult, origin):
+        """
+        Records where a board is in the multiverse. Only file-backed storages keep this, 
+        to be able to reopen the multiverse.
+        """
+        pass
+
+    def get_board(self, board_id):
+        """
+        Returns an (n, n) view of a single board
+        """
+        return self.tensor[board_id]
+
+    def get_boards(self):
+        """
+        Returns a (num_boards, n, n) view of all allocated boards
+        """
+        return self.tensor[:self.num_boards]
+
+    # Whole-multiverse queries
+
+    def occupancy_mask(self, color=None):
+        """
+        Finds occupied squares on all boards
+
+        Args:
+            color (str): 'l' or 'd' to only look at pieces of one color.
+                Defaults to None, which takes all pieces (move markers excluded).
+
+        Returns:
+            np.array: boolean array of shape (num_boards, n, n)
+        """
+        boards = self.get_boards()
+        if color is None:
+            return ((boards >= 1) & (boards <= 12)) | ((boards >= 21) & (boards <= 32))
+        elif color == 'l':
+            return (boards >= 1) & (boards <= 12)
+        elif color == 'd':
+            return (boards >= 21) & (boards <= 32)
+        else:
+            raise ValueError(f"A piece can only be light or dark, you have provided {color}")
+
+    def piece_counts(self, per_board=False):
+        """
+        Counts pieces of every value
+
+        Args:
+            per_board (bool): whether to count separately for each board
+
+        Returns:
+            np.array: counts indexed by piece value, shape (64,) or (num_boards, 64)
+        """
+        boards = self.get_boards().reshape(self.num_boards, -1).astype(np.int64)
+        if not per_board:
+            return np.bincount(boards.ravel(), minlength=64)
+        offsets = np.arange(self.num_boards)[:, None] * 64
+        counts = np.bincount((boards + offsets).ravel(), minlength=64 * self.num_boards)
+        return counts.reshape(self.num_boards, 64)
+
+
+def memmap_record_dtype(n):
+    """Returns the dtype of a board record of BoardMemmapStorage for n x n boards"""
+    return np.dtype([("time", "<i4"), ("mult", "<i4"), ("origin", "<i4"), ("board", "i1", (n, n))])
+
+
+def read_memmap_header(path):
+    """
+    Reads and checks the header of a board file of BoardMemmapStorage
+
+    Returns:
+        BoardFileHeader: the header
+    """
+    with open(path, "rb") as f:
+        data = f.read(memmap_file_header.size)
+    if len(data) < memmap_file_header.size:
+        raise ValueError(f"{path} is too short to be a board file")
+    magic, version, *header = memmap_file_header.unpack(data)
+    if magic != memmap_file_magic:
+        raise ValueError(f"{path} is not a board file")
+    if version != memmap_file_version:
+        raise ValueError(f"Unsupported board file version {version}, expected {memmap_file_version}")
+    return BoardFileHeader(*header)
+
+
+class BoardMemmapStorage(BoardTensorStorage):
+    """
+    A storage backend that keeps the boards of a multiverse in a memory-mapped file of 
+    fixed-size records, so that only the boards in use are resident and several processes 
+    can read the same file. Every record holds the (time, multiverse, origin) of its board, 
+    which is the coordinate index used to reopen the multiverse (see open_chessboard_5d).
+    tensor is a zero-copy (capacity, n, n) view of the board matrices of the records.
+    """
+    def __init__(self, path, chessboard_size=8, capacity=1024, mode="w+"):
+        """
+        Opens or creates the board file
+
+        Args:
+            path (str): path of the board file
+            chessboard_size (int): size of each chessboard, for new files. Defaults to 8.
+            capacity (int): number of board records to preallocate in new files. Defaults to 1024.
+            mode (str): w+ (Default) creates a new file, r+ opens an existing file 
+                for reading and writing, r opens it read-only. Boards added in r mode 
+                (e.g. while searching) are private to the process and never written to the file.
+        """
+        if mode not in ("w+", "r+", "r"):
+            raise ValueError(f"Unknown board file mode: {mode}. Allowed values: w+, r+, r")
+        self.path = path
+        self.mode = mode
+        if mode == "w+":
+            self.chessboard_size = chessboard_size
+            self.num_boards = 0
+            self.write_header()
+            self.map_records(max(capacity, 1))
+        else:
+            header = read_memmap_header(path)
+            self.chessboard_size = header.chessboard_size
+            self.num_boards = header.num_boards
+            record_size = memmap_record_dtype(header.chessboard_size).itemsize
+            self.map_records((os.path.getsize(path) - memmap_header_size) // record_size)
+
+    def map_records(self, capacity):
+        """Maps capacity records of the file, extending the file if it is shorter"""
+        dtype = memmap_record_dtype(self.chessboard_size)
+        size = memmap_header_size + capacity * dtype.itemsize
+        if (self.mode != "r") and (os.path.getsize(self.path) < size):
+            with open(self.path, "r+b") as f:
+                f.truncate(size)
+        # Read-only files are mapped copy-on-write: pages are only copied when boards are added
+        self.records = np.memmap(self.path, dtype=dtype, mode="c" if self.mode == "r" else "r+", 
+                                 offset=memmap_header_size, shape=(capacity,))
+        self.tensor = self.records["board"]
+
+    def grow(self, capacity):
+        """
+        Extends the file so it can hold at least capacity boards.
+        Boards keep their ids, views obtained before growing become stale.
+        """
+        if capacity <= len(self.tensor):
+            return
+        if self.mode == "r": # The file can't be extended, records move to memory
+            records = np.zeros(capacity, dtype=self.records.dtype)
+            records[:self.num_boards] = self.records[:self.num_boards]
+            self.records = records
+            self.tensor = records["board"]
+            return
+        self.records.flush()
+        self.map_records(capacity)
+
+    def set_board_location(self, board_id, time, mult, origin):
+        """
+        Records where a board is in the multiverse, in its record
+        """
+        record = self.records[board_id]
+        record["time"], record["mult"], record["origin"] = time, mult, origin
+
+    def get_board_coords(self):
+        """
+        Returns:
+            np.array: int32 array of shape (num_boards, 3) with (time, multiverse, origin) of every board
+        """
+        records = self.records[:self.num_boards]
+        return np.stack([records["time"], records["mult"], records["origin"]], axis=1)
+
+    def write_header(self, first_turn_black=0, max_mult_white=0, max_mult_black=0, present=0, zobrist_key=0):
+        """
+        Writes the number of boards and the counters of the multiverse into the header of the file
+        """
+        header = memmap_file_header.pack(memmap_file_magic, memmap_file_version, self.chessboard_size, 
+                                         first_turn_black, self.num_boards, max_mult_white, 
+                                         max_mult_black, present, zobrist_key)
+        with open(self.path, "r+b" if self.mode == "r+" else "wb") as f:
+            f.write(header.ljust(memmap_header_size, b"\0"))
+        self.mode = "r+" # Only the first write creates the file
+
+    def flush(self, **counters):
+        """
+        Writes the records to disk and updates the header, so that other processes can open the file
+
+        Args:
+            **counters: arguments of write_header
+        """
+        if self.mode == "r":
+            raise ValueError(f"Cannot write to {self.path}, it is opened read-only")
+        self.records.flush()
+        self.write_header(**counters)
+
+    def __deepcopy__(self, memo):
+        """
+        Copies of a multiverse are kept in memory: the boards are copied into a BoardTensorStorage
+        """
+        storage = BoardTensorStorage(self.chessboard_size, capacity=self.num_boards)
+        storage.tensor[:self.num_boards] = self.get_boards()
+        storage.num_boards = self.num_boards
+        memo[id(self)] = storage
+        return storage
+
+
+class BoardViewStorage(BoardTensorStorage):
+    """
+    A storage backend over boards that are kept elsewhere, e.g. in a shared memory block 
+    (see SharedMultiverseReader). tensor is a zero-copy view of the boards and may be read-only: 
+    it is copied into memory when the first board is added, so the boards it views are never written.
+    """
+    def __init__(self, boards):
+        """
+        Sets up the storage over a board array
+
+        Args:
+            boards (np.array): int8 array of shape (num_boards, n, n), all of them in use
+        """
+        self.chessboard_size = boards.shape[1]
+        self.num_boards = len(boards)
+        self.tensor = boards
+
+
+class DeltaBoardHistory:
+    """
+    A storage backend for boards of list storage that are no longer the last board of their timeline.
+    Such a board only differs from its origin by a move, so it is kept as the squares that differ 
+    (compress), and its full matrix is rebuilt from the origin when it is read. Rebuilt matrices 
+    are kept in a bounded LRU cache. Every keyframe_interval boards along a chain of origins,
+    a board keeps its full matrix, which bounds the cost of rebuilding.
+
+    Boards read through the history get read-only matrices. Writing to a board that is kept as 
+    a delta, or that other boards are deltas to, gives those boards full matrices first.
+    """
+    def __init__(self, cache_size=256, keyframe_interval=16):
+        """
+        Create a new instance of class
+
+        Args:
+            cache_size (int): number of rebuilt matrices to keep. Defaults to 256.
+            keyframe_interval (int): longest chain of deltas to rebuild a board from. Defaults to 16.
+        """
+        self.cache_size = cache_size
+        self.keyframe_interval = keyframe_interval
+        self.deltas = {} # chessboard -> (origin chessboard, int16 bytes of changed flat indices then values, chain length)
+        self.children = {} # chessboard -> set of chessboards kept as deltas to it
+        self.cache = OrderedDict() # chessboard -> read-only rebuilt matrix, least recently used first
+
+    def compress(self, chessboard, base):
+        """
+        Keeps a board as the squares where it differs from base (its board of origin). Boards that 
+        would end a chain of keyframe_interval deltas, or that differ in many squares, keep their matrix.
+
+        Returns:
+            bool: True if the board was compressed
+        """
+        if (chessboard.storage is not None) or chessboard.is_compressed():
+            return False
+        depth = self.deltas[base][2] + 1 if base in self.deltas else 1
+        if depth >= self.keyframe_interval:
+            return False
+        matrix = chessboard.chessboard_matrix
+        indices = np.flatnonzero(matrix != base.chessboard_matrix)
+        if len(indices) > matrix.size // 4:
+            return False
+        delta = np.concatenate([indices, matrix.ravel()[indices]]).astype(np.int16).tobytes()
+        self.deltas[chessboard] = (base, delta, depth)
+        self.children.setdefault(base, set()).add(chessboard)
+        chessboard._chessboard_matrix = None
+        return True
+
+    def get_matrix(self, chessboard):
+        """
+        Returns the read-only matrix of a board kept as a delta, from cache or rebuilt from its origin
+        """
+        matrix = self.cache.get(chessboard)
+        if matrix is not None:
+            self.cache.move_to_end(chessboard)
+            return matrix
+        base, delta, _ = self.deltas[chessboard]
+        indices, values = np.frombuffer(delta, dtype=np.int16).reshape(2, -1)
+        matrix = base.chessboard_matrix.copy()
+        matrix.flat[indices] = values
+        matrix.flags.writeable = False
+        self.cache_matrix(chessboard, matrix)
+        return matrix
+
+    def cache_matrix(self, chessboard, matrix):
+        """Adds a matrix to the cache, dropping the least recently used one if it is full"""
+        self.cache[chessboard] = matrix
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def decompress(self, chessboard):
+        """Gives a board kept as a delta its own writable matrix again"""
+        matrix = self.get_matrix(chessboard).copy()
+        self.remove_delta(chessboard)
+        chessboard._chessboard_matrix = matrix
+
+    def remove_delta(self, chessboard):
+        """Forgets the delta and cached matrix of a board"""
+        base = self.deltas.pop(chessboard)[0]
+        children = self.children.get(base)
+        if children is not None:
+            children.discard(chessboard)
+            if not children:
+                del self.children[base]
+        self.cache.pop(chessboard, None)
+
+    def before_write(self, chessboard):
+        """
+        Called before a board is written to: boards kept as deltas to it and the board itself get full matrices
+        """
+        for child in self.children.pop(chessboard, ()):
+            self.decompress(child)
+        if chessboard in self.deltas:
+            self.decompress(chessboard)
+
+    def forget(self, chessboard):
+        """Drops a board that was removed from the multiverse"""
+        if chessboard in self.deltas:
+            self.remove_delta(chessboard)
+        self.children.pop(chessboard, None)
+
+    def get_memory_usage(self):
+        """
+        Returns:
+            tuple: (number of boards kept as deltas, bytes of their deltas, bytes of cached matrices)
+        """
+        return (len(self.deltas), sum(len(delta) for _, delta, _ in self.deltas.values()),
+                sum(matrix.nbytes for matrix in self.cache.values()))
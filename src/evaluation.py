@@ -0,0 +1,247 @@
+import numpy as np
+from collections import namedtuple
+from types import MappingProxyType
+from chess_db_2d import pieces_dict, piece_color_codes
+from moves import dr_tables
+
+# Material value of every piece type, in centipawns. Royal pieces are not counted,
+# since losing them ends the game.
+material_values = MappingProxyType({
+    "k": 0,
+    "q": 900,
+    "b": 330,
+    "n": 320,
+    "r": 500,
+    "p": 100,
+    "d": 700, # Dragon
+    "u": 550, # Unicorn
+    "B": 150, # Brawn
+    "P": 800, # Princess
+    "c": 300, # Common King
+    "R": 0,   # Royal Queen
+    "M": 0,   # Move markers are not pieces
+})
+# Material indexed by piece value, positive for light and negative for dark pieces
+material_by_value = np.zeros(max(pieces_dict) + 1, dtype=np.int64)
+for value, piece in pieces_dict.items():
+    if piece:
+        material_by_value[value] = material_values[piece[0]] * (1 if piece[1] == 'l' else -1)
+material_by_value.flags.writeable = False
+
+# Terms of an evaluation, in centipawns for light (positive means light is better)
+EvaluationTerms = namedtuple("EvaluationTerms", ["material", "mobility", "timelines"])
+
+
+def build_board_moves(color):
+    """
+    Finds the moves of every piece type that stay on the board of the piece, as (dx, dy)
+    from the point of view of a color (dark pawns move in the opposite direction)
+
+    Returns:
+        tuple: (line directions, single steps and jumps, pawn moves, pawn captures),
+            each a dict (dx, dy) -> tuple of piece values of that color
+    """
+    sign = 1 if color == 'l' else -1
+    line_moves, step_moves, pawn_moves, pawn_eat_moves = {}, {}, {}, {}
+    for value, piece in pieces_dict.items():
+        if (not piece) or (piece[1] != color) or (piece[0] == 'M'):
+            continue
+        piece_type = piece[0]
+        if piece_type in ('p', 'B'):
+            tables = ((pawn_moves, dr_tables[piece_type]), (pawn_eat_moves, dr_tables[piece_type + "_eat"]))
+        elif piece_type in ('k', 'c', 'n'):
+            tables = ((step_moves, dr_tables[piece_type]),)
+        else:
+            tables = ((line_moves, dr_tables[piece_type]),)
+        for moves, list_dr in tables:
+            for dx, dy, dt, dm in list_dr:
+                if (dt, dm) == (0, 0):
+                    key = (sign * dx, sign * dy) if moves is pawn_moves or moves is pawn_eat_moves else (dx, dy)
+                    moves.setdefault(key, []).append(value)
+    return tuple({ key: tuple(values) for key, values in moves.items() }
+                 for moves in (line_moves, step_moves, pawn_moves, pawn_eat_moves))
+
+
+board_moves = { color: build_board_moves(color) for color in ('l', 'd') }
+
+
+class Evaluator:
+    """
+    Static evaluation of a 5D chessboard, from the last boards of all timelines:
+        material: values of the pieces
+        mobility: moves the pieces have on their own board, counting blocking but not checks
+        timelines: timelines created by each player
+
+    Terms of each board are computed for a stack of boards at once with NumPy, and cached by
+    the board's Zobrist key, so only boards added or changed since the last call are scored.
+    """
+    def __init__(self, chess5, mobility_weight=4, timeline_weight=50):
+        """
+        Create a new instance of class
+
+        Args:
+            chess5 (Chessboard_5D): the multiverse to evaluate
+            mobility_weight (int): centipawns per move. Defaults to 4.
+            timeline_weight (int): centipawns per timeline. Defaults to 50.
+        """
+        self.chess5 = chess5
+        self.mobility_weight = mobility_weight
+        self.timeline_weight = timeline_weight
+        self.board_cache = {} # chessboard id -> (zobrist key, material, mobility)
+        self.creator_cache = {} # multiverse -> (ids and zobrist keys of its first board and its origin, creator)
+
+    def evaluate(self):
+        """
+        Evaluates the position in centipawns, from the point of view of the player to move
+
+        Returns:
+            int: score
+        """
+        score = sum(self.evaluate_terms())
+        return score if self.chess5.get_player_to_move() == 'l' else -score
+
+    def evaluate_terms(self):
+        """
+        Evaluates the position term by term
+
+        Returns:
+            EvaluationTerms: terms in centipawns for light
+        """
+        chess5 = self.chess5
+        head_ids = [ chess5.tm_index[(time, mult)] for mult, time in chess5.timeline_heads.items() ]
+        self.update_board_cache(head_ids)
+        material, mobility = 0, 0
+        for id in head_ids:
+            cached = self.board_cache[id]
+            material += cached[1]
+            mobility += cached[2]
+        timelines = 0 # Light timelines minus dark timelines
+        for mult in chess5.timeline_heads:
+            creator = self.get_timeline_creator(mult)
+            if creator is not None:
+                timelines += 1 if creator == 'l' else -1
+        return EvaluationTerms(material, self.mobility_weight * mobility, self.timeline_weight * timelines)
+
+    def get_timeline_creator(self, mult):
+        """
+        Returns the player who created a timeline (see Chessboard_5D.get_timeline_creator), 
+        cached until the first board of the timeline or its board of origin changes
+        """
+        chess5 = self.chess5
+        boards = chess5.timeline_boards[mult]
+        id = boards[min(boards)]
+        chessboard = chess5.chessboards[id]
+        key = (id, chessboard.zobrist_key, chessboard.origin)
+        if chessboard.origin >= 0:
+            key += (chess5.chessboards[chessboard.origin].zobrist_key,)
+        cached = self.creator_cache.get(mult)
+        if (cached is None) or (cached[0] != key):
+            cached = (key, chess5.get_timeline_creator(mult))
+            self.creator_cache[mult] = cached
+        return cached[1]
+
+    def update_board_cache(self, ids):
+        """
+        Scores the boards among ids that were added or changed since they were last scored
+        """
+        chessboards = self.chess5.chessboards
+        changed_ids = [ id for id in ids
+                        if self.board_cache.get(id, (None,))[0] != chessboards[id].zobrist_key ]
+        if not changed_ids:
+            return
+        storage = self.chess5.storage
+        if storage is not None: # All boards share one tensor
+            boards = storage.tensor[changed_ids]
+        else:
+            boards = np.stack([ chessboards[id].chessboard_matrix for id in changed_ids ])
+        boards = boards.astype(np.intp)
+        material = material_by_value[boards].sum(axis=(1, 2))
+        mobility = count_board_moves(boards, 'l') - count_board_moves(boards, 'd')
+        for i, id in enumerate(changed_ids):
+            self.board_cache[id] = (chessboards[id].zobrist_key, int(material[i]), int(mobility[i]))
+
+
+board_move_tables = {} # (n, color) -> result of build_board_move_tables
+
+
+def build_board_move_tables(n, color):
+    """
+    Builds lookup tables for count_board_moves. Boards are flattened and padded with n - 1 squares
+    on every side, so that a move from any square lands on a square of the padded board.
+
+    Returns:
+        tuple: (inner, groups, line_lookup, line_steps) where
+            inner: padded indices of the squares of the board, shape (n * n,)
+            groups: (lookup, targets) for single steps and jumps, pawn moves and pawn captures.
+                lookup[value, k] tells if a piece of that value makes move k, targets[square, k]
+                is the padded index of the square it moves to.
+            line_lookup, line_steps: same for line directions, targets for steps 1 to n - 1
+    """
+    pad = n - 1
+    width = n + 2 * pad
+    xs, ys = np.divmod(np.arange(n * n), n)
+    inner = (xs + pad) * width + ys + pad
+
+    def get_tables(moves, steps=(1,)):
+        offsets = list(moves)
+        lookup = np.zeros((len(material_by_value), len(offsets)), dtype=bool)
+        for k, offset in enumerate(offsets):
+            lookup[list(moves[offset]), k] = True
+        targets = [ np.array([ inner + step * (dx * width + dy) for dx, dy in offsets ],
+                             dtype=np.intp).reshape(len(offsets), n * n).T
+                    for step in steps ]
+        return lookup, targets
+
+    line_moves, step_moves, pawn_moves, pawn_eat_moves = board_moves[color]
+    groups = []
+    for moves in (step_moves, pawn_moves, pawn_eat_moves):
+        lookup, targets = get_tables(moves)
+        groups.append((lookup, targets[0]))
+    line_lookup, line_steps = get_tables(line_moves, range(1, n))
+    return inner, tuple(groups), line_lookup, line_steps
+
+
+def get_board_move_tables(n, color):
+    """
+    Returns lookup tables for count_board_moves from cache, or builds them
+    """
+    tables = board_move_tables.get((n, color))
+    if tables is None:
+        tables = build_board_move_tables(n, color)
+        board_move_tables[(n, color)] = tables
+    return tables
+
+
+def count_board_moves(boards, color):
+    """
+    Counts moves of the pieces of a player that stay on their own board
+
+    Args:
+        boards (np.array): piece values, shape (number of boards, n, n)
+        color (str): 'l' or 'd'
+
+    Returns:
+        np.array: number of moves on every board
+    """
+    num_boards, n = boards.shape[0], boards.shape[1]
+    inner, groups, line_lookup, line_steps = get_board_move_tables(n, color)
+    boards = boards.reshape(num_boards, n * n)
+    width = 3 * n - 2
+    # Padding squares are neither empty nor open to moves
+    empty = np.zeros((num_boards, width * width), dtype=bool)
+    empty[:, inner] = boards == 0
+    open_squares = np.zeros_like(empty) # Empty or with an opponent piece
+    open_squares[:, inner] = piece_color_codes[boards] != (1 if color == 'l' else 2)
+    enemy = open_squares & ~empty
+
+    # Every array below has shape (number of boards, n * n squares, number of moves)
+    counts = np.zeros(num_boards, dtype=np.int64)
+    for (lookup, targets), target_squares in zip(groups, (open_squares, empty, enemy)):
+        counts += (lookup[boards] & target_squares[:, targets]).sum(axis=(1, 2))
+    rays = line_lookup[boards] # Pieces whose ray in a direction is not blocked yet
+    for targets in line_steps:
+        if not rays.any():
+            break
+        counts += (rays & open_squares[:, targets]).sum(axis=(1, 2))
+        rays &= empty[:, targets]
+    return counts
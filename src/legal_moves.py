@@ -0,0 +1,642 @@
+import numpy as np
+from collections import namedtuple
+from chess_db_2d import pieces_dict, piece_color_codes
+from moves import dr_tables, build_xy_by_tm
+
+# A legal move. origin and target are integer 4d vectors (x, y, t, m).
+# piece and captured are piece acronyms ("" if nothing is captured).
+# branches: the move creates a new timeline, time_travel: the piece leaves its board,
+# gives_check: the move attacks a royal piece of the opponent (None if not computed).
+LegalMove = namedtuple("LegalMove", ["origin", "target", "piece", "captured",
+                                     "branches", "time_travel", "gives_check"])
+
+royal_types = ('k', 'R') # Pieces that must not be captured
+step_types = ('k', 'c') # Pieces that move by a single step in any queen direction
+line_types = ('r', 'b', 'u', 'd', 'q', 'P', 'R') # Pieces that move in a line
+pawn_types = ('p', 'B')
+knight_types = ('n',)
+
+
+def build_line_attackers(with_steps=False):
+    """
+    For every queen direction, finds the types of pieces that move along it in a line
+
+    Args:
+        with_steps (bool): whether to add pieces that move by a single step (for adjacent squares)
+
+    Returns:
+        dict: dr 4-tuple -> frozenset of piece types
+    """
+    line_attackers = {}
+    for dr in dr_tables["q"]:
+        attacker_types = [ piece_type for piece_type in line_types if dr in dr_tables[piece_type] ]
+        if with_steps:
+            attacker_types += step_types
+        line_attackers[dr] = frozenset(attacker_types)
+    return line_attackers
+
+
+line_attackers = build_line_attackers()
+adjacent_attackers = build_line_attackers(with_steps=True)
+knight_xy_by_tm = build_xy_by_tm(dr_tables["n"])
+# Eating moves of pawns and brawns, dark pieces move in the opposite direction
+pawn_eat_xy_by_tm = {
+    'l': build_xy_by_tm(dr_tables["p_eat"] + dr_tables["B_eat"]),
+    'd': build_xy_by_tm([ tuple(-i for i in dr) for dr in dr_tables["p_eat"] + dr_tables["B_eat"] ]),
+}
+# (piece type, color) indexed by piece value, ('', '') for empty squares
+piece_by_value = [ tuple(pieces_dict[value]) if pieces_dict.get(value) else ('', '')
+                   for value in range(max(pieces_dict) + 1) ]
+royal_values = np.array([ value for value, piece in pieces_dict.items() if piece and piece[0] in royal_types ])
+rays_2d = [ (dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0) ]
+# One bit per piece type, and the bits of pieces of each color indexed by piece value (0 for other pieces)
+piece_type_bits = { piece_type: 1 << i for i, piece_type in enumerate(sorted(set(piece[0] for piece in piece_by_value if piece[0]))) }
+attacker_bits_by_value = {
+    color: np.array([ piece_type_bits[piece[0]] if piece[1] == color else 0 for piece in piece_by_value ], dtype=np.int64)
+    for color in ('l', 'd')
+}
+
+
+def get_attack_squares(vec, time, mult, attacker_color, n):
+    """
+    Finds squares of a board at (time, mult) from which a piece could capture on vec.
+    Rays on the board of vec itself are not included, they are walked instead.
+
+    Args:
+        vec (tuple): integer 4d vector of the attacked square
+        time (int): time coordinate of the attacker's board
+        mult (int): multiverse coordinate of the attacker's board
+        attacker_color (str): 'l' or 'd'
+        n (int): size of the chessboards
+
+    Returns:
+        tuple: (x, y, attacker types, dr, steps) tuples. The path of a line attack is vec + i * dr
+            for 0 < i < steps, jumps have a dr of None and 1 step.
+    """
+    x, y, royal_time, royal_mult = vec
+    key = (x, y, time - royal_time, mult - royal_mult, attacker_color, n)
+    squares = attack_squares_cache.get(key)
+    if squares is None:
+        squares = find_attack_squares(*key)
+        attack_squares_cache[key] = squares
+    return squares
+
+
+attack_squares_cache = {} # (x, y, dt, dm, attacker color, n) -> result of find_attack_squares
+
+def find_attack_squares(x, y, dt, dm, attacker_color, n):
+    """
+    Does the work of get_attack_squares, which only depends on the square
+    and on the time-multiverse offset of the attacker's board
+    """
+    squares = []
+    # Knights, pawns and brawns jump, so only the square itself matters
+    for dx, dy in knight_xy_by_tm.get((dt, dm), ()):
+        if (0 <= x + dx < n) and (0 <= y + dy < n):
+            squares.append((x + dx, y + dy, knight_types, None, 1))
+    for dx, dy in pawn_eat_xy_by_tm[attacker_color].get((-dt, -dm), ()):
+        if (0 <= x - dx < n) and (0 <= y - dy < n):
+            squares.append((x - dx, y - dy, pawn_types, None, 1))
+
+    # Pieces moving in a line (or by one step) must be on a line with the square
+    steps = max(abs(dt), abs(dm))
+    if (steps > 0) and (dt in (0, steps, -steps)) and (dm in (0, steps, -steps)):
+        dt, dm = dt // steps, dm // steps
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                attacker_x, attacker_y = x + steps * dx, y + steps * dy
+                if (0 <= attacker_x < n) and (0 <= attacker_y < n):
+                    dr = (dx, dy, dt, dm)
+                    attacker_types = adjacent_attackers[dr] if steps == 1 else line_attackers[dr]
+                    if attacker_types:
+                        squares.append((attacker_x, attacker_y, attacker_types, dr, steps))
+    return tuple(squares)
+
+
+class LegalMoveGenerator:
+    """
+    Generates legal moves for the player to move in a 5D chessboard.
+
+    Pieces move as given by Moves, from the playable boards of the player (last boards
+    of timelines where it's their turn). A move is legal if afterwards no royal piece
+    (king, royal queen) of the player, on any board, can be captured by an opponent piece
+    on one of the opponent's playable boards. Check is found by looking back from the royal
+    pieces along every way a piece could attack them, not by generating opponent moves.
+    """
+    def __init__(self, chess5):
+        """
+        Create a new instance of class
+
+        Args:
+            chess5 (Chessboard_5D): the multiverse to generate moves in.
+                Moves are made and undone on it with checkpoint/rollback.
+        """
+        self.chess5 = chess5
+        self.royal_cache = {} # chessboard id -> (zobrist key, list of royal squares)
+
+    # Move generation
+
+    def get_pseudo_legal_moves(self, color=None):
+        """
+        Finds all moves of a player, without looking at checks
+
+        Args:
+            color (str): 'l' or 'd'. Defaults to None, which takes the player to move.
+
+        Returns:
+            list: (origin, target, piece) tuples, origin and target being integer 4d vectors
+        """
+        return list(self.iter_pseudo_legal_moves(color))
+
+    def iter_pseudo_legal_moves(self, color=None, force_noeat=0, target_boards=None):
+        """
+        Yields moves of a player one piece at a time, without looking at checks,
+        in the same order as get_pseudo_legal_moves
+
+        Args:
+            color (str): 'l' or 'd'. Defaults to None, which takes the player to move.
+            force_noeat (int): 0 (Default) for all moves, 1 for captures only, 2 for quiet moves only
+            target_boards (set): (time, multiverse) of boards to move to. Defaults to None (all boards).
+
+        Yields:
+            tuple: (origin, target, piece), origin and target being integer 4d vectors
+        """
+        chess5 = self.chess5
+        if color is None:
+            color = chess5.get_player_to_move()
+        color_code = 1 if color == 'l' else 2
+        moves, get_board, n = chess5.moves, chess5.get_board_matrix, chess5.chessboard_size
+        for id in chess5.get_playable_boards(color):
+            time, mult = chess5.timemult_coords[id][0], chess5.timemult_coords[id][1]
+            matrix = chess5.chessboards[id].chessboard_matrix
+            values = matrix.astype(np.intp)
+            for x, y in zip(*np.nonzero(piece_color_codes[values] == color_code)):
+                piece = pieces_dict[values[x, y]]
+                if piece[0] == 'M': # Move markers are not pieces
+                    continue
+                origin = (int(x), int(y), time, mult)
+                for target in moves.iter_board_moves(get_board, piece, origin, n, 
+                                                     force_noeat=force_noeat, target_boards=target_boards):
+                    yield origin, target, piece
+
+    def get_legal_moves(self, check_flags=False):
+        """
+        Finds all legal moves of the player to move
+
+        Args:
+            check_flags (bool): whether to find out if moves give check.
+                Defaults to False, which leaves gives_check as None.
+
+        Returns:
+            list: LegalMove tuples
+        """
+        return list(self.iter_legal_moves(check_flags))
+
+    def iter_legal_moves(self, check_flags=False, force_noeat=0, target_boards=None):
+        """
+        Yields legal moves of the player to move as they are found, in the same order as 
+        get_legal_moves. Stopping early skips the legality test of the remaining moves.
+        The position must be the same whenever the generator is resumed: a move made
+        by the caller has to be undone before asking for the next one.
+
+        Args:
+            check_flags (bool): whether to find out if moves give check.
+                Defaults to False, which leaves gives_check as None.
+            force_noeat (int): 0 (Default) for all moves, 1 for captures only, 2 for quiet moves only
+            target_boards (set): (time, multiverse) of boards to move to. Defaults to None (all boards).
+
+        Yields:
+            LegalMove: legal moves
+        """
+        chess5 = self.chess5
+        color = chess5.get_player_to_move()
+        opponent = 'd' if color == 'l' else 'l'
+        context = CheckContext(self, color)
+        if check_flags: # Checks on the opponent, depending on whether the opponent is to move after the move
+            opponent_contexts = { True: CheckContext(self, opponent, all_heads=True), 
+                                  False: CheckContext(self, opponent) }
+        for origin, target, piece in self.iter_pseudo_legal_moves(color, force_noeat, target_boards):
+            state = chess5.checkpoint()
+            flags = self.make_move(origin, target)
+            move = None
+            if not context.is_in_check_after_move(state[0], target):
+                gives_check = None
+                if check_flags:
+                    opponent_context = opponent_contexts[chess5.get_player_to_move() == opponent]
+                    gives_check = opponent_context.is_in_check_after_move(state[0], target)
+                move = LegalMove(origin, target, piece, *flags, gives_check)
+            chess5.rollback(state)
+            if move is not None:
+                yield move
+
+    def has_legal_move(self):
+        """
+        Checks if the player to move has any legal move, stopping at the first one found
+
+        Returns:
+            bool: True if there is a legal move
+        """
+        return next(self.iter_legal_moves(), None) is not None
+
+    def make_first_legal_move(self, candidates):
+        """
+        Makes the first legal move among pseudo-legal candidate moves of the player to move,
+        without checking the rest. Trying candidates in random order picks a random legal move.
+
+        Args:
+            candidates (list): (origin, target, piece) tuples, as from get_pseudo_legal_moves
+
+        Returns:
+            LegalMove: the move made (gives_check is None), or None if no candidate is legal
+        """
+        chess5 = self.chess5
+        context = CheckContext(self, chess5.get_player_to_move())
+        for origin, target, piece in candidates:
+            state = chess5.checkpoint()
+            flags = self.make_move(origin, target)
+            if not context.is_in_check_after_move(state[0], target):
+                return LegalMove(origin, target, piece, *flags, None)
+            chess5.rollback(state)
+        return None
+
+    def make_move(self, origin, target):
+        """
+        Makes a move on the multiverse. Undo it with a checkpoint taken before.
+
+        Args:
+            origin (tuple): integer 4d vector of the piece
+            target (tuple): integer 4d vector of the target square
+
+        Returns:
+            tuple: (captured piece acronym, whether the move branches, whether it travels in time)
+        """
+        chess5 = self.chess5
+        x2, y2, time2, mult2 = target
+        target_id = chess5.tm_index[(time2, mult2)]
+        captured = pieces_dict[int(chess5.chessboards[target_id].chessboard_matrix[x2, y2])]
+        time_travel = (origin[2], origin[3]) != (time2, mult2)
+        branches = time_travel and (chess5.timeline_heads[mult2] != time2)
+        chess5.movie_piece_4d(origin, target)
+        return captured, branches, time_travel
+
+    # Check detection
+
+    def get_royal_squares(self, id, color):
+        """
+        Finds royal pieces of a player on a board, caching the result by the board's Zobrist key
+
+        Returns:
+            list: (x, y) squares of royal pieces
+        """
+        chessboard = self.chess5.chessboards[id]
+        cached = self.royal_cache.get(id)
+        if (cached is None) or (cached[0] != chessboard.zobrist_key):
+            matrix = chessboard.chessboard_matrix
+            squares = { 'l': [], 'd': [] }
+            for x, y in zip(*np.nonzero(np.isin(matrix, royal_values))):
+                squares[pieces_dict[int(matrix[x, y])][1]].append((int(x), int(y)))
+            cached = (chessboard.zobrist_key, squares)
+            self.royal_cache[id] = cached
+        return cached[1][color]
+
+    def is_in_check(self, color):
+        """
+        Checks whether any royal piece of a player can be captured by the opponent.
+        Opponent pieces on the opponent's playable boards attack. If the player is to move, 
+        opponent pieces on the player's playable boards attack too, since the opponent 
+        moves on the boards that follow them.
+
+        Args:
+            color (str): 'l' or 'd', the player whose royal pieces are checked
+
+        Returns:
+            bool: True if in check
+        """
+        chess5 = self.chess5
+        opponent = 'd' if color == 'l' else 'l'
+        if color == chess5.get_player_to_move():
+            attacker_ids = [ chess5.tm_index[(time, mult)] for mult, time in sorted(chess5.timeline_heads.items()) ]
+        else:
+            attacker_ids = chess5.get_playable_boards(opponent)
+        attacker_boards = [ (chess5.timemult_coords[id][0], chess5.timemult_coords[id][1], id)
+                            for id in attacker_ids ]
+        if not attacker_boards:
+            return False
+        for id, (time, mult) in enumerate(chess5.timemult_coords):
+            if chess5.tm_index.get((time, mult)) != id: # Board hidden by another one at the same location
+                continue
+            for x, y in self.get_royal_squares(id, color):
+                if self.find_attacker((x, y, time, mult), opponent, attacker_boards) is not None:
+                    return True
+        return False
+
+    def get_royals(self, color):
+        """
+        Finds all royal pieces of a player
+
+        Returns:
+            list: integer 4d vectors of royal pieces
+        """
+        chess5 = self.chess5
+        royals = []
+        for id, (time, mult) in enumerate(chess5.timemult_coords):
+            if chess5.tm_index.get((time, mult)) != id: # Board hidden by another one at the same location
+                continue
+            royals += [ (x, y, time, mult) for x, y in self.get_royal_squares(id, color) ]
+        return royals
+
+    def find_attacker(self, vec, attacker_color, attacker_boards):
+        """
+        Looks for a piece that can capture on a square, going back from the square
+        along every way a piece can move to it
+
+        Args:
+            vec (tuple): integer 4d vector of the attacked square
+            attacker_color (str): 'l' or 'd'
+            attacker_boards (list): (time, multiverse, chessboard id) of boards the attacker can move on
+
+        Returns:
+            tuple: integer 4d vector of an attacking piece, or None
+        """
+        n = self.chess5.chessboard_size
+        for board in attacker_boards:
+            squares = get_attack_squares(vec, board[0], board[1], attacker_color, n)
+            attacker = self.find_attacker_on_board(vec, attacker_color, board, squares)
+            if attacker is not None:
+                return attacker
+        return None
+
+    def find_attacker_on_board(self, vec, attacker_color, board, squares):
+        """
+        Looks for a piece on a single board that can capture on a square
+
+        Args:
+            vec (tuple): integer 4d vector of the attacked square
+            attacker_color (str): 'l' or 'd'
+            board (tuple): (time, multiverse, chessboard id) of the board
+            squares (list): squares of the board to look at, see get_attack_squares
+
+        Returns:
+            tuple: integer 4d vector of an attacking piece, or None
+        """
+        matrix = self.chess5.chessboards[board[2]].chessboard_matrix
+        for x, y, attacker_types, dr, steps in squares:
+            value = int(matrix.item(x, y))
+            if value == 0:
+                continue
+            piece_type, piece_color = piece_by_value[value]
+            if (piece_color != attacker_color) or (piece_type not in attacker_types):
+                continue
+            if (steps < 2) or self.is_path_empty(vec, dr, steps):
+                return (x, y, board[0], board[1])
+        if (board[0] == vec[2]) and (board[1] == vec[3]): # Same board: walk all rays
+            for dr_2d in rays_2d:
+                attacker = self.find_line_attacker_2d(matrix, vec, dr_2d, attacker_color)
+                if attacker is not None:
+                    return attacker
+        return None
+
+    def find_line_attacker_2d(self, matrix, vec, dr_2d, attacker_color):
+        """
+        Walks a ray on a single board and returns the first piece if it can capture along the ray
+        """
+        x, y, time, mult = vec
+        dx, dy = dr_2d
+        n = self.chess5.chessboard_size
+        attacker_types = adjacent_attackers[(dx, dy, 0, 0)]
+        x, y = x + dx, y + dy
+        while (0 <= x < n) and (0 <= y < n):
+            value = int(matrix.item(x, y))
+            if value != 0:
+                piece_type, piece_color = piece_by_value[value]
+                if piece_color == attacker_color and piece_type in attacker_types:
+                    return (x, y, time, mult)
+                return None
+            x, y = x + dx, y + dy
+            attacker_types = line_attackers[(dx, dy, 0, 0)]
+        return None
+
+    def is_path_empty(self, vec, dr, steps):
+        """
+        Checks that all squares strictly between vec and vec + steps * dr exist and are empty
+        """
+        chess5 = self.chess5
+        x, y, time, mult = vec
+        dx, dy, dt, dm = dr
+        for step in range(1, steps):
+            id = chess5.tm_index.get((time + step * dt, mult + step * dm), -1)
+            if id == -1:
+                return False
+            if chess5.chessboards[id].chessboard_matrix.item(x + step * dx, y + step * dy) != 0:
+                return False
+        return True
+
+
+def is_aligned(dt, dm):
+    """
+    Checks if a time-multiverse displacement can be crossed by a single piece move,
+    i.e. along a line or by a knight jump
+    """
+    steps = max(abs(dt), abs(dm))
+    return (dt in (0, steps, -steps) and dm in (0, steps, -steps)) or ((dt, dm) in knight_xy_by_tm)
+
+
+class CheckContext:
+    """
+    Check information of a position, to find checks after many different moves quickly.
+
+    Moves only add boards, so a royal piece on an old board is attacked from an old
+    playable board after the move if and only if it was before the move, unless the line
+    between them crosses one of the new boards. Only new boards and such lines are
+    looked at for every move.
+    """
+    def __init__(self, generator, color, all_heads=False):
+        """
+        Finds which old playable boards of the opponent attack royal pieces of the player
+
+        Args:
+            generator (LegalMoveGenerator): generator of the multiverse
+            color (str): 'l' or 'd', the player whose royal pieces are checked
+            all_heads (bool): whether opponent pieces on the last boards of all timelines attack,
+                as when the player is to move after the move (see LegalMoveGenerator.is_in_check).
+                Defaults to False: only the opponent's playable boards attack.
+        """
+        chess5 = generator.chess5
+        self.generator = generator
+        self.color = color
+        self.opponent = 'd' if color == 'l' else 'l'
+        self.num_boards = len(chess5.chessboards)
+        self.royals = generator.get_royals(color)
+        self.royal_pieces = [ (piece_type, color) for piece_type in royal_types ]
+        self.all_heads = all_heads
+        if all_heads:
+            attacker_ids = [ chess5.tm_index[(time, mult)] for mult, time in sorted(chess5.timeline_heads.items()) ]
+        else:
+            attacker_ids = chess5.get_playable_boards(self.opponent)
+        self.attacker_boards = [ (chess5.timemult_coords[id][0], chess5.timemult_coords[id][1], id)
+                                 for id in attacker_ids ]
+
+        self.attacking_boards = set() # ids of playable boards that attack a royal piece
+        self.open_lines = [] # (royal, attacker board, steps, dt, dm) of lines that new boards can open
+        for board in self.attacker_boards:
+            attacker_time, attacker_mult, id = board
+            for royal in self.royals:
+                dt, dm = attacker_time - royal[2], attacker_mult - royal[3]
+                if not is_aligned(dt, dm):
+                    continue
+                if generator.find_attacker(royal, self.opponent, [board]) is not None:
+                    self.attacking_boards.add(id)
+                    continue
+                steps = max(abs(dt), abs(dm))
+                if steps > 1 and (dt in (0, steps, -steps)) and (dm in (0, steps, -steps)):
+                    self.open_lines.append((royal, board, steps, dt // steps, dm // steps))
+        self.attack_tables = {} # (time, multiverse) -> see get_attack_table
+        self.open_attack_squares = {} # (square, time, multiverse) -> see get_open_attack_squares
+        self.crossing_lines = {} # (time, multiverse) -> open lines that cross it
+
+    def get_attack_table(self, time, mult):
+        """
+        Returns all squares of a board at (time, mult) from which a piece could attack 
+        one of the royal pieces, as arrays to look at all of them at once
+
+        Returns:
+            tuple: x coordinates, y coordinates, bits of attacker types (see piece_type_bits),
+                and (royal, dr, steps) for every square
+        """
+        table = self.attack_tables.get((time, mult))
+        if table is None:
+            xs, ys, type_bits, paths = [], [], [], []
+            for royal in self.royals:
+                for x, y, attacker_types, dr, steps in self.get_open_attack_squares(royal, time, mult):
+                    xs.append(x)
+                    ys.append(y)
+                    type_bits.append(sum(piece_type_bits[piece_type] for piece_type in attacker_types))
+                    paths.append((royal, dr, steps))
+            table = (np.array(xs, dtype=np.intp), np.array(ys, dtype=np.intp), 
+                     np.array(type_bits, dtype=np.int64), paths)
+            self.attack_tables[(time, mult)] = table
+        return table
+
+    def is_attacking_royals(self, board):
+        """
+        Checks if a piece on a new board of the opponent attacks one of the old royal pieces
+
+        Args:
+            board (tuple): (time, multiverse, chessboard id) of the board
+        """
+        xs, ys, type_bits, paths = self.get_attack_table(board[0], board[1])
+        if len(xs) == 0:
+            return False
+        values = self.generator.chess5.chessboards[board[2]].chessboard_matrix[xs, ys].astype(np.intp)
+        hits = np.nonzero(attacker_bits_by_value[self.opponent][values] & type_bits)[0]
+        for i in hits:
+            royal, dr, steps = paths[i]
+            if (steps < 2) or self.generator.is_path_empty(royal, dr, steps):
+                return True
+        return False
+
+    def get_open_attack_squares(self, vec, time, mult):
+        """
+        Same as get_attack_squares, but without squares whose path is blocked on old boards.
+        Results are cached, since the same squares are looked at after many moves.
+        """
+        key = (vec, time, mult)
+        squares = self.open_attack_squares.get(key)
+        if squares is None:
+            n = self.generator.chess5.chessboard_size
+            squares = [ square for square in get_attack_squares(vec, time, mult, self.opponent, n)
+                        if (square[4] < 2) or not self.is_path_blocked(vec, square[3], square[4]) ]
+            self.open_attack_squares[key] = squares
+        return squares
+
+    def is_path_blocked(self, vec, dr, steps):
+        """
+        Checks if a piece stands strictly between vec and vec + steps * dr on one of the old boards.
+        Old boards never change, so such a path stays blocked after any move.
+        """
+        chess5 = self.generator.chess5
+        x, y, time, mult = vec
+        dx, dy, dt, dm = dr
+        for step in range(1, steps):
+            id = chess5.tm_index.get((time + step * dt, mult + step * dm), -1)
+            if (0 <= id < self.num_boards) and \
+               (chess5.chessboards[id].chessboard_matrix.item(x + step * dx, y + step * dy) != 0):
+                return True
+        return False
+
+    def get_crossing_lines(self, time, mult):
+        """
+        Returns open lines that go through (time, mult)
+        """
+        lines = self.crossing_lines.get((time, mult))
+        if lines is None:
+            lines = []
+            for line in self.open_lines:
+                royal, board, steps, dt, dm = line
+                step = max(abs(time - royal[2]), abs(mult - royal[3]))
+                if 0 < step < steps and (royal[2] + step * dt, royal[3] + step * dm) == (time, mult):
+                    lines.append(line)
+            self.crossing_lines[(time, mult)] = lines
+        return lines
+
+    def is_in_check_after_move(self, num_boards, target=None):
+        """
+        Checks if the player is in check after a move
+
+        Args:
+            num_boards (int): number of boards before the move. All boards after it are new.
+            target (tuple): integer 4d vector of the target square of the move. New boards only
+                differ from their board of origin there and on the square the piece left, 
+                so royal pieces are looked for only there. Defaults to None, which scans new boards.
+
+        Returns:
+            bool: True if in check
+        """
+        generator = self.generator
+        chess5 = generator.chess5
+        opponent = self.opponent
+        # Old playable boards stop being playable when their timeline moves on
+        attacker_boards = [ board for board in self.attacker_boards
+                            if chess5.timeline_heads[board[1]] == board[0] ]
+        for board in attacker_boards:
+            if board[2] in self.attacking_boards:
+                return True
+
+        new_boards = []
+        for id in range(num_boards, len(chess5.chessboards)):
+            time, mult = chess5.timemult_coords[id][0], chess5.timemult_coords[id][1]
+            new_boards.append((time, mult, id))
+        if self.all_heads:
+            new_attacker_boards = [ board for board in new_boards if chess5.timeline_heads[board[1]] == board[0] ]
+        else:
+            new_attacker_boards = [ board for board in new_boards if chess5.get_board_color(board[0]) == opponent ]
+
+        for board in new_attacker_boards: # Attacks from new boards on old royal pieces
+            if self.is_attacking_royals(board):
+                return True
+        for time, mult, id in new_boards: # Attacks through new boards
+            for royal, board, steps, dt, dm in self.get_crossing_lines(time, mult):
+                if (chess5.timeline_heads[board[1]] == board[0]) and \
+                   (generator.find_attacker(royal, opponent, [board]) is not None):
+                    return True
+        attacker_boards += new_attacker_boards
+        for time, mult, id in new_boards: # Attacks on royal pieces on new boards
+            for x, y in self.get_new_royal_squares(id, target):
+                royal = (x, y, time, mult)
+                for board in attacker_boards:
+                    squares = self.get_open_attack_squares(royal, board[0], board[1])
+                    if generator.find_attacker_on_board(royal, opponent, board, squares) is not None:
+                        return True
+        return False
+
+    def get_new_royal_squares(self, id, target):
+        """
+        Finds royal pieces of the player on a board created by a move
+        """
+        generator = self.generator
+        chessboard = generator.chess5.chessboards[id]
+        if (target is None) or not (0 <= chessboard.origin < self.num_boards):
+            return generator.get_royal_squares(id, self.color)
+        matrix = chessboard.chessboard_matrix
+        squares = generator.get_royal_squares(chessboard.origin, self.color) + [ (target[0], target[1]) ]
+        return [ (x, y) for x, y in squares if piece_by_value[int(matrix.item(x, y))] in self.royal_pieces ]
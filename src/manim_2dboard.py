@@ -1,6 +1,6 @@
 from manim import *
 import numpy as np
-from chess_db_2d import Chessboard_2D, ChessUtils_2D
+from chess_db_2d import Chessboard_2D, chess_utils_2d
 from typing import Optional
 from manim_slides import ThreeDSlide
 
@@ -82,7 +82,7 @@ class Manim_Chessboard_2D(VGroup):
             self.chessboard = Chessboard_2D(chessboard_tm_pos=tm_loc, n=board_size)
         else:
             self.chessboard = chessboard
-        self.chessutils = ChessUtils_2D()
+        self.chessutils = chess_utils_2d
 
         # Other parameters
         self.delta = 0.01 # A small value to displace the sphere
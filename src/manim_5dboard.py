@@ -1,6 +1,6 @@
 from manim import *
 import numpy as np
-from chess_db_2d import Chessboard_2D, ChessUtils_2D
+from chess_db_2d import Chessboard_2D, chess_utils_2d
 from chess_db_5d import Chessboard_5D
 from manim_2dboard import Manim_Chessboard_2D, ChessboardColors
 from manim_slides import ThreeDSlide
@@ -53,7 +53,7 @@ class Manim_Chessboard_5D(VGroup):
         # 0 for 1st turn to white, 1 for 1st turn to black. Important for multiverse creation directions
         self.first_turn_black = 0
 
-        self.chess2utils = ChessUtils_2D()
+        self.chess2utils = chess_utils_2d
         self.chess5 = Chessboard_5D(chessboard_size=self.board_size,
                                     first_turn_black=self.first_turn_black,
                                     log=self.log)
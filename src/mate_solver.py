@@ -0,0 +1,372 @@
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from chess_db_5d import Chessboard_5D
+from legal_moves import LegalMoveGenerator
+from search import SearchAborted, format_moves
+
+# Result of a mate search. mate_in is the number of moves of the attacker needed to mate
+# (None if no mate was found), line is a mating line of LegalMove tuples, refuted tells
+# that there is no mate in max_moves, complete is False if the search ran out of budget.
+MateResult = namedtuple("MateResult", ["mate_in", "line", "refuted", "complete", "nodes",
+                                       "seconds", "nodes_per_second"])
+
+# Puzzle positions: name -> (pieces as (piece, square, time, multiverse), number of moves to mate).
+# Boards are created empty at every (time, multiverse) that is used, light moves first.
+# Mating lines go through time travel: a king can escape to a past board, which starts a new timeline.
+mate_puzzles = MappingProxyType({
+    "queen_1": ([("kd", "h8", 0, 0), ("ql", "g6", 0, 0), ("kl", "f6", 0, 0)], 1),
+    "queen_back_rank_2": ([("kd", "e8", 0, 0), ("ql", "a1", 0, 0), ("kl", "e6", 0, 0)], 2),
+    "queen_far_2": ([("kd", "d8", 0, 0), ("ql", "h1", 0, 0), ("kl", "d6", 0, 0)], 2),
+    "queen_chase_3": ([("kd", "a8", 0, 0), ("ql", "h2", 0, 0), ("kl", "c6", 0, 0)], 3),
+})
+# Budgets of the checks-only search per puzzle: name -> (max nodes, seconds). The node budgets are
+# about three times what the solver needs, so that solve_mate_puzzles fails when a change of move
+# ordering makes it search much more, instead of only getting slower.
+mate_puzzle_budgets = MappingProxyType({
+    "queen_1": (20, 5.),
+    "queen_back_rank_2": (700, 10.),
+    "queen_far_2": (1500, 10.),
+    "queen_chase_3": (400, 10.),
+})
+
+
+def setup_mate_puzzle(name, storage="list"):
+    """
+    Creates one of the puzzle positions
+
+    Args:
+        name (str): key of mate_puzzles
+        storage (str): storage type of Chessboard_5D (list, tensor or delta)
+
+    Returns:
+        tuple: (Chessboard_5D, number of moves to mate)
+    """
+    if name not in mate_puzzles:
+        raise ValueError(f"Unknown mate puzzle {name}. Possible values: {list(mate_puzzles)}")
+    pieces, mate_in = mate_puzzles[name]
+    chess5 = Chessboard_5D(storage=storage)
+    for piece, square, time, mult in pieces:
+        if chess5.get_chessboard_by_tm([time, mult]) == -1:
+            chess5.add_empty_chessboard([time, mult])
+        chess5.add_piece(piece, [square, time, mult])
+    return chess5, mate_in
+
+
+class MateSolver:
+    """
+    Proves or refutes mate in N for the player to move, with iterative deepening over N
+    and a depth-first AND/OR search.
+
+    N counts moves of the attacker. In 5D chess a player can move several times in a row
+    (once per playable board), and each of those moves counts. At the attacker's last move
+    only checking moves are tried, and solved subpositions are cached by Zobrist key:
+    a mate in n is also a mate in more moves, and no mate in n means no mate in fewer.
+    """
+    def __init__(self, chess5, checks_only=False):
+        """
+        Create a new instance of class
+
+        Args:
+            chess5 (Chessboard_5D): the position. Moves are made and undone on it.
+            checks_only (bool): whether the attacker only plays checking moves, as in most
+                puzzles. Much faster, but a refutation then only means there's no mate by checks.
+                Defaults to False.
+        """
+        self.chess5 = chess5
+        self.checks_only = checks_only
+        self.generator = LegalMoveGenerator(chess5)
+        self.proven = {} # (zobrist key, attacker to move) -> fewest attacker moves known to mate
+        self.refuted = {} # (zobrist key, attacker to move) -> most attacker moves known not to mate
+        self.mating_moves = {} # zobrist key -> (origin, target) of a mating attacker move
+        self.nodes = 0
+        self.deadline = None
+        self.max_nodes = None
+
+    def solve(self, max_moves, time_limit=None, max_nodes=None, log=False):
+        """
+        Looks for the shortest mate of the player to move in up to max_moves moves
+
+        Args:
+            max_moves (int): maximum number of attacker moves
+            time_limit (float): time budget in seconds. Defaults to None (no limit).
+            max_nodes (int): node budget. Defaults to None (no limit).
+            log (bool): whether to output every finished iteration into the terminal
+
+        Returns:
+            MateResult: mate length and mating line, or refutation
+        """
+        if max_moves < 1:
+            raise ValueError(f"Number of moves to mate should be at least 1. You have: {max_moves}")
+        chess5 = self.chess5
+        start = time.perf_counter()
+        self.deadline = None if time_limit is None else start + time_limit
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.attacker = chess5.get_player_to_move()
+        root_state = chess5.checkpoint()
+
+        mate_in, complete = None, True
+        for num_moves in range(1, max_moves + 1):
+            try:
+                found = self.attacker_mates(num_moves)
+            except SearchAborted:
+                chess5.rollback(root_state) # Moves only add boards, so this undoes all of them
+                complete = False
+                break
+            if log:
+                print(f"mate in {num_moves}: {'found' if found else 'none'}, {self.nodes} nodes, "+
+                      f"{time.perf_counter() - start:.3f} s")
+            if found:
+                mate_in = num_moves
+                break
+        line = self.get_mating_line(mate_in) if mate_in is not None else []
+        seconds = time.perf_counter() - start
+        return MateResult(mate_in, line, (mate_in is None) and complete, complete, self.nodes, seconds,
+                          self.nodes / seconds if seconds > 0 else 0.)
+
+    def count_node(self):
+        """Counts a searched position and stops the search when the budget runs out"""
+        self.nodes += 1
+        if (self.max_nodes is not None) and (self.nodes > self.max_nodes):
+            raise SearchAborted()
+        if (self.deadline is not None) and (time.perf_counter() > self.deadline):
+            raise SearchAborted()
+
+    def attacker_mates(self, num_moves):
+        """
+        OR node: checks if the attacker, to move, can mate in num_moves moves
+
+        Args:
+            num_moves (int): number of attacker moves left, at least 1
+
+        Returns:
+            bool: True if the attacker mates
+        """
+        self.count_node()
+        chess5 = self.chess5
+        key = (chess5.zobrist_key, True)
+        if self.proven.get(key, num_moves + 1) <= num_moves:
+            return True
+        if self.refuted.get(key, 0) >= num_moves:
+            return False
+
+        last_move = num_moves == 1
+        mates = False
+        for move in self.get_attacker_moves(last_move or self.checks_only, last_move):
+            state = chess5.checkpoint()
+            self.generator.make_move(move.origin, move.target)
+            if chess5.get_player_to_move() == self.attacker:
+                mates = (not last_move) and self.attacker_mates(num_moves - 1)
+            else:
+                mates = self.defender_is_mated(num_moves - 1)
+            chess5.rollback(state)
+            if mates:
+                self.mating_moves[chess5.zobrist_key] = (move.origin, move.target)
+                break
+
+        if mates:
+            self.proven[key] = num_moves
+        else:
+            self.refuted[key] = num_moves
+        return mates
+
+    def get_attacker_moves(self, checks_only, last_move):
+        """
+        Yields legal moves of the attacker in the order to try them, starting with the move
+        that mated in an earlier iteration. At the last move, checks are generated lazily,
+        so that the search stops testing moves once one of them mates. Before that, checks 
+        that leave the defender the fewest replies come first.
+
+        Args:
+            checks_only (bool): whether to only yield moves that give check
+            last_move (bool): whether this is the last move of the attacker
+
+        Yields:
+            LegalMove: moves of the attacker
+        """
+        mating_move = self.mating_moves.get(self.chess5.zobrist_key)
+        if checks_only and last_move:
+            for move in self.iter_legal_moves_first(mating_move, check_flags=True):
+                if move.gives_check:
+                    yield move
+            return
+        legal_moves = self.generator.get_legal_moves(check_flags=checks_only)
+        if checks_only: # Only a check can mate
+            legal_moves = sorted((move for move in legal_moves if move.gives_check), key=self.count_replies)
+        else:
+            legal_moves = sorted(legal_moves, key=lambda move: not move.captured)
+        yield from sorted(legal_moves, key=lambda move: (move.origin, move.target) != mating_move)
+
+    def count_replies(self, move, max_replies=8):
+        """
+        Counts legal replies of the defender after a move, up to max_replies
+
+        Returns:
+            int: number of replies, max_replies + 1 if the attacker is still to move
+        """
+        chess5 = self.chess5
+        state = chess5.checkpoint()
+        self.generator.make_move(move.origin, move.target)
+        num_replies = max_replies + 1
+        if chess5.get_player_to_move() != self.attacker:
+            num_replies = 0
+            for reply in self.generator.iter_legal_moves():
+                num_replies += 1
+                if num_replies == max_replies:
+                    break
+        chess5.rollback(state)
+        return num_replies
+
+    def iter_legal_moves_first(self, first_move, check_flags=False):
+        """
+        Yields legal moves of the player to move as they are found, starting with one move if it's legal
+
+        Args:
+            first_move (tuple): (origin, target) of the move to yield first, or None
+            check_flags (bool): whether to find out if moves give check
+
+        Yields:
+            LegalMove: legal moves
+        """
+        generator = self.generator
+        if first_move is not None: # Only the target board of the move is looked at
+            target = first_move[1]
+            for move in generator.iter_legal_moves(check_flags, target_boards={(target[2], target[3])}):
+                if (move.origin, move.target) == first_move:
+                    yield move
+                    break
+        for move in generator.iter_legal_moves(check_flags):
+            if (move.origin, move.target) != first_move:
+                yield move
+
+    def defender_is_mated(self, num_moves):
+        """
+        AND node: checks if the defender, to move, is mated now or after every reply
+        within num_moves more attacker moves
+
+        Args:
+            num_moves (int): number of attacker moves left
+
+        Returns:
+            bool: True if the defender can't escape mate
+        """
+        self.count_node()
+        chess5 = self.chess5
+        key = (chess5.zobrist_key, False)
+        if self.proven.get(key, num_moves + 1) <= num_moves:
+            return True
+        if self.refuted.get(key, -1) >= num_moves:
+            return False
+
+        # Replies are generated lazily, so the search stops at the first one that escapes
+        has_moves, mated = False, True
+        for move in self.generator.iter_legal_moves():
+            has_moves = True
+            if num_moves == 0: # Mated only if there are no legal moves
+                mated = False
+                break
+            state = chess5.checkpoint()
+            self.generator.make_move(move.origin, move.target)
+            if chess5.get_player_to_move() == self.attacker:
+                mated = self.attacker_mates(num_moves)
+            else:
+                mated = self.defender_is_mated(num_moves)
+            chess5.rollback(state)
+            if not mated:
+                break
+        if not has_moves:
+            mated = self.generator.is_in_check(chess5.get_player_to_move())
+
+        if mated:
+            self.proven[key] = num_moves if has_moves else 0
+        else:
+            self.refuted[key] = num_moves
+        return mated
+
+    def get_mating_line(self, num_moves):
+        """
+        Follows the cached results to a mate: mating moves of the attacker,
+        and the replies of the defender that hold out the longest
+
+        Args:
+            num_moves (int): number of attacker moves to mate from the current position
+
+        Returns:
+            list: LegalMove tuples
+        """
+        chess5 = self.chess5
+        root_state = chess5.checkpoint()
+        line = []
+        while True:
+            legal_moves = self.generator.get_legal_moves()
+            if not legal_moves:
+                break
+            if chess5.get_player_to_move() == self.attacker:
+                mating_move = self.mating_moves.get(chess5.zobrist_key)
+                moves = [ move for move in legal_moves if (move.origin, move.target) == mating_move ]
+                if not moves:
+                    break
+                move = moves[0]
+            else: # Reply after which mate takes the most attacker moves
+                move, longest = None, -1
+                for reply in legal_moves:
+                    state = chess5.checkpoint()
+                    self.generator.make_move(reply.origin, reply.target)
+                    attacker_to_move = chess5.get_player_to_move() == self.attacker
+                    moves_to_mate = self.proven.get((chess5.zobrist_key, attacker_to_move), -1)
+                    chess5.rollback(state)
+                    if moves_to_mate > longest:
+                        move, longest = reply, moves_to_mate
+                if move is None:
+                    break
+            line.append(move)
+            self.generator.make_move(move.origin, move.target)
+            if len(line) > 4 * num_moves * max(1, len(chess5.timeline_heads)): # Guard against cycles
+                break
+        chess5.rollback(root_state)
+        return line
+
+
+def solve_mate_puzzles(storage="list", puzzles=None, checks_only=True, log=True):
+    """
+    Solves the puzzle positions and prints solve time and node counts.
+    Every puzzle must be solved at its stated length, and checks-only searches
+    within the puzzle's budget (see mate_puzzle_budgets).
+
+    Args:
+        storage (str): storage type of Chessboard_5D (list, tensor or delta)
+        puzzles (list): names of puzzles. Defaults to None, which takes all of mate_puzzles.
+        checks_only (bool): whether the attacker only plays checks, see MateSolver. Defaults to True.
+        log (bool): whether to output the results into the terminal
+
+    Returns:
+        dict: puzzle name -> MateResult
+
+    Raises:
+        ValueError: if a puzzle is not solved at its stated length, or runs out of budget
+    """
+    if puzzles is None:
+        puzzles = list(mate_puzzles)
+    results = {}
+    for name in puzzles:
+        chess5, mate_in = setup_mate_puzzle(name, storage=storage)
+        max_nodes, time_limit = mate_puzzle_budgets[name] if checks_only else (None, None)
+        result = MateSolver(chess5, checks_only=checks_only).solve(mate_in, time_limit=time_limit, max_nodes=max_nodes)
+        results[name] = result
+        if log:
+            found = f"mate in {result.mate_in}" if result.mate_in is not None else "no mate"
+            print(f"{name}: {found} (expected {mate_in}), {result.nodes} nodes in {result.seconds:.3f} s, "+
+                  f"{result.nodes_per_second:.0f} nodes/s")
+            print(f"    {format_moves(result.line)}")
+        if not result.complete:
+            raise ValueError(f"{name}: ran out of budget ({max_nodes} nodes, {time_limit} s) "+
+                             f"after {result.nodes} nodes in {result.seconds:.3f} s")
+        if result.mate_in != mate_in:
+            raise ValueError(f"{name}: expected mate in {mate_in}, found " +
+                             (f"mate in {result.mate_in}" if result.mate_in is not None else "no mate"))
+    return results
+
+
+if __name__ == "__main__":
+    solve_mate_puzzles()
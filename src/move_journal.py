@@ -0,0 +1,168 @@
+from collections import namedtuple
+from chess_db_2d import piece_values_dict
+
+# A change recorded by MoveJournal, with what it takes to undo it:
+#   action, args: journal method and its arguments, to redo the change
+#   num_boards, storage_boards: numbers of boards and storage slots before the change, later boards are new
+#   heads: (multiverse, head time or None) of the timelines the change could extend, before it
+#   max_mult_white, max_mult_black, tm_bounds, zobrist_key: counters of the multiverse before the change
+#   squares: (board id, x, y, old value) of squares changed on boards that existed before
+JournalEntry = namedtuple("JournalEntry", ["action", "args", "num_boards", "storage_boards", "heads",
+                                           "max_mult_white", "max_mult_black", "tm_bounds", "zobrist_key", "squares"])
+
+
+class MoveJournal:
+    """
+    Undo and redo of moves and piece edits on a multiverse, to explore variations in place
+    instead of copying the whole Chessboard_5D.
+
+    Every change is recorded as a small JournalEntry: boards added by it, squares it changed on
+    existing boards and the counters it replaced. unmake removes the new boards and puts back
+    the old squares and counters, in time proportional to the size of the change.
+    Changes made to the multiverse without the journal must be undone before using it again.
+    """
+    def __init__(self, chess5):
+        """
+        Create a new instance of class
+
+        Args:
+            chess5 (Chessboard_5D): the multiverse to change
+        """
+        self.chess5 = chess5
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def __len__(self):
+        """Number of changes that can be undone"""
+        return len(self.undo_stack)
+
+    def can_undo(self):
+        return len(self.undo_stack) > 0
+
+    def can_redo(self):
+        return len(self.redo_stack) > 0
+
+    def clear(self):
+        """Forgets all changes, the multiverse keeps its current state"""
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    # Changes
+
+    def movie_piece(self, original_pos, final_pos):
+        """
+        Moves a piece with Chessboard_5D.movie_piece, and records the move
+
+        Args:
+            original_pos (list): original position, i.e. ['a1', 2, 3]
+            final_pos (list): final position, i.e. ['a1', 2, 3]
+        """
+        self.redo_stack.clear()
+        self.apply("movie_piece", (original_pos, final_pos))
+
+    def movie_piece_4d(self, original_vec, final_vec):
+        """
+        Moves a piece with Chessboard_5D.movie_piece_4d, and records the move
+
+        Args:
+            original_vec (tuple): original position, i.e. (0, 0, 2, 3)
+            final_vec (tuple): final position
+        """
+        self.redo_stack.clear()
+        self.apply("movie_piece_4d", (original_vec, final_vec))
+
+    def set_piece(self, piece, vec):
+        """
+        Puts a piece on a square of an existing board (or empties it), without evolving the board,
+        and records the old piece. Used e.g. for move markers.
+
+        Args:
+            piece (str): piece acronym, or "" to empty the square
+            vec (tuple): integer 4d vector of the square
+        """
+        if piece not in piece_values_dict:
+            raise ValueError(f"Unknown piece: {piece}")
+        self.redo_stack.clear()
+        self.apply("set_piece", (piece, vec))
+
+    def apply(self, action, args):
+        """
+        Makes a change and pushes its journal entry
+        """
+        chess5 = self.chess5
+        heads = chess5.timeline_heads
+        squares = []
+        if action == "set_piece":
+            piece, (x, y, time, mult) = args
+            id = chess5.get_chessboard_by_tm([time, mult])
+            if id == -1:
+                raise ValueError(f"No chessboard was found at location {[time, mult]}")
+            touched_mults = ()
+        elif action == "movie_piece":
+            touched_mults = (args[0][2], args[1][2])
+        else:
+            touched_mults = (args[0][3], args[1][3])
+        storage_boards = None if chess5.storage is None else chess5.storage.num_boards
+        entry = JournalEntry(action, args, len(chess5.chessboards), storage_boards,
+                             tuple((mult, heads.get(mult)) for mult in touched_mults),
+                             chess5.max_mult_white, chess5.max_mult_black, chess5.tm_bounds, chess5.zobrist_key, squares)
+        if action == "set_piece":
+            chessboard = chess5.chessboards[id]
+            squares.append((id, x, y, int(chessboard.chessboard_matrix[x, y])))
+            chessboard.set_square_value(x, y, piece_values_dict[piece])
+        elif action == "movie_piece":
+            chess5.movie_piece(*args)
+        else:
+            chess5.movie_piece_4d(*args)
+        self.undo_stack.append(entry)
+
+    # Undo and redo
+
+    def unmake(self):
+        """
+        Undoes the last change
+
+        Returns:
+            JournalEntry: entry of the undone change
+        """
+        if not self.undo_stack:
+            raise ValueError("No changes to undo")
+        entry = self.undo_stack.pop()
+        chess5 = self.chess5
+        chessboards = chess5.chessboards
+        for id, x, y, value in reversed(entry.squares):
+            chessboards[id].set_square_value(x, y, value)
+        removed_locations = chess5.remove_boards(entry.num_boards)
+
+        # New boards extend a timeline by one board, or start a new one
+        heads = chess5.timeline_heads
+        old_heads = dict(entry.heads)
+        for time, mult in removed_locations:
+            old_head = old_heads.get(mult)
+            if old_head is None:
+                heads.pop(mult, None)
+            else:
+                heads[mult] = old_head
+        chess5.max_mult_white, chess5.max_mult_black = entry.max_mult_white, entry.max_mult_black
+        chess5.tm_bounds = entry.tm_bounds
+        chess5.zobrist_key = entry.zobrist_key
+        if entry.storage_boards is not None:
+            chess5.storage.num_boards = entry.storage_boards
+        if removed_locations:
+            for listener in chess5.board_listeners:
+                listener.on_boards_removed(entry.num_boards, removed_locations)
+        self.redo_stack.append(entry)
+        return entry
+
+    def redo(self):
+        """
+        Makes the last undone change again
+
+        Returns:
+            JournalEntry: entry of the change
+        """
+        if not self.redo_stack:
+            raise ValueError("No changes to redo")
+        entry = self.redo_stack.pop()
+        self.apply(entry.action, entry.args)
+        return self.undo_stack[-1]
@@ -1,43 +1,62 @@
 import numpy as np
 import itertools
-from chess_db_2d import ChessUtils_2D
+from types import MappingProxyType
+from chess_db_2d import chess_utils_2d, piece_color_codes
+
+unbounded_ray = 2**62 # ray length along directions that don't leave a bounded range
+
+
+def ray_lengths(pos, dr_components, lower, upper):
+    """
+    Counts how many steps fit inside [lower, upper] along one coordinate
+
+    Args:
+        pos (int or np.array): starting coordinate(s), broadcast against dr_components
+        dr_components (np.array): step of every ray along this coordinate
+        lower (int): lowest allowed coordinate
+        upper (int): highest allowed coordinate
+
+    Returns:
+        np.array: number of steps per ray, unbounded_ray for rays that don't move along this coordinate
+    """
+    forward = (upper - pos) // np.maximum(dr_components, 1)
+    backward = (pos - lower) // np.maximum(-dr_components, 1)
+    return np.where(dr_components > 0, forward, np.where(dr_components < 0, backward, unbounded_ray))
 
 
 class Moves():
     """Class containing moves of all chess pieces"""
     def __init__(self):
         """Create a new instance of class"""
-        # dr vectors for moves
-        self.orth = self.generate_perms_with_signs([1, 0, 0, 0])
-        self.diag = self.generate_perms_with_signs([1, 1, 0, 0])
-        self.tri =  self.generate_perms_with_signs([1, 1, 1, 0])
-        self.quad = self.generate_perms_with_signs([1, 1, 1, 1])
-        self.knight = self.generate_perms_with_signs([2, 1, 0, 0])
-        self.pawn = self.generate_pawn_perms_with_signs([[0,1,0,0], [0,0,0,1]])
-        self.pawn_eat = self.generate_pawn_perms_with_signs([[1,1,0,0], [0,0,1,1]])
-        self.brawn_eat = self.generate_pawn_perms_with_signs([[1,1,0,0], [0,0,1,1]])
-        self.queen = self.orth + self.diag + self.tri + self.quad
-        self.princess = self.orth + self.diag
-        self.dr = {
-            "r": self.orth, # rook
-            "b": self.diag, # bishop
-            "u": self.tri,  # unicorn
-            "d": self.quad, # dragon
-            "n": self.knight, # knight
-            "P": self.princess, # princess
-            "q": self.queen, # queen
-            "k": self.queen, # king
-            "R": self.queen, # royal queen
-            "c": self.queen, # common king
-            "p": self.pawn, # pawn has special moves
-            "B": self.pawn, # brawn has special moves
-            "p_eat": self.pawn_eat, # eat moves for pawn - also can change 1st and 4th components to -1
-            "B_eat": self.brawn_eat, # eat moves for brawn
-        }
-
-        self.utils2d = ChessUtils_2D()
-
-    def generate_perms(self, array):
+        # dr vectors for moves. They are computed once per process and shared, see dr_tables
+        self.dr = dr_tables
+        self.orth = dr_tables["r"]
+        self.diag = dr_tables["b"]
+        self.tri = dr_tables["u"]
+        self.quad = dr_tables["d"]
+        self.knight = dr_tables["n"]
+        self.pawn = dr_tables["p"]
+        self.pawn_eat = dr_tables["p_eat"]
+        self.brawn_eat = dr_tables["B_eat"]
+        self.queen = dr_tables["q"]
+        self.princess = dr_tables["P"]
+
+        # Same dr vectors as integer arrays, for batched move generation
+        self.dr_arrays = dr_arrays
+        self.ray_tables = ray_tables
+
+        self.utils2d = chess_utils_2d
+
+    def __deepcopy__(self, memo):
+        """All tables are shared and immutable, so copies of boards keep sharing them"""
+        return self
+
+    def __reduce__(self):
+        """Nothing to pickle, the tables are rebuilt from the module on load"""
+        return (Moves, ())
+
+    @staticmethod
+    def generate_perms(array):
         """
         Generates a list of all possible permutations of an array or a list of arrays.
         """
@@ -51,18 +70,20 @@ class Moves():
         unique_permutations = list(set(permutations))
         return sorted(unique_permutations)  # Return the sorted list
     
-    def generate_perms_with_signs(self, array) -> list:
+    @staticmethod
+    def generate_perms_with_signs(array) -> list:
         """
         Generates a list of all possible permutations of an array with sign variations
         """
-        perms = self.generate_perms(array)
+        perms = Moves.generate_perms(array)
         signed_perms = []
         for move in perms:
            for signs in itertools.product([-1, 1], repeat=4):
                signed_perms.append(tuple(sign * component for sign, component in zip(signs, move)))
         return sorted(set(signed_perms))  # Remove duplicates
 
-    def generate_pawn_perms_with_signs(self, array) -> list:
+    @staticmethod
+    def generate_pawn_perms_with_signs(array) -> list:
         """
         Generates a list of all possible permutations of an array with sign variations
         applied only to the 1st and 4th components.
@@ -113,6 +134,63 @@ class Moves():
         """
         return self.dr.get(piece_type, [])
 
+    def get_dr_array(self, piece_type):
+        """
+        Retrieves the moves for a given piece in dr notation, as an (k, 4) integer array
+        """
+        return self.dr_arrays.get(piece_type, np.zeros([0, 4], dtype=np.int64))
+
+    def get_ray_table(self, piece_type, chessboard_size):
+        """
+        Returns the ray lengths of a piece for every origin square, only taking x and y into account.
+        Tables are computed once per piece type and chessboard size.
+
+        Args:
+            piece_type (str): Name of the piece (no color).
+            chessboard_size (int): size of the 2D chessboards
+
+        Returns:
+            np.array: read-only integer array of shape (n, n, k), where k is the number of
+                dr vectors of the piece. Rays that don't move in x and y get unbounded_ray.
+        """
+        key = (piece_type, chessboard_size)
+        table = self.ray_tables.get(key)
+        if table is None:
+            drs = self.get_dr_array(piece_type)
+            squares = np.arange(chessboard_size)
+            table = np.full([chessboard_size, chessboard_size, len(drs)], unbounded_ray, dtype=np.int64)
+            for axis in range(2):
+                pos = squares[:, None] # origin coordinate along this axis
+                lengths = ray_lengths(pos, drs[:, axis], 0, chessboard_size - 1)
+                lengths = lengths[:, None, :] if axis == 0 else lengths[None, :, :]
+                table = np.minimum(table, lengths)
+            table.flags.writeable = False
+            self.ray_tables[key] = table
+        return table
+
+    def get_ray_limits(self, piece_type, pos_4d, extent):
+        """
+        Finds how far a piece can travel along each of its rays before leaving the multiverse
+
+        Args:
+            piece_type (str): Name of the piece (no color).
+            pos_4d (array): a 4d vector that gives the position of the piece
+            extent (tuple): (chessboard size, min time, max time, min multiverse, max multiverse)
+                of the existing chessboards
+
+        Returns:
+            np.array: maximal number of steps along each dr vector of the piece
+        """
+        n, t_min, t_max, m_min, m_max = extent
+        x, y, t, m = pos_4d
+        drs = self.get_dr_array(piece_type)
+        # x and y come from the precomputed table, t and m are clipped at query time.
+        # Pieces that move in a line step by -1, 0 or 1 along every axis, so the clipped 
+        # length along an axis can be picked by the sign of the step.
+        t_lengths = np.array([t - t_min, unbounded_ray, t_max - t])[drs[:, 2] + 1]
+        m_lengths = np.array([m - m_min, unbounded_ray, m_max - m])[drs[:, 3] + 1]
+        return np.minimum(np.minimum(self.get_ray_table(piece_type, n)[x, y], t_lengths), m_lengths)
+
     def get_all_movable_spaces(self, check_if_move_possible, piece, pos, log=False, force_single_moves=False):
         """
         Gets a list of all spaces, where a piece can move to
@@ -128,10 +206,37 @@ class Moves():
         Returns:
             moves_list (list): list of 3-lists of all possible moves
         """
+        def check_if_move_possible_4d(vec, piece_color):
+            return check_if_move_possible(self.convert_4d_vec_to_3list(vec), piece_color)
+
+        pos_4d = self.convert_3list_to_4d_vec(pos)
+        moves_list = self.get_all_movable_spaces_4d(check_if_move_possible_4d, piece, pos_4d, 
+                                                    log=log, force_single_moves=force_single_moves)
+        return [ self.convert_4d_vec_to_3list(vec) for vec in moves_list ]
+
+    def get_all_movable_spaces_4d(self, check_if_move_possible, piece, pos_4d, log=False, force_single_moves=False, 
+                                  extent=None):
+        """
+        Gets a list of all spaces, where a piece can move to, staying on integer 4d vectors
+
+        Args:
+            check_if_move_possible (func): Function that checks if moving to a 4d vector is possible
+            piece (str): name of the piece to be moved
+            pos_4d (array): a 4d vector that gives the position of the piece to be moved
+            log (bool): whether to output log into the terminal
+            force_single_moves (bool): whether to force single-space moves for pieces 
+                that move >1 square in a line (i.e. rook)
+            extent (tuple): (chessboard size, min time, max time, min multiverse, max multiverse)
+                of the existing chessboards. If given, pieces that move in a line 
+                only walk squares that can exist.
+
+        Returns:
+            moves_list (list): list of 4-tuples of all possible moves
+        """
         self.utils2d.piece_err(piece)
         piece_type, piece_color = list(piece)
         list_dr = self.get_dr(piece_type)
-        pos_4d = self.convert_3list_to_4d_vec(pos)
+        pos_4d = tuple(int(i) for i in pos_4d)
 
         if piece_type in ['k', 'c']: # Set of moves for king-like pieces (one-space move)
             return self.get_all_single_moves(check_if_move_possible, piece_color, 
@@ -146,44 +251,52 @@ class Moves():
                 return self.get_all_single_moves(check_if_move_possible, piece_color, 
                                                  list_dr, pos_4d, log)
             else:
+                ray_limits = None
+                if extent is not None:
+                    ray_limits = self.get_ray_limits(piece_type, pos_4d, extent).tolist()
                 return self.get_all_linear_moves(check_if_move_possible, piece_color, 
-                                                 list_dr, pos_4d, log)
+                                                 list_dr, pos_4d, log, ray_limits)
 
-    def get_all_linear_moves(self, check_if_move_possible, piece_color, list_dr, pos_4d, log=False):
+    def get_all_linear_moves(self, check_if_move_possible, piece_color, list_dr, pos_4d, log=False, 
+                             ray_limits=None):
         """
         Obtains movable spaces for pieces that move in straight lines (rooks, queens, bishops, etc.)
 
         Args:
-            check_if_move_possible (func): Function that checks if performing a move is possible
+            check_if_move_possible (func): Function that checks if moving to a 4d vector is possible
             piece_color (str): color of the piece to be moved
             list_dr (list): list of dr base vectors for a given piece
-            pos_4d (array): a 4d vector that gives the position of the piece to be moved
+            pos_4d (tuple): a 4d vector that gives the position of the piece to be moved
             log (bool): whether to output log into the terminal
+            ray_limits (list): maximal number of steps along each dr vector. 
+                Defaults to None, which walks every ray until it is blocked.
 
         Returns:
-            moves_list (list): list of 3-lists of all possible moves
+            moves_list (list): list of 4-tuples of all possible moves
         """
         moves_list = []
-        for base_dr in list_dr:
+        for i, base_dr in enumerate(list_dr):
+            steps_left = unbounded_ray if ray_limits is None else ray_limits[i]
             empty = 2 # This variable tracks if one can move to a next tile in line
             prev_pos = pos_4d # Start counting from the piece itself
-            while empty==2:
+            while empty==2 and steps_left > 0:
                 empty, prev_pos = self.test_single_tile(check_if_move_possible, prev_pos, base_dr, 
                                                         piece_color, moves_list, log)
+                steps_left -= 1
         return moves_list
 
     def get_all_pawn_moves(self, check_if_move_possible, piece, pos_4d, log):
         """
-        Obtains movable spaces for pieces that move in straight lines (rooks, queens, bishops, etc.)
+        Obtains movable spaces for pawn-like pieces (pawns, brawns)
 
         Args:
-            check_if_move_possible (func): Function that checks if performing a move is possible
+            check_if_move_possible (func): Function that checks if moving to a 4d vector is possible
             piece (str): piece name acronym
-            pos_4d (array): a 4d vector that gives the position of the piece to be moved
+            pos_4d (tuple): a 4d vector that gives the position of the piece to be moved
             log (bool): whether to output log into the terminal
 
         Returns:
-            moves_list (list): list of 3-lists of all possible moves
+            moves_list (list): list of 4-tuples of all possible moves
         """
         moves_list = []
         piece_type, piece_color = list(piece)
@@ -191,16 +304,8 @@ class Moves():
         list_dr_eat = self.get_dr(piece_type+"_eat")
 
         if piece_color=='d':
-            new_list_dr = []
-            new_list_dr_eat = []
-            for element in list_dr:
-                new_element = [ -1 * i for i in element ]
-                new_list_dr.append(new_element)
-            for element in list_dr_eat:
-                new_element = [ -1 * i for i in element ]
-                new_list_dr_eat.append(new_element)
-            list_dr = new_list_dr
-            list_dr_eat = new_list_dr_eat
+            list_dr = [ tuple(-1 * i for i in element) for element in list_dr ]
+            list_dr_eat = [ tuple(-1 * i for i in element) for element in list_dr_eat ]
 
         if log: print("Looking at the non-eating moves...")
         for base_dr in list_dr:
@@ -214,17 +319,17 @@ class Moves():
 
     def get_all_single_moves(self, check_if_move_possible, piece_color, list_dr, pos_4d, log):
         """
-        Obtains movable spaces for pieces that move in straight lines (rooks, queens, bishops, etc.)
+        Obtains movable spaces for pieces that move by a single step (kings, knights, etc.)
 
         Args:
-            check_if_move_possible (func): Function that checks if performing a move is possible
+            check_if_move_possible (func): Function that checks if moving to a 4d vector is possible
             piece_color (str): color of the piece to be moved
             list_dr (list): list of dr base vectors for a given piece
-            pos_4d (array): a 4d vector that gives the position of the piece to be moved
+            pos_4d (tuple): a 4d vector that gives the position of the piece to be moved
             log (bool): whether to output log into the terminal
 
         Returns:
-            moves_list (list): list of 3-lists of all possible moves
+            moves_list (list): list of 4-tuples of all possible moves
         """
         moves_list = []
         for base_dr in list_dr:
@@ -237,8 +342,8 @@ class Moves():
                          log=False, force_noeat=0):
         """
         Args:
-            check_if_move_possible (func): Function that checks if performing a move is possible
-            prev_pos (array): previous position in a line, or starting position if not in a line
+            check_if_move_possible (func): Function that checks if moving to a 4d vector is possible
+            prev_pos (tuple): previous position in a line, or starting position if not in a line
             base_dr (tuple): 4-element tuple, which contains the next step for tile position increment
             piece_color (str): color of the piece to be moved
             moves_list (list): list of moves found up to this point
@@ -253,17 +358,338 @@ class Moves():
                 0 if impossible
                 1 if possible with eating a piece
                 2 if possible without eating a piece
-            prev_pos (array): modified prev_pos value
+            new_pos (tuple): position of the tested tile
         """
         if log: print(prev_pos, base_dr)
-        new_pos = [0,0,0,0]
-        for i in range(len(base_dr)):
-            new_pos[i] = int(prev_pos[i]) + int(base_dr[i])
-        new_pos = self.convert_4d_vec_to_3list(new_pos)
+        x, y, t, m = prev_pos
+        dx, dy, dt, dm = base_dr
+        new_pos = (x + dx, y + dy, t + dt, m + dm)
         move_possible = check_if_move_possible(new_pos, piece_color)
         if move_possible: # 1 to eat enemy piece, 2 for moving through
             if ((force_noeat==0) or (force_noeat==move_possible)): 
                 moves_list.append(new_pos)
                 if log: print("Attaching this move...")
-        prev_pos=self.convert_3list_to_4d_vec(new_pos)
-        return move_possible, prev_pos
+        return move_possible, new_pos
+
+    # Move generation grouped by target board
+
+    def iter_board_moves(self, get_board, piece, pos_4d, chessboard_size, force_single_moves=False,
+                         force_noeat=0, target_boards=None):
+        """
+        Yields spaces where a piece can move to, reading squares straight from board matrices.
+        Moves are grouped by target board (see move_plans), so that every board is looked up once,
+        and pieces that move in a line walk all their rays towards a board together.
+        Yields the same squares as get_all_movable_spaces_4d, in a different order.
+
+        Args:
+            get_board (func): takes time and multiverse, and returns the matrix of the board there,
+                or None if there is no board
+            piece (str): name of the piece to be moved
+            pos_4d (tuple): integer 4d vector of the piece
+            chessboard_size (int): size of the chessboards
+            force_single_moves (bool): whether to force single-space moves for pieces
+                that move >1 square in a line (i.e. rook)
+            force_noeat (int): which moves to yield, same values as in test_single_tile:
+                0 (Default): all moves, 1: only moves that eat pieces, 2: only moves that don't
+            target_boards (set): (time, multiverse) of boards to yield moves to. Defaults to None,
+                which yields moves to all boards. Other boards are not looked up, unless a line goes through them.
+
+        Yields:
+            tuple: 4d vectors of possible moves
+        """
+        self.utils2d.piece_err(piece)
+        piece_type, piece_color = list(piece)
+        color_code = 1 if piece_color == 'l' else 2
+
+        if piece_type in ['p', 'B']: # Set of moves for pawn-like pieces (special)
+            move_plan, eat_plan = pawn_move_plans[(piece_type, piece_color)]
+            if force_noeat != 1: # Non-eating moves go to empty squares only
+                yield from self.iter_board_single_moves(get_board, move_plan, pos_4d, chessboard_size, 
+                                                        color_code, 2, target_boards)
+            if force_noeat != 2: # Eating moves only go to enemy pieces
+                yield from self.iter_board_single_moves(get_board, eat_plan, pos_4d, chessboard_size, 
+                                                        color_code, 1, target_boards)
+        elif piece_type in ['k', 'c', 'n'] or force_single_moves: # One-space moves and jumps
+            yield from self.iter_board_single_moves(get_board, move_plans[piece_type], pos_4d, chessboard_size, 
+                                                    color_code, force_noeat, target_boards)
+        else: # Set of moves for pieces that move in a line, i.e. all other pieces
+            yield from self.iter_board_linear_moves(get_board, move_plans[piece_type], pos_4d, chessboard_size, 
+                                                    color_code, force_noeat, target_boards)
+
+    def iter_board_single_moves(self, get_board, plan, pos_4d, chessboard_size, color_code, 
+                                force_noeat=0, target_boards=None):
+        """
+        Yields movable spaces for pieces that move by a single step, see iter_board_moves
+
+        Args:
+            plan (tuple): dr vectors grouped by target board, see move_plans
+            color_code (int): color code of the piece (1 for light, 2 for dark)
+        """
+        x, y, time, mult = pos_4d
+        n = chessboard_size
+        color_codes = color_code_by_value
+        quiet_moves, captures = force_noeat != 1, force_noeat != 2
+        for (dt, dm), xys in plan:
+            time2, mult2 = time + dt, mult + dm
+            if (target_boards is not None) and ((time2, mult2) not in target_boards):
+                continue
+            matrix = get_board(time2, mult2)
+            if matrix is None:
+                continue
+            for dx, dy in xys:
+                x2, y2 = x + dx, y + dy
+                if (0 <= x2 < n) and (0 <= y2 < n):
+                    value = int(matrix.item(x2, y2))
+                    if (quiet_moves if value == 0 else (captures and color_codes[value] != color_code)):
+                        yield (x2, y2, time2, mult2)
+
+    def iter_board_linear_moves(self, get_board, plan, pos_4d, chessboard_size, color_code, 
+                                force_noeat=0, target_boards=None):
+        """
+        Yields movable spaces for pieces that move in straight lines, see iter_board_moves.
+        Rays towards the same boards are walked together, one step at a time, until all are blocked.
+
+        Args:
+            plan (tuple): dr vectors grouped by target board, see move_plans
+            color_code (int): color code of the piece (1 for light, 2 for dark)
+        """
+        x, y, time, mult = pos_4d
+        n = chessboard_size
+        color_codes = color_code_by_value
+        quiet_moves, captures = force_noeat != 1, force_noeat != 2
+        for (dt, dm), xys in plan:
+            if (target_boards is not None) and (dt, dm) == (0, 0) and ((time, mult) not in target_boards):
+                continue
+            rays = xys # Rays that are not blocked yet
+            step = 1
+            while rays:
+                time2, mult2 = time + step * dt, mult + step * dm
+                matrix = get_board(time2, mult2)
+                if matrix is None:
+                    break
+                on_target = (target_boards is None) or ((time2, mult2) in target_boards)
+                open_rays = []
+                for dx, dy in rays:
+                    x2, y2 = x + step * dx, y + step * dy
+                    if (0 <= x2 < n) and (0 <= y2 < n):
+                        value = int(matrix.item(x2, y2))
+                        if value == 0:
+                            if quiet_moves and on_target:
+                                yield (x2, y2, time2, mult2)
+                            open_rays.append((dx, dy))
+                        elif captures and on_target and (color_codes[value] != color_code):
+                            yield (x2, y2, time2, mult2)
+                rays = open_rays
+                step += 1
+
+    # Batched move generation
+
+    def get_all_movable_spaces_batched(self, query_squares, piece, pos_4d, extent, 
+                                       log=False, force_single_moves=False):
+        """
+        Gets a list of all spaces, where a piece can move to, asking for the occupancy 
+        of all candidate squares in a few vectorized queries instead of one call per square
+
+        Args:
+            query_squares (func): Function that takes an (k, 4) integer array of 4d vectors and 
+                a piece color, and returns an array of k move possibilities (0, 1 or 2, 
+                same as check_if_move_possible)
+            piece (str): name of the piece to be moved
+            pos_4d (array): a 4d vector that gives the position of the piece to be moved
+            extent (tuple): (chessboard size, min time, max time, min multiverse, max multiverse)
+                of the existing chessboards
+            log (bool): whether to output log into the terminal
+            force_single_moves (bool): whether to force single-space moves for pieces 
+                that move >1 square in a line (i.e. rook)
+
+        Returns:
+            moves_list (list): list of 4-tuples of all possible moves, 
+                in the same order as get_all_movable_spaces_4d
+        """
+        self.utils2d.piece_err(piece)
+        piece_type, piece_color = list(piece)
+        list_dr = self.get_dr_array(piece_type)
+        pos_4d = np.array([int(i) for i in pos_4d], dtype=np.int64)
+        if log: print(f"Batched move search for {piece} at {tuple(pos_4d)}")
+
+        if piece_type in ['p', 'B']: # Set of moves for pawn-like pieces (special)
+            return self.get_batched_pawn_moves(query_squares, piece, pos_4d)
+        elif piece_type in ['k', 'c', 'n'] or force_single_moves: # One-space moves and jumps
+            return self.get_batched_single_moves(query_squares, piece_color, list_dr, pos_4d)
+        else: # Set of moves for pieces that move in a line, i.e. all other pieces
+            ray_limits = self.get_ray_limits(piece_type, pos_4d, extent)
+            return self.get_batched_linear_moves(query_squares, piece_color, list_dr, pos_4d, ray_limits)
+
+    def get_batched_single_moves(self, query_squares, piece_color, list_dr, pos_4d, force_noeat=0):
+        """
+        Obtains movable spaces for leapers (kings, knights, etc.) with a single query
+
+        Args:
+            query_squares (func): Function that answers move possibilities for an array of 4d vectors
+            piece_color (str): color of the piece to be moved
+            list_dr (np.array): (k, 4) array of dr base vectors for a given piece
+            pos_4d (np.array): a 4d vector that gives the position of the piece to be moved
+            force_noeat (int): same as in test_single_tile
+
+        Returns:
+            moves_list (list): list of 4-tuples of all possible moves
+        """
+        if len(list_dr) == 0:
+            return []
+        targets = pos_4d + list_dr
+        move_possible = query_squares(targets, piece_color)
+        if force_noeat == 0:
+            keep = move_possible > 0
+        else:
+            keep = move_possible == force_noeat
+        return [ tuple(vec) for vec in targets[keep].tolist() ]
+
+    def get_batched_pawn_moves(self, query_squares, piece, pos_4d):
+        """
+        Obtains movable spaces for pawn-like pieces (pawns, brawns) with a single query
+
+        Args:
+            query_squares (func): Function that answers move possibilities for an array of 4d vectors
+            piece (str): piece name acronym
+            pos_4d (np.array): a 4d vector that gives the position of the piece to be moved
+
+        Returns:
+            moves_list (list): list of 4-tuples of all possible moves
+        """
+        piece_type, piece_color = list(piece)
+        list_dr = self.get_dr_array(piece_type)
+        list_dr_eat = self.get_dr_array(piece_type+"_eat")
+        sign = -1 if piece_color=='d' else 1
+
+        targets = pos_4d + sign * np.concatenate([list_dr, list_dr_eat])
+        move_possible = query_squares(targets, piece_color)
+        # Non-eating moves go to empty squares only, eating moves only to enemy pieces
+        wanted = np.array([2] * len(list_dr) + [1] * len(list_dr_eat))
+        return [ tuple(vec) for vec in targets[move_possible == wanted].tolist() ]
+
+    def get_batched_linear_moves(self, query_squares, piece_color, list_dr, pos_4d, ray_limits):
+        """
+        Obtains movable spaces for pieces that move in straight lines (rooks, queens, bishops, etc.).
+        All squares that can exist on all rays are queried at once, 
+        then the first blocker on every ray is found with a segmented minimum.
+
+        Args:
+            query_squares (func): Function that answers move possibilities for an array of 4d vectors
+            piece_color (str): color of the piece to be moved
+            list_dr (np.array): (k, 4) array of dr base vectors for a given piece
+            pos_4d (np.array): a 4d vector that gives the position of the piece to be moved
+            ray_limits (np.array): maximal number of steps along each dr vector
+
+        Returns:
+            moves_list (list): list of 4-tuples of all possible moves
+        """
+        open_rays = ray_limits > 0
+        list_dr, ray_limits = list_dr[open_rays], ray_limits[open_rays]
+        if len(list_dr) == 0:
+            return []
+        # Flat list of (ray, step) pairs, ray by ray
+        ray_ids = np.repeat(np.arange(len(list_dr)), ray_limits)
+        ray_starts = np.cumsum(ray_limits) - ray_limits
+        steps = np.arange(len(ray_ids)) - ray_starts[ray_ids] + 1
+        targets = pos_4d + steps[:, None] * list_dr[ray_ids]
+        move_possible = query_squares(targets, piece_color)
+
+        # Step of the first square on every ray that is not empty
+        blocker_steps = np.where(move_possible != 2, steps, unbounded_ray)
+        first_blocker = np.minimum.reduceat(blocker_steps, ray_starts)[ray_ids]
+        # Keep empty squares before the blocker, and the blocker itself if it can be eaten
+        keep = (steps < first_blocker) | ((steps == first_blocker) & (move_possible == 1))
+        return [ tuple(vec) for vec in targets[keep].tolist() ]
+
+
+def build_dr_tables():
+    """
+    Computes dr vectors of all pieces. Only called once on import, use dr_tables instead.
+
+    Returns:
+        MappingProxyType: piece type -> tuple of 4-tuples
+    """
+    orth = tuple(Moves.generate_perms_with_signs([1, 0, 0, 0]))
+    diag = tuple(Moves.generate_perms_with_signs([1, 1, 0, 0]))
+    tri =  tuple(Moves.generate_perms_with_signs([1, 1, 1, 0]))
+    quad = tuple(Moves.generate_perms_with_signs([1, 1, 1, 1]))
+    knight = tuple(Moves.generate_perms_with_signs([2, 1, 0, 0]))
+    pawn = tuple(Moves.generate_pawn_perms_with_signs([[0,1,0,0], [0,0,0,1]]))
+    pawn_eat = tuple(Moves.generate_pawn_perms_with_signs([[1,1,0,0], [0,0,1,1]]))
+    brawn_eat = tuple(Moves.generate_pawn_perms_with_signs([[1,1,0,0], [0,0,1,1]]))
+    queen = orth + diag + tri + quad
+    princess = orth + diag
+    return MappingProxyType({
+        "r": orth, # rook
+        "b": diag, # bishop
+        "u": tri,  # unicorn
+        "d": quad, # dragon
+        "n": knight, # knight
+        "P": princess, # princess
+        "q": queen, # queen
+        "k": queen, # king
+        "R": queen, # royal queen
+        "c": queen, # common king
+        "p": pawn, # pawn has special moves
+        "B": pawn, # brawn has special moves
+        "p_eat": pawn_eat, # eat moves for pawn - also can change 1st and 4th components to -1
+        "B_eat": brawn_eat, # eat moves for brawn
+    })
+
+
+def build_dr_arrays(tables):
+    """
+    Converts dr tables to read-only (k, 4) integer arrays
+
+    Args:
+        tables (MappingProxyType): piece type -> tuple of 4-tuples
+
+    Returns:
+        MappingProxyType: piece type -> np.array
+    """
+    arrays = {}
+    for key, value in tables.items():
+        array = np.array(value, dtype=np.int64).reshape(-1, 4)
+        array.flags.writeable = False
+        arrays[key] = array
+    return MappingProxyType(arrays)
+
+
+def build_xy_by_tm(list_dr):
+    """
+    Groups dr vectors by their time-multiverse components
+
+    Returns:
+        dict: (dt, dm) -> tuple of (dx, dy)
+    """
+    xy_by_tm = {}
+    for dx, dy, dt, dm in list_dr:
+        xy_by_tm.setdefault((dt, dm), []).append((dx, dy))
+    return { key: tuple(value) for key, value in xy_by_tm.items() }
+
+
+def build_move_plans(list_dr):
+    """
+    Groups dr vectors by their time-multiverse components, keeping the order of first appearance,
+    so that every target board is looked up once per piece
+
+    Returns:
+        tuple: ((dt, dm), tuple of (dx, dy)) pairs
+    """
+    return tuple(build_xy_by_tm(list_dr).items())
+
+
+# dr tables, shared by all Moves instances. Immutable, so they can be shared safely.
+dr_tables = build_dr_tables()
+dr_arrays = build_dr_arrays(dr_tables)
+# Moves of every piece type grouped by target board, see build_move_plans and Moves.iter_board_moves.
+# Pawns and brawns have (non-eating moves, eating moves) for each color, dark ones move in the opposite direction.
+move_plans = MappingProxyType({ piece_type: build_move_plans(list_dr) for piece_type, list_dr in dr_tables.items()
+                                if piece_type not in ('p', 'B', 'p_eat', 'B_eat') })
+pawn_move_plans = MappingProxyType({
+    (piece_type, color): (build_move_plans([ tuple(sign * i for i in dr) for dr in dr_tables[piece_type] ]),
+                          build_move_plans([ tuple(sign * i for i in dr) for dr in dr_tables[piece_type + "_eat"] ]))
+    for piece_type in ('p', 'B') for color, sign in (('l', 1), ('d', -1))
+})
+color_code_by_value = piece_color_codes.tolist() # Same as piece_color_codes, faster to index one by one
+ray_tables = {} # (piece type, chessboard size) -> in-board ray lengths per origin square
@@ -0,0 +1,245 @@
+import os
+import gc
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from chess_db_5d import chessboard_5d_from_serialized
+from legal_moves import LegalMoveGenerator
+from search import Search, SearchResult, infinite_score, format_moves, score_from_tt
+from shared_multiverse import SharedMultiverse, SharedMultiverseReader
+
+# Everything sent to worker processes is plain values: serialized positions
+# (see Chessboard_5D.serialize) or SharedPosition, moves as (origin, target) and search options.
+
+# A position published in shared memory: name and snapshot version of a SharedMultiverse
+SharedPosition = namedtuple("SharedPosition", ["name", "version"])
+shared_positions = {} # name -> (SharedMultiverseReader, loaded Chessboard_5D), in every worker process
+
+
+def get_shared_position(position):
+    """
+    Returns the multiverse of a SharedPosition. Workers attach to a block once and reuse 
+    the loaded multiverse for all tasks of the same snapshot, the last block is kept.
+    """
+    cached = shared_positions.get(position.name)
+    if cached is None:
+        for name in list(shared_positions):
+            reader = shared_positions.pop(name)[0]
+            gc.collect() # Boards of the old multiverse must be freed before detaching
+            try:
+                reader.close()
+            except BufferError: # Still in use, the mapping is freed with the last board
+                pass
+        reader = SharedMultiverseReader(position.name)
+        cached = (reader, reader.load(version=position.version))
+        shared_positions[position.name] = cached
+    reader, chess5 = cached
+    if reader.version != position.version:
+        chess5 = reader.load(version=position.version)
+        shared_positions[position.name] = (reader, chess5)
+    return chess5
+
+
+def load_position(data):
+    """
+    Gets the position of a task, from serialized data or a SharedPosition
+    """
+    if isinstance(data, SharedPosition):
+        return get_shared_position(data)
+    return chessboard_5d_from_serialized(data)
+
+
+def search_root_move(data, move, depth, time_limit, max_nodes, tt_size):
+    """
+    Worker task: makes one root move and searches the position after it
+
+    Args:
+        data (tuple): serialized root position, or SharedPosition
+        move (tuple): (origin, target) of the root move
+        depth (int): search depth of the root, the position after the move is searched 1 ply less
+        time_limit (float): time budget in seconds for this move, or None
+        max_nodes (int): node budget for this move, or None
+        tt_size (int): maximum number of transposition table entries
+
+    Returns:
+        tuple: (score for the player to move at the root, principal variation after the move, nodes, finished depth).
+            If the budget ran out before the position after the move was searched to depth 1, 
+            the score is None and the finished depth 0.
+    """
+    chess5 = load_position(data)
+    color = chess5.get_player_to_move()
+    state = chess5.checkpoint() # Shared positions are reused by the next task
+    search = Search(chess5, tt_size=tt_size)
+    search.generator.make_move(*move)
+    if depth == 1:
+        score, pv, nodes, child_depth = search.evaluate(), [], 1, 0
+    else:
+        result = search.search(max_depth=depth - 1, time_limit=time_limit, max_nodes=max_nodes)
+        score, pv, nodes, child_depth = result.score, result.pv, result.nodes + 1, result.depth
+        if result.best_move is None: # No legal moves after the move: mate or stalemate, searched to full depth
+            child_depth = depth - 1
+        elif result.depth == 0: # Not even depth 1 finished
+            chess5.rollback(state)
+            return None, [], nodes, 0
+        score = score_from_tt(score, 1) # Mate distances are counted from the root
+    if chess5.get_player_to_move() != color:
+        score = -score
+    chess5.rollback(state)
+    return score, pv, nodes, child_depth + 1
+
+
+def search_position(data, depth, time_limit, max_nodes, tt_size):
+    """
+    Worker task: searches a whole position
+
+    Returns:
+        SearchResult: result of the search
+    """
+    chess5 = load_position(data)
+    return Search(chess5, tt_size=tt_size).search(max_depth=depth, time_limit=time_limit, max_nodes=max_nodes)
+
+
+class ParallelAnalysis:
+    """
+    Spreads the search over worker processes. A single position is split by root moves,
+    a batch of positions is split by position. Workers rebuild the multiverse from its
+    serialized form, so nothing but plain values is sent between processes. With shared_memory,
+    positions are published into shared memory instead (see SharedMultiverse), and every worker
+    attaches to a position once instead of rebuilding it for every task.
+
+    Use as a context manager, or call close() when done, to stop the workers.
+    """
+    def __init__(self, num_workers=None, tt_size=200000, shared_memory=False):
+        """
+        Create a new instance of class
+
+        Args:
+            num_workers (int): number of worker processes. Defaults to None, which takes the number of cores.
+            tt_size (int): maximum number of transposition table entries per worker task. Defaults to 200000.
+            shared_memory (bool): whether to send positions through shared memory. Defaults to False.
+        """
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.tt_size = tt_size
+        self.shared_memory = shared_memory
+        self.executor = ProcessPoolExecutor(max_workers=self.num_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stops the worker processes"""
+        self.executor.shutdown()
+
+    def search_root(self, chess5, depth, time_limit=None, max_nodes=None, log=False):
+        """
+        Finds the best move of the player to move, searching every root move in a separate task.
+        Workers don't share alpha-beta bounds or transposition tables, so more nodes are
+        searched than by a single Search, but all cores are busy.
+
+        Args:
+            chess5 (Chessboard_5D): the position
+            depth (int): search depth in plies
+            time_limit (float): time budget in seconds for the whole search. Defaults to None (no limit).
+            max_nodes (int): node budget for every root move. Defaults to None (no limit).
+            log (bool): whether to output the result into the terminal
+
+        Returns:
+            SearchResult: merged result, nodes are summed over all workers
+        """
+        start = time.perf_counter()
+        root_moves = LegalMoveGenerator(chess5).get_legal_moves()
+        if not root_moves:
+            return Search(chess5).search(max_depth=1)
+        move_time_limit = None
+        if time_limit is not None: # Every worker gets its share of the time
+            move_time_limit = time_limit * self.num_workers / len(root_moves)
+        shared = SharedMultiverse(chess5) if self.shared_memory else None
+        try:
+            data = chess5.serialize() if shared is None else SharedPosition(shared.name, shared.version)
+            futures = [ self.executor.submit(search_root_move, data, (move.origin, move.target), depth,
+                                             move_time_limit, max_nodes, self.tt_size)
+                        for move in root_moves ]
+
+            best_score, best_pv, nodes, finished_depth = -infinite_score, [], 0, depth
+            for move, future in zip(root_moves, futures): # Ties go to the first move, as in Search
+                score, pv, move_nodes, move_depth = future.result()
+                nodes += move_nodes
+                finished_depth = min(finished_depth, move_depth)
+                if (score is not None) and (score > best_score): # Unscored moves are skipped
+                    best_score, best_pv = score, [move] + pv
+        finally:
+            if shared is not None:
+                shared.close()
+        if not best_pv: # No move was scored within the budget
+            best_score, best_pv = Search(chess5).evaluate(), [root_moves[0]]
+        seconds = time.perf_counter() - start
+        result = SearchResult(best_pv[0], best_score, finished_depth, best_pv, nodes, seconds,
+                              nodes / seconds if seconds > 0 else 0.)
+        if log:
+            print(f"depth {finished_depth} score {best_score} nodes {nodes} "+
+                  f"nps {result.nodes_per_second:.0f} workers {self.num_workers} pv {format_moves(best_pv)}")
+        return result
+
+    def analyse_positions(self, positions, depth, time_limit=None, max_nodes=None):
+        """
+        Searches a batch of positions, one position per task
+
+        Args:
+            positions (list): Chessboard_5D positions
+            depth (int): search depth in plies
+            time_limit (float): time budget in seconds for every position. Defaults to None (no limit).
+            max_nodes (int): node budget for every position. Defaults to None (no limit).
+
+        Returns:
+            list: SearchResult for every position, in the same order
+        """
+        shared = [ SharedMultiverse(chess5) for chess5 in positions ] if self.shared_memory else []
+        try:
+            data = [ SharedPosition(block.name, block.version) for block in shared ] or \
+                   [ chess5.serialize() for chess5 in positions ]
+            futures = [ self.executor.submit(search_position, position, depth, time_limit, max_nodes, self.tt_size)
+                        for position in data ]
+            return [ future.result() for future in futures ]
+        finally:
+            for block in shared:
+                block.close()
+
+
+def benchmark_parallel_scaling(depth=2, worker_counts=None, positions=None, storage="list"):
+    """
+    Analyses the perft positions with different numbers of workers and prints the speedup
+
+    Args:
+        depth (int): search depth in plies
+        worker_counts (list): numbers of workers to compare. Defaults to None, which takes 1, 2, 4, ... up to the number of cores.
+        positions (list): names of perft positions. Defaults to None, which takes all of them.
+        storage (str): storage type of Chessboard_5D (list, tensor or delta)
+
+    Returns:
+        dict: number of workers -> seconds
+    """
+    from perft import perft_positions, setup_perft_position
+    if worker_counts is None:
+        num_cores = os.cpu_count() or 1
+        worker_counts = [ 2**i for i in range(num_cores.bit_length()) if 2**i <= num_cores ]
+    if positions is None:
+        positions = list(perft_positions)
+    chess5_list = [ setup_perft_position(name, storage=storage) for name in positions ]
+    timings = {}
+    for num_workers in worker_counts:
+        with ParallelAnalysis(num_workers) as analysis:
+            analysis.analyse_positions(chess5_list[:1], 1) # Start the workers before timing
+            start = time.perf_counter()
+            results = [ analysis.search_root(chess5, depth) for chess5 in chess5_list ]
+            timings[num_workers] = time.perf_counter() - start
+        nodes = sum(result.nodes for result in results)
+        print(f"{num_workers} workers: {timings[num_workers]:.3f} s, {nodes / timings[num_workers]:.0f} nodes/s, "+
+              f"speedup {timings[worker_counts[0]] / timings[num_workers]:.2f}")
+    return timings
+
+
+if __name__ == "__main__":
+    benchmark_parallel_scaling()
@@ -0,0 +1,236 @@
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from chess_db_5d import Chessboard_5D
+from legal_moves import LegalMoveGenerator
+
+# Fixed start positions, name -> (piece, pawns_row) of Chessboard_5D.movement_grid_setup,
+# or None for the default chess setup
+perft_positions = MappingProxyType({
+    "default": None,
+    "grid_q": ("ql", False),
+    "grid_q_pawns": ("ql", True),
+    "grid_n_pawns": ("nl", True),
+    "grid_b_pawns": ("bl", True),
+    "grid_k_pawns": ("kl", True),
+    "grid_p_pawns": ("pd", True), # Same as ChessTests.test_movement
+})
+# Expected numbers of moves at depths 1, 2, 3 of every start position, the same for all storage types
+perft_expected_nodes = MappingProxyType({
+    "default": (12, 168, 3216),
+    "grid_q": (81, 1857, 15031),
+    "grid_q_pawns": (75, 1881, 15442),
+    "grid_n_pawns": (26, 118, 132),
+    "grid_b_pawns": (27, 185, 193),
+    "grid_k_pawns": (51, 702, 6156),
+    "grid_p_pawns": (17, 0, 0),
+})
+
+# Counts of moves made at one depth of a perft run. checks is None if not counted.
+PerftCounts = namedtuple("PerftCounts", ["nodes", "captures", "branches", "time_travel", "checks"])
+# Result of a perft run. counts has one PerftCounts per depth, starting at depth 1.
+# nodes is the number of moves made at all depths, nodes_per_second is based on it.
+PerftResult = namedtuple("PerftResult", ["position", "depth", "counts", "nodes", "seconds", "nodes_per_second"])
+
+
+def setup_perft_position(name, storage="list"):
+    """
+    Creates one of the fixed start positions
+
+    Args:
+        name (str): key of perft_positions
+        storage (str): storage type of Chessboard_5D (list, tensor or delta)
+
+    Returns:
+        Chessboard_5D: the position
+    """
+    if name not in perft_positions:
+        raise ValueError(f"Unknown perft position {name}. Possible values: {list(perft_positions)}")
+    chess5 = Chessboard_5D(storage=storage)
+    if perft_positions[name] is None:
+        chess5.default_chess_configuration_setup()
+    else:
+        piece, pawns_row = perft_positions[name]
+        chess5.movement_grid_setup(piece, pawns_row=pawns_row)
+    return chess5
+
+
+class Perft:
+    """
+    Counts legal moves of a 5D chessboard down to a given depth (perft).
+    Every move is made and undone on the same multiverse, so counts are exactly
+    reproducible for a given start position.
+    """
+    def __init__(self, chess5, check_flags=False):
+        """
+        Create a new instance of class
+
+        Args:
+            chess5 (Chessboard_5D): the start position
+            check_flags (bool): whether to count moves that give check. Much slower. Defaults to False.
+        """
+        self.chess5 = chess5
+        self.generator = LegalMoveGenerator(chess5)
+        self.check_flags = check_flags
+
+    def count(self, depth):
+        """
+        Counts moves at every depth
+
+        Args:
+            depth (int): number of moves to look ahead
+
+        Returns:
+            list: PerftCounts for depths 1 to depth
+        """
+        if depth < 1:
+            raise ValueError(f"Perft depth should be at least 1. You have: {depth}")
+        counts = [ [0] * len(PerftCounts._fields) for i in range(depth) ]
+        root_key = self.chess5.zobrist_key
+        self.count_moves(depth, 0, counts)
+        assert self.chess5.zobrist_key == root_key, "Perft did not restore the start position"
+        if not self.check_flags:
+            for depth_counts in counts:
+                depth_counts[4] = None
+        return [ PerftCounts(*depth_counts) for depth_counts in counts ]
+
+    def count_moves(self, depth, ply, counts):
+        """
+        Adds the moves of the current position and of the positions after them to counts
+
+        Args:
+            depth (int): number of moves left to look ahead
+            ply (int): number of moves made since the start position
+            counts (list): lists of counts per depth, in PerftCounts order
+        """
+        legal_moves = self.generator.get_legal_moves(check_flags=self.check_flags)
+        depth_counts = counts[ply]
+        depth_counts[0] += len(legal_moves)
+        for move in legal_moves:
+            if move.captured: depth_counts[1] += 1
+            if move.branches: depth_counts[2] += 1
+            if move.time_travel: depth_counts[3] += 1
+            if move.gives_check: depth_counts[4] += 1
+        if depth == 1:
+            return
+        chess5 = self.chess5
+        for move in legal_moves:
+            state = chess5.checkpoint()
+            self.generator.make_move(move.origin, move.target)
+            self.count_moves(depth - 1, ply + 1, counts)
+            chess5.rollback(state)
+
+    def divide(self, depth):
+        """
+        Counts the leaf nodes after every move of the start position,
+        to find which move a wrong count comes from
+
+        Args:
+            depth (int): number of moves to look ahead, including the first move
+
+        Returns:
+            dict: (origin, target) -> number of leaf nodes
+        """
+        chess5 = self.chess5
+        leaf_nodes = {}
+        for move in self.generator.get_legal_moves():
+            if depth == 1:
+                leaf_nodes[(move.origin, move.target)] = 1
+                continue
+            state = chess5.checkpoint()
+            self.generator.make_move(move.origin, move.target)
+            leaf_nodes[(move.origin, move.target)] = self.count(depth - 1)[-1].nodes
+            chess5.rollback(state)
+        return leaf_nodes
+
+    def run(self, depth, position="", log=True):
+        """
+        Times a perft run
+
+        Args:
+            depth (int): number of moves to look ahead
+            position (str): name of the position, for the output
+            log (bool): whether to output the results into the terminal
+
+        Returns:
+            PerftResult: counts and timing
+        """
+        start = time.perf_counter()
+        counts = self.count(depth)
+        seconds = time.perf_counter() - start
+        nodes = sum(depth_counts.nodes for depth_counts in counts)
+        result = PerftResult(position, depth, counts, nodes, seconds, nodes / seconds if seconds > 0 else 0.)
+        if log:
+            print_perft_result(result)
+        return result
+
+
+def print_perft_result(result):
+    """
+    Prints counts per depth and timing of a perft run
+    """
+    print(f"Perft {result.position} to depth {result.depth}")
+    print(f"{'depth':>5} {'nodes':>10} {'captures':>10} {'branches':>10} {'time travel':>12} {'checks':>10}")
+    for depth, counts in enumerate(result.counts, start=1):
+        checks = "-" if counts.checks is None else counts.checks
+        print(f"{depth:>5} {counts.nodes:>10} {counts.captures:>10} {counts.branches:>10} "+
+              f"{counts.time_travel:>12} {checks:>10}")
+    print(f"{result.nodes} nodes in {result.seconds:.3f} s, {result.nodes_per_second:.0f} nodes/s")
+
+
+def check_perft_result(result):
+    """
+    Compares the node counts of a perft run with perft_expected_nodes, at the depths that have expected counts
+
+    Raises:
+        ValueError: if a count differs
+    """
+    expected = perft_expected_nodes.get(result.position, ())
+    nodes = tuple(counts.nodes for counts in result.counts[:len(expected)])
+    if nodes != expected[:len(nodes)]:
+        raise ValueError(f"Perft {result.position}: expected {list(expected[:len(nodes)])} nodes "+
+                         f"at depths 1 to {len(nodes)}, counted {list(nodes)}")
+
+
+def run_perft_suite(depth=2, storage="list", check_flags=False, positions=None, log=True):
+    """
+    Runs perft on fixed start positions, and checks the node counts against perft_expected_nodes
+
+    Args:
+        depth (int): number of moves to look ahead
+        storage (str): storage type of Chessboard_5D (list, tensor or delta)
+        check_flags (bool): whether to count moves that give check
+        positions (list): names of positions. Defaults to None, which takes all of perft_positions.
+        log (bool): whether to output the results into the terminal
+
+    Returns:
+        list: PerftResult for every position
+
+    Raises:
+        ValueError: if a node count differs from perft_expected_nodes
+    """
+    if positions is None:
+        positions = list(perft_positions)
+    results = []
+    for name in positions:
+        chess5 = setup_perft_position(name, storage=storage)
+        result = Perft(chess5, check_flags=check_flags).run(depth, position=name, log=log)
+        check_perft_result(result)
+        results.append(result)
+    if log:
+        nodes = sum(result.nodes for result in results)
+        seconds = sum(result.seconds for result in results)
+        print(f"Total: {nodes} nodes in {seconds:.3f} s, {nodes / seconds:.0f} nodes/s")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Perft move counting for 5D chess positions")
+    parser.add_argument("--depth", type=int, default=2, help="number of moves to look ahead")
+    parser.add_argument("--storage", default="list", choices=["list", "tensor", "delta"], help="board storage type")
+    parser.add_argument("--position", action="append", choices=list(perft_positions),
+                        help="start position, can be repeated. Defaults to all positions")
+    parser.add_argument("--checks", action="store_true", help="also count moves that give check")
+    args = parser.parse_args()
+    run_perft_suite(args.depth, storage=args.storage, check_flags=args.checks, positions=args.position)
@@ -0,0 +1,339 @@
+import time
+from collections import namedtuple
+from evaluation import Evaluator, material_values
+from legal_moves import LegalMoveGenerator
+
+mate_score = 1000000 # Score of giving mate right away, mate in n plies scores mate_score - n
+infinite_score = 2 * mate_score
+
+# Bound types of transposition table entries
+exact_bound, lower_bound, upper_bound = 0, 1, 2
+
+# Transposition table entry: depth searched, score, bound type, best move as (origin, target)
+TTEntry = namedtuple("TTEntry", ["depth", "score", "bound", "best_move"])
+# Result of a search. best_move is a LegalMove (None if there are no legal moves),
+# pv is a list of LegalMove, score is in centipawns from the point of view of the player to move.
+SearchResult = namedtuple("SearchResult", ["best_move", "score", "depth", "pv", "nodes",
+                                           "seconds", "nodes_per_second"])
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when the time or node budget runs out"""
+
+
+class TranspositionTable:
+    """
+    Bounded table of search results, keyed by the Zobrist key of the multiverse.
+    When full, the oldest entries are replaced first.
+    """
+    def __init__(self, max_entries=1000000):
+        """
+        Create a new instance of class
+
+        Args:
+            max_entries (int): maximum number of positions to keep. Defaults to 1000000.
+        """
+        if max_entries < 1:
+            raise ValueError(f"Transposition table should have at least 1 entry. You have: {max_entries}")
+        self.max_entries = max_entries
+        self.entries = {} # zobrist key -> TTEntry, in the order of storing
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Returns the TTEntry of a position, or None"""
+        return self.entries.get(key)
+
+    def store(self, key, depth, score, bound, best_move):
+        """
+        Stores a search result. Results of shallower searches don't replace deeper ones.
+
+        Args:
+            key (int): Zobrist key of the position
+            depth (int): depth of the search
+            score (int): score of the position
+            bound (int): exact_bound, lower_bound or upper_bound
+            best_move (tuple): (origin, target) of the best move, or None
+        """
+        entries = self.entries
+        old_entry = entries.pop(key, None)
+        if (old_entry is not None) and (old_entry.depth > depth):
+            entries[key] = old_entry
+            return
+        if len(entries) >= self.max_entries:
+            del entries[next(iter(entries))]
+        entries[key] = TTEntry(depth, score, bound, best_move)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class Search:
+    """
+    Iterative-deepening alpha-beta (negamax) search for the player to move at the present.
+    Moves are made and undone on the multiverse itself with checkpoint/rollback.
+
+    In 5D chess a player can make several moves in a row (one per playable board),
+    so the score is only negated when the player to move changes.
+    """
+    def __init__(self, chess5, tt_size=1000000, order_checks=True):
+        """
+        Create a new instance of class
+
+        Args:
+            chess5 (Chessboard_5D): the multiverse to search in
+            tt_size (int): maximum number of transposition table entries. Defaults to 1000000.
+            order_checks (bool): whether to search checks before quiet moves.
+                Finding checks is slow, so it's only done 2 or more plies away from the leaves.
+        """
+        self.chess5 = chess5
+        self.generator = LegalMoveGenerator(chess5)
+        self.evaluator = Evaluator(chess5)
+        self.tt = TranspositionTable(tt_size)
+        self.order_checks = order_checks
+        self.killers = [] # ply -> up to 2 (origin, target) quiet moves that caused a cutoff
+        self.nodes = 0
+        self.deadline = None
+        self.max_nodes = None
+
+    def search(self, max_depth=64, time_limit=None, max_nodes=None, log=False):
+        """
+        Finds the best move of the player to move
+
+        Args:
+            max_depth (int): maximum depth in plies. Defaults to 64.
+            time_limit (float): time budget in seconds. Defaults to None (no limit).
+            max_nodes (int): node budget. Defaults to None (no limit).
+            log (bool): whether to output every finished iteration into the terminal
+
+        Returns:
+            SearchResult: best move and principal variation of the deepest finished iteration
+        """
+        if (time_limit is None) and (max_nodes is None) and (max_depth > 16):
+            raise ValueError("Search needs a time limit, a node limit or a max depth of at most 16")
+        chess5 = self.chess5
+        start = time.perf_counter()
+        self.deadline = None if time_limit is None else start + time_limit
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.killers = []
+        root_state = chess5.checkpoint()
+
+        root_moves = self.generator.get_legal_moves()
+        result = SearchResult(root_moves[0] if root_moves else None, 0, 0, [], 0, 0., 0.)
+        if not root_moves:
+            result = result._replace(score=self.get_terminal_score(0))
+            return result
+        for depth in range(1, max_depth + 1):
+            try:
+                score, pv = self.negamax(depth, 0, -infinite_score, infinite_score)
+            except SearchAborted:
+                chess5.rollback(root_state) # Moves only add boards, so this undoes all of them
+                break
+            pv = self.extend_pv(pv, depth)
+            seconds = time.perf_counter() - start
+            result = SearchResult(pv[0] if pv else result.best_move, score, depth, pv, self.nodes,
+                                  seconds, self.nodes / seconds if seconds > 0 else 0.)
+            if log:
+                print(f"depth {depth} score {score} nodes {self.nodes} "+
+                      f"nps {result.nodes_per_second:.0f} pv {format_moves(pv)}")
+            if abs(score) >= mate_score - max_depth: # Mate found, deeper search won't change it
+                break
+        seconds = time.perf_counter() - start
+        return result._replace(nodes=self.nodes, seconds=seconds,
+                               nodes_per_second=self.nodes / seconds if seconds > 0 else 0.)
+
+    def negamax(self, depth, ply, alpha, beta):
+        """
+        Alpha-beta search of the current position
+
+        Args:
+            depth (int): plies left to search
+            ply (int): plies made since the root
+            alpha (int): lower bound of the score
+            beta (int): upper bound of the score
+
+        Returns:
+            tuple: (score from the point of view of the player to move, principal variation)
+        """
+        self.nodes += 1
+        if (self.max_nodes is not None) and (self.nodes > self.max_nodes):
+            raise SearchAborted()
+        if (self.deadline is not None) and (time.perf_counter() > self.deadline):
+            raise SearchAborted()
+
+        chess5 = self.chess5
+        key = chess5.zobrist_key
+        tt_entry = self.tt.get(key)
+        tt_move = None
+        if tt_entry is not None:
+            tt_move = tt_entry.best_move
+            if (ply > 0) and (tt_entry.depth >= depth):
+                tt_score = score_from_tt(tt_entry.score, ply)
+                if tt_entry.bound == exact_bound:
+                    return tt_score, []
+                if (tt_entry.bound == lower_bound) and (tt_score >= beta):
+                    return tt_score, []
+                if (tt_entry.bound == upper_bound) and (tt_score <= alpha):
+                    return tt_score, []
+        if depth == 0:
+            return self.evaluate(), []
+
+        color = chess5.get_player_to_move()
+        legal_moves = self.generator.get_legal_moves(check_flags=self.order_checks and depth >= 2)
+        if not legal_moves:
+            return self.get_terminal_score(ply), []
+        legal_moves = self.order_moves(legal_moves, tt_move, ply)
+
+        alpha_start = alpha
+        best_score, best_move, best_pv = -infinite_score, None, []
+        for move in legal_moves:
+            state = chess5.checkpoint()
+            self.generator.make_move(move.origin, move.target)
+            if chess5.get_player_to_move() == color: # Same player moves again
+                score, pv = self.negamax(depth - 1, ply + 1, alpha, beta)
+            else:
+                score, pv = self.negamax(depth - 1, ply + 1, -beta, -alpha)
+                score = -score
+            chess5.rollback(state)
+            if score > best_score:
+                best_score, best_move, best_pv = score, move, [move] + pv
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not move.captured:
+                    self.add_killer(ply, (move.origin, move.target))
+                break
+
+        if best_score <= alpha_start:
+            bound = upper_bound
+        elif best_score >= beta:
+            bound = lower_bound
+        else:
+            bound = exact_bound
+        self.tt.store(key, depth, score_to_tt(best_score, ply), bound, (best_move.origin, best_move.target))
+        return best_score, best_pv
+
+    def extend_pv(self, pv, depth):
+        """
+        Continues a principal variation with transposition table moves, where the search 
+        stopped it early on a table hit
+
+        Args:
+            pv (list): LegalMove tuples from the root
+            depth (int): maximum length of the principal variation
+
+        Returns:
+            list: LegalMove tuples
+        """
+        chess5 = self.chess5
+        root_state = chess5.checkpoint()
+        for move in pv:
+            self.generator.make_move(move.origin, move.target)
+        pv = list(pv)
+        while len(pv) < depth:
+            tt_entry = self.tt.get(chess5.zobrist_key)
+            if (tt_entry is None) or (tt_entry.best_move is None):
+                break
+            moves = [ move for move in self.generator.get_legal_moves() 
+                      if (move.origin, move.target) == tt_entry.best_move ]
+            if not moves:
+                break
+            pv.append(moves[0])
+            self.generator.make_move(moves[0].origin, moves[0].target)
+        chess5.rollback(root_state)
+        return pv
+
+    def order_moves(self, legal_moves, tt_move, ply):
+        """
+        Sorts moves so that the likely best ones are searched first: the transposition table move,
+        captures (most valuable victim, then least valuable attacker), checks, killer moves, the rest.
+
+        Args:
+            legal_moves (list): LegalMove tuples
+            tt_move (tuple): (origin, target) of the transposition table move, or None
+            ply (int): plies made since the root
+
+        Returns:
+            list: sorted LegalMove tuples
+        """
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+
+        def move_priority(move):
+            if (move.origin, move.target) == tt_move:
+                return 0
+            if move.captured:
+                return 1 - material_values[move.captured[0]] + material_values[move.piece[0]] / 10000
+            if move.gives_check:
+                return 2
+            if (move.origin, move.target) in killers:
+                return 3
+            return 4
+
+        return sorted(legal_moves, key=move_priority)
+
+    def add_killer(self, ply, move):
+        """Remembers a quiet move that caused a cutoff at a ply, keeping the last 2"""
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+
+    def get_terminal_score(self, ply):
+        """
+        Returns the score of a position without legal moves: being mated if in check, draw otherwise
+        """
+        if self.generator.is_in_check(self.chess5.get_player_to_move()):
+            return -(mate_score - ply)
+        return 0
+
+    def evaluate(self):
+        """
+        Static evaluation of the position (see Evaluator), in centipawns
+        from the point of view of the player to move
+
+        Returns:
+            int: score
+        """
+        return self.evaluator.evaluate()
+
+
+def score_to_tt(score, ply):
+    """
+    Converts a mate score from distance to the root to distance to the position, for storing
+    """
+    if score >= mate_score - 1000:
+        return score + ply
+    if score <= -(mate_score - 1000):
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    """
+    Converts a stored mate score back to distance to the root
+    """
+    if score >= mate_score - 1000:
+        return score - ply
+    if score <= -(mate_score - 1000):
+        return score + ply
+    return score
+
+
+def format_moves(moves):
+    """
+    Formats a list of LegalMove tuples as text, like "nl(1,0,0,0)->(2,2,0,0)"
+    """
+    return " ".join(f"{move.piece}({','.join(map(str, move.origin))})->({','.join(map(str, move.target))})"
+                    for move in moves)
+
+
+if __name__ == "__main__":
+    from perft import setup_perft_position
+    chess5 = setup_perft_position("default")
+    result = Search(chess5).search(max_depth=3, log=True)
+    print(f"Best move: {format_moves([result.best_move])}, score {result.score}, "+
+          f"{result.nodes} nodes, {result.nodes_per_second:.0f} nodes/s")
@@ -0,0 +1,246 @@
+import os
+import time
+import random
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from types import MappingProxyType
+from legal_moves import LegalMoveGenerator
+from perft import perft_positions, setup_perft_position
+try:
+    import resource # Not available on Windows
+except ImportError:
+    resource = None
+
+# A finished game. moves is the compact move list (see encode_moves), result is
+# "1-0" (light mated dark), "0-1", "1/2-1/2" (stalemate) or "*" (stopped at max_plies).
+GameRecord = namedtuple("GameRecord", ["seed", "start", "policy", "result", "num_plies", "moves"])
+# Statistics of a worker process: number of games, plies and peak memory in bytes (None if unknown)
+WorkerStats = namedtuple("WorkerStats", ["pid", "games", "plies", "peak_memory"])
+
+
+def random_policy(chess5, candidates, rng):
+    """
+    Orders candidate moves uniformly at random, so that the first legal one is a uniformly random legal move
+    """
+    candidates = list(candidates)
+    rng.shuffle(candidates)
+    return candidates
+
+
+def weighted_policy(chess5, candidates, rng):
+    """
+    Orders candidate moves at random, with captures 4 times and time travel 2 times as likely as
+    other moves to come first. Taking the first legal one samples legal moves with these weights.
+    """
+    weights = []
+    for origin, target, piece in candidates:
+        weight = 1.
+        if (origin[2], origin[3]) != (target[2], target[3]):
+            weight *= 2.
+        target_id = chess5.tm_index[(target[2], target[3])]
+        if chess5.chessboards[target_id].chessboard_matrix.item(target[0], target[1]) != 0:
+            weight *= 4.
+        weights.append(weight)
+    # Weighted sampling without replacement: sort by u^(1/w) with u uniform in (0, 1)
+    keys = [ rng.random() ** (1. / weight) for weight in weights ]
+    return [ candidates[i] for i in sorted(range(len(candidates)), key=keys.__getitem__, reverse=True) ]
+
+
+# Move policies: name -> function(chess5, pseudo-legal candidates, random.Random) -> candidates in the order to try
+policies = MappingProxyType({
+    "random": random_policy,
+    "weighted": weighted_policy,
+})
+
+
+def encode_moves(moves):
+    """
+    Packs moves into bytes, as 8 int16 numbers per move (origin, then target)
+
+    Args:
+        moves (list): (origin, target) pairs of integer 4d vectors
+
+    Returns:
+        bytes: packed moves
+    """
+    return np.array([ origin + target for origin, target in moves ], dtype=np.int16).reshape(-1, 8).tobytes()
+
+
+def decode_moves(data):
+    """
+    Unpacks moves packed by encode_moves
+
+    Returns:
+        list: (origin, target) pairs of integer 4d vectors
+    """
+    array = np.frombuffer(data, dtype=np.int16).reshape(-1, 8).tolist()
+    return [ (tuple(row[:4]), tuple(row[4:])) for row in array ]
+
+
+def play_game(seed, start="default", policy="random", max_plies=100, storage="list"):
+    """
+    Plays a game from a start position, choosing moves with a policy
+
+    Args:
+        seed (int): seed of the random generator, the same seed plays the same game
+        start (str): start position, a key of perft_positions
+        policy (str): move policy, a key of policies
+        max_plies (int): maximum number of moves to play
+        storage (str): storage type of Chessboard_5D (list, tensor or delta)
+
+    Returns:
+        GameRecord: the game
+    """
+    if policy not in policies:
+        raise ValueError(f"Unknown policy {policy}. Possible values: {list(policies)}")
+    order_moves = policies[policy]
+    rng = random.Random(seed)
+    chess5 = setup_perft_position(start, storage=storage)
+    generator = LegalMoveGenerator(chess5)
+    moves = []
+    result = "*"
+    while len(moves) < max_plies:
+        color = chess5.get_player_to_move()
+        candidates = order_moves(chess5, generator.get_pseudo_legal_moves(color), rng)
+        move = generator.make_first_legal_move(candidates)
+        if move is None: # No legal moves: mate or stalemate
+            if generator.is_in_check(color):
+                result = "0-1" if color == 'l' else "1-0"
+            else:
+                result = "1/2-1/2"
+            break
+        moves.append((move.origin, move.target))
+    return GameRecord(seed, start, policy, result, len(moves), encode_moves(moves))
+
+
+def replay_game(record, storage="list"):
+    """
+    Replays a game record from its start position
+
+    Returns:
+        Chessboard_5D: the position at the end of the game
+    """
+    chess5 = setup_perft_position(record.start, storage=storage)
+    for origin, target in decode_moves(record.moves):
+        chess5.movie_piece_4d(origin, target)
+    return chess5
+
+
+def get_peak_memory():
+    """
+    Returns the peak resident memory of the current process in bytes, or None if it can't be found
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # Kilobytes on Linux
+
+
+def play_games(seeds, start, policy, max_plies, storage):
+    """
+    Worker task: plays a batch of games
+
+    Returns:
+        tuple: (list of GameRecord, WorkerStats)
+    """
+    records = [ play_game(seed, start, policy, max_plies, storage) for seed in seeds ]
+    stats = WorkerStats(os.getpid(), len(records), sum(record.num_plies for record in records), get_peak_memory())
+    return records, stats
+
+
+def generate_games(num_games, num_workers=None, first_seed=0, start="default", policy="random",
+                   max_plies=100, storage="list", batch_size=8, stats=None):
+    """
+    Plays games in worker processes and yields them as batches finish.
+    Games are played with seeds first_seed, first_seed + 1, ... and come out in any order.
+
+    Args:
+        num_games (int): number of games
+        num_workers (int): number of worker processes. Defaults to None, which takes the number of cores.
+        first_seed (int): seed of the first game
+        start (str): start position, a key of perft_positions
+        policy (str): move policy, a key of policies
+        max_plies (int): maximum number of moves per game
+        storage (str): storage type of Chessboard_5D (list, tensor or delta)
+        batch_size (int): number of games per worker task
+        stats (dict): if given, filled with pid -> WorkerStats, keeping the largest numbers of every worker
+
+    Yields:
+        GameRecord: finished games
+    """
+    if start not in perft_positions:
+        raise ValueError(f"Unknown start position {start}. Possible values: {list(perft_positions)}")
+    if policy not in policies:
+        raise ValueError(f"Unknown policy {policy}. Possible values: {list(policies)}")
+    num_workers = num_workers or os.cpu_count() or 1
+    seeds = list(range(first_seed, first_seed + num_games))
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [ executor.submit(play_games, seeds[i:i + batch_size], start, policy, max_plies, storage)
+                    for i in range(0, num_games, batch_size) ]
+        for future in as_completed(futures):
+            records, worker_stats = future.result()
+            if stats is not None:
+                old_stats = stats.get(worker_stats.pid)
+                if old_stats is not None:
+                    worker_stats = WorkerStats(worker_stats.pid, old_stats.games + worker_stats.games,
+                                               old_stats.plies + worker_stats.plies, worker_stats.peak_memory)
+                stats[worker_stats.pid] = worker_stats
+            yield from records
+
+
+def run_selfplay(num_games=100, num_workers=None, output=None, log=True, **kwargs):
+    """
+    Generates games, optionally writes them to a file, and reports the throughput
+
+    Args:
+        num_games (int): number of games
+        num_workers (int): number of worker processes. Defaults to None, which takes the number of cores.
+        output (str): path of a text file to write games to, one per line as
+            "seed start policy result number-of-plies hex-moves". Defaults to None (not written).
+        log (bool): whether to output statistics into the terminal
+        **kwargs: other arguments of generate_games
+
+    Returns:
+        dict: result -> number of games
+    """
+    stats = {}
+    results = {}
+    plies = 0
+    start = time.perf_counter()
+    output_file = open(output, "w") if output is not None else None
+    try:
+        for record in generate_games(num_games, num_workers, stats=stats, **kwargs):
+            results[record.result] = results.get(record.result, 0) + 1
+            plies += record.num_plies
+            if output_file is not None:
+                output_file.write(f"{record.seed} {record.start} {record.policy} {record.result} "+
+                                  f"{record.num_plies} {record.moves.hex()}\n")
+    finally:
+        if output_file is not None:
+            output_file.close()
+    seconds = time.perf_counter() - start
+    if log:
+        print(f"{num_games} games, {plies} plies in {seconds:.2f} s: {num_games / seconds:.1f} games/s, "+
+              f"{plies / seconds:.0f} plies/s")
+        print("Results: " + ", ".join(f"{result}: {count}" for result, count in sorted(results.items())))
+        for worker_stats in stats.values():
+            memory = "unknown" if worker_stats.peak_memory is None else f"{worker_stats.peak_memory / 2**20:.1f} MB"
+            print(f"Worker {worker_stats.pid}: {worker_stats.games} games, {worker_stats.plies} plies, "+
+                  f"peak memory {memory}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Random self-play games of 5D chess")
+    parser.add_argument("--games", type=int, default=100, help="number of games")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--start", default="default", choices=list(perft_positions), help="start position")
+    parser.add_argument("--policy", default="random", choices=list(policies), help="move policy")
+    parser.add_argument("--max-plies", type=int, default=100, help="maximum number of moves per game")
+    parser.add_argument("--storage", default="list", choices=["list", "tensor", "delta"], help="board storage type")
+    parser.add_argument("--output", default=None, help="text file to write the games to")
+    args = parser.parse_args()
+    run_selfplay(args.games, args.workers, output=args.output, first_seed=args.seed, start=args.start,
+                 policy=args.policy, max_plies=args.max_plies, storage=args.storage)
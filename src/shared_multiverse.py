@@ -0,0 +1,247 @@
+import sys
+import time
+import struct
+import threading
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from chess_db_5d import Chessboard_5D
+from chess_storage import BoardViewStorage, memmap_record_dtype
+
+# A shared multiverse is a small directory block and one snapshot block per publish.
+# The directory holds the magic bytes, the format version, the snapshot version and the name
+# of the block of the latest snapshot. The snapshot version is odd while the directory is being switched.
+# A snapshot block holds a header of shared_header_size bytes, then board records of
+# (time, multiverse, origin, board matrix), the same records as in BoardMemmapStorage files.
+# Its header holds the magic bytes, the format version, chessboard size, first_turn_black,
+# the snapshot version, number of boards, max_mult_white, max_mult_black, present
+# and the Zobrist key of the multiverse. Snapshot blocks are never written after they are published.
+shared_block_magic = b"5DCS"
+shared_block_version = 2
+shared_directory = struct.Struct("<4sHxxQ64s")
+shared_header = struct.Struct("<4sHBBQqqqqQ")
+shared_header_size = 64
+snapshot_version_format = struct.Struct("<Q") # The snapshot version alone
+snapshot_version_offset = 8
+snapshot_name_offset = 16
+
+
+# Blocks are created and attached under this lock, see attach_block
+block_lock = threading.Lock()
+
+
+def create_block(name, size):
+    """Creates a shared memory block, it is tracked so that it is freed if the process dies"""
+    with block_lock:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+
+def attach_block(name):
+    """
+    Attaches to an existing shared memory block, without tracking it. Only the process that created 
+    a block frees it, but before Python 3.13 attached blocks are tracked as well: the block would be 
+    freed when the attaching process exits, or tracked again after the creator freed it.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    with block_lock: # Nothing is tracked while the block is attached
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedMultiverse:
+    """
+    Publishes the boards and coordinate index of a multiverse into shared memory, so that
+    worker processes can read the position without pickling or rebuilding it (see SharedMultiverseReader).
+
+    Every publish writes a new snapshot into a new block and increases the snapshot version, then
+    frees the block of the previous snapshot. Published blocks are never written again, so a reader
+    always sees a whole snapshot, and readers that attached to an older one keep it until they detach.
+
+    Use as a context manager, or call close() when done, to free the blocks.
+    """
+    def __init__(self, chess5, name=None):
+        """
+        Creates the directory block and publishes the first snapshot
+
+        Args:
+            chess5 (Chessboard_5D): the multiverse to publish
+            name (str): name of the directory block, snapshot blocks are named after it.
+                Defaults to None, which picks unique names.
+        """
+        self.chess5 = chess5
+        self.named = name is not None
+        self.directory = create_block(name, shared_directory.size)
+        shared_directory.pack_into(self.directory.buf, 0, shared_block_magic, shared_block_version, 0, b"")
+        self.snapshot = None # Block of the latest snapshot
+        self.version = 0
+        self.publish()
+
+    @property
+    def name(self):
+        """Name of the directory block, to attach to it with SharedMultiverseReader"""
+        return self.directory.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Frees the blocks. Readers that are still attached keep their mapping."""
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot.unlink()
+            self.snapshot = None
+        self.directory.close()
+        self.directory.unlink()
+
+    def publish(self):
+        """
+        Writes the current boards of the multiverse into a new block, as a new snapshot
+
+        Returns:
+            int: version of the snapshot
+        """
+        chess5 = self.chess5
+        num_boards = len(chess5.chessboards)
+        version = self.version + 2
+        dtype = memmap_record_dtype(chess5.chessboard_size)
+        name = f"{self.name}_{version}" if self.named else None
+        snapshot = create_block(name, shared_header_size + num_boards * dtype.itemsize)
+        shared_header.pack_into(snapshot.buf, 0, shared_block_magic, shared_block_version, chess5.chessboard_size,
+                                chess5.first_turn_black, version, num_boards, chess5.max_mult_white,
+                                chess5.max_mult_black, chess5.present, chess5.zobrist_key)
+        records = np.ndarray((num_boards,), dtype=dtype, buffer=snapshot.buf, offset=shared_header_size)
+        coords = chess5.get_board_coords()
+        records["time"], records["mult"], records["origin"] = coords[:, 0], coords[:, 1], coords[:, 2]
+        records["board"] = chess5.get_board_tensor()
+        del records # The block can only be closed once no array uses it
+
+        # Switch the directory to the new block
+        snapshot_name = snapshot.name.encode()
+        if len(snapshot_name) > 64:
+            raise ValueError(f"Shared memory name {snapshot.name} is too long, at most 64 bytes are allowed")
+        snapshot_version_format.pack_into(self.directory.buf, snapshot_version_offset, self.version + 1)
+        struct.pack_into("64s", self.directory.buf, snapshot_name_offset, snapshot_name)
+        snapshot_version_format.pack_into(self.directory.buf, snapshot_version_offset, version)
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot.unlink()
+        self.snapshot, self.version = snapshot, version
+        return version
+
+
+class SharedMultiverseReader:
+    """
+    Attaches to a multiverse published by SharedMultiverse. Boards are read-only views
+    into the shared block of a snapshot, so loading copies nothing but the coordinate index.
+
+    A loaded multiverse keeps reading the snapshot it was loaded from, even after the publisher
+    writes a new one. is_stale tells that a newer snapshot was published: load the multiverse again.
+    """
+    def __init__(self, name):
+        """
+        Attaches to a shared multiverse
+
+        Args:
+            name (str): name of the directory block (SharedMultiverse.name)
+        """
+        self.directory = attach_block(name)
+        magic, version = shared_directory.unpack_from(self.directory.buf, 0)[:2]
+        if magic != shared_block_magic:
+            raise ValueError(f"{name} is not a shared multiverse")
+        if version != shared_block_version:
+            raise ValueError(f"Unsupported shared multiverse version {version}, expected {shared_block_version}")
+        self.snapshots = [] # Blocks of the loaded snapshots, the last one is the latest
+        self.version = None # Snapshot version of the last loaded multiverse
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Detaches from the blocks. Multiverses loaded from them must not be used afterwards."""
+        self.directory.close()
+        while self.snapshots:
+            self.snapshots[-1].close()
+            self.snapshots.pop()
+
+    def get_version(self):
+        """Returns the version of the latest snapshot, odd while the directory is being switched"""
+        return snapshot_version_format.unpack_from(self.directory.buf, snapshot_version_offset)[0]
+
+    def is_stale(self):
+        """Checks whether a newer snapshot was published since the last load"""
+        return self.get_version() != self.version
+
+    def attach_latest(self, timeout):
+        """
+        Attaches to the block of the latest snapshot
+
+        Args:
+            timeout (float): seconds to wait while the directory is being switched
+
+        Returns:
+            tuple: (snapshot version, shared_memory.SharedMemory block)
+        """
+        deadline = time.perf_counter() + timeout
+        while True:
+            version = self.get_version()
+            if version % 2 == 0:
+                name = struct.unpack_from("64s", self.directory.buf, snapshot_name_offset)[0].rstrip(b"\0").decode()
+                if self.get_version() == version: # The name was not switched while it was read
+                    try:
+                        return version, attach_block(name)
+                    except FileNotFoundError: # A newer snapshot replaced it in the meantime
+                        pass
+            if time.perf_counter() > deadline:
+                raise ValueError("Timed out waiting for the shared multiverse to be published")
+            time.sleep(0.001)
+
+    def load(self, version=None, timeout=1.):
+        """
+        Builds the multiverse of the latest snapshot, with tensor storage over the shared block.
+        Chessboard_2D objects are only built for boards that are accessed, and the boards are copied
+        into memory when the first board is added (i.e. when a move is made).
+
+        Args:
+            version (int): snapshot version to load. Defaults to None, which takes the latest snapshot.
+            timeout (float): seconds to wait for a snapshot that is being published. Defaults to 1.
+
+        Returns:
+            Chessboard_5D: the multiverse
+        """
+        snapshot_version, snapshot = self.attach_latest(timeout)
+        header = shared_header.unpack_from(snapshot.buf, 0)
+        _, _, n, first_turn_black, _, num_boards, max_mult_white, max_mult_black, present, zobrist_key = header
+        if (version is not None) and (snapshot_version != version):
+            snapshot.close()
+            raise ValueError(f"Snapshot {version} of {self.directory.name} was replaced by snapshot {snapshot_version}")
+        records = np.ndarray((num_boards,), dtype=memmap_record_dtype(n), buffer=snapshot.buf, offset=shared_header_size)
+        records.flags.writeable = False
+        coords = np.stack([records["time"], records["mult"], records["origin"]], axis=1)
+        storage = BoardViewStorage(records["board"])
+        chess5 = Chessboard_5D(chessboard_size=n, first_turn_black=first_turn_black, storage=storage)
+        chess5.load_board_arrays(coords, storage.get_boards(), zobrist_key=zobrist_key)
+        chess5.max_mult_white, chess5.max_mult_black, chess5.present = max_mult_white, max_mult_black, present
+        self.release_snapshots()
+        self.snapshots.append(snapshot)
+        self.version = snapshot_version
+        return chess5
+
+    def release_snapshots(self):
+        """Detaches from the blocks of earlier snapshots that no loaded multiverse uses anymore"""
+        in_use = []
+        for snapshot in self.snapshots:
+            try:
+                snapshot.close()
+            except BufferError: # Boards of a multiverse loaded from it are still alive
+                in_use.append(snapshot)
+        self.snapshots = in_use
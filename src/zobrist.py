@@ -0,0 +1,123 @@
+import numpy as np
+
+mask_64 = (1 << 64) - 1
+zobrist_seed = 0x5D5DC4E55 # Fixed, so that keys are the same in every process
+num_piece_values = 64 # piece values (including move markers) are below this
+
+
+def splitmix64(x):
+    """
+    SplitMix64 mixing function, maps a 64-bit integer to a well-scrambled 64-bit integer
+    """
+    x = (x + 0x9E3779B97F4A7C15) & mask_64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & mask_64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & mask_64
+    return x ^ (x >> 31)
+
+
+tm_keys = {} # (time, multiverse, seed) -> key, see tm_key
+
+def tm_key(time, mult, seed=zobrist_seed):
+    """
+    Returns the key of a time-multiverse location
+    """
+    key = tm_keys.get((time, mult, seed))
+    if key is None:
+        key = splitmix64(seed ^ ((time & 0xFFFFFFFF) << 32) ^ (mult & 0xFFFFFFFF) ^ mask_64)
+        tm_keys[(time, mult, seed)] = key
+    return key
+
+
+def position_key(board_key, time, mult):
+    """
+    Combines the key of a board with its time-multiverse location.
+    Keys of all boards of a multiverse are XOR-ed together with this.
+
+    Args:
+        board_key (int): Zobrist key of a 2D chessboard
+        time (int): time coordinate of the chessboard
+        mult (int): multiverse coordinate of the chessboard
+
+    Returns:
+        int: 64-bit key
+    """
+    return splitmix64(board_key ^ tm_key(time, mult))
+
+
+class ZobristKeys:
+    """
+    Random 64-bit keys for every (piece value, square) pair of a single chessboard size.
+    Empty squares have zero keys, so an empty board has a key of 0.
+    """
+    def __init__(self, chessboard_size=8, seed=zobrist_seed):
+        """
+        Generates the keys
+
+        Args:
+            chessboard_size (int): size of the chessboards. Defaults to 8.
+            seed (int): seed of the key stream. Defaults to zobrist_seed.
+        """
+        self.chessboard_size = chessboard_size
+        self.seed = seed
+        num_squares = chessboard_size * chessboard_size
+
+        state = seed ^ (chessboard_size << 48)
+        self.square_keys = [[0] * num_squares] # value -> square index -> key
+        for value in range(1, num_piece_values):
+            value_keys = []
+            for square in range(num_squares):
+                state = (state + 1) & mask_64
+                value_keys.append(splitmix64(state))
+            self.square_keys.append(value_keys)
+        # Same keys as an array, to hash whole matrices at once
+        self.key_array = np.array(self.square_keys, dtype=np.uint64)
+        self.key_array.flags.writeable = False
+
+    def __deepcopy__(self, memo):
+        """Keys never change, so copies of boards keep sharing them"""
+        return self
+
+    def __reduce__(self):
+        """Only the parameters are pickled, keys are regenerated on load"""
+        return (get_zobrist_keys, (self.chessboard_size, self.seed))
+
+    def board_key(self, matrix):
+        """
+        Computes the key of a chessboard matrix from scratch
+
+        Args:
+            matrix (np.array): (n, n) matrix of piece values
+
+        Returns:
+            int: 64-bit key
+        """
+        values = np.asarray(matrix).astype(np.intp).ravel()
+        squares = np.arange(len(values))
+        return int(np.bitwise_xor.reduce(self.key_array[values, squares]))
+
+    def board_keys(self, boards):
+        """
+        Computes the keys of many chessboards at once
+
+        Args:
+            boards (np.array): (num_boards, n, n) array of piece values
+
+        Returns:
+            np.array: uint64 key of every board
+        """
+        values = np.asarray(boards).astype(np.intp).reshape(len(boards), -1)
+        squares = np.arange(values.shape[1])
+        return np.bitwise_xor.reduce(self.key_array[values, squares], axis=1)
+
+
+zobrist_keys = {} # (chessboard size, seed) -> ZobristKeys
+
+def get_zobrist_keys(chessboard_size=8, seed=zobrist_seed):
+    """
+    Returns Zobrist keys for a given chessboard size, generating them once
+    """
+    keys = zobrist_keys.get((chessboard_size, seed))
+    if keys is None:
+        keys = ZobristKeys(chessboard_size, seed)
+        zobrist_keys[(chessboard_size, seed)] = keys
+    return keys